@@ -1,9 +1,8 @@
 import typer
-import requests
 from utils import load_token
+from transport import client
 
 app = typer.Typer()
-SERVER = "http://localhost:8000"
 
 def get_auth_headers():
     """
@@ -29,7 +28,7 @@ def list_users():
 
     # Get the authentication headers and make the request
     headers = get_auth_headers()
-    response = requests.get(f"{SERVER}/admin/users", headers=headers)
+    response = client.get("/admin/users", headers=headers)
 
     if response.ok:
         # Parse the JSON response and display the user information
@@ -66,7 +65,7 @@ def delete_user(user_id: int):
     
     # Get the authentication headers and make the request
     headers = get_auth_headers()
-    response = requests.delete(f"{SERVER}/admin/users/{user_id}", headers=headers)
+    response = client.delete(f"/admin/users/{user_id}", headers=headers)
 
     if response.ok: # User deleted successfully
         typer.echo(f"User with ID {user_id} deleted successfully.")
@@ -1,9 +1,8 @@
 import typer
-import requests
 from utils import save_token, remove_token
+from transport import client
 
 app = typer.Typer()
-SERVER = "http://localhost:8000"
 
 @app.command()
 def register(
@@ -30,7 +29,7 @@ def register(
 
     # Make a request to the server to register the user
     payload = {"username": username, "email": email, "password": password, "role": role}
-    response = requests.post(f"{SERVER}/auth/register", json=payload)
+    response = client.post("/auth/register", json=payload)
 
     if response.ok: # User registered successfully
         typer.echo("User registered successfully.")
@@ -52,7 +51,7 @@ def login(username: str, password: str):
 
     # Make a request to the server to login the user
     payload = {"username": username, "password": password}
-    response = requests.post(f"{SERVER}/auth/login", data=payload)
+    response = client.post("/auth/login", data=payload)
 
     if response.ok: # User logged in successfully, save token to file
         token = response.json().get("access_token")
@@ -1,16 +1,37 @@
 import typer
 import requests
+import hashlib
 import os
 import threading
 import sys
+import glob
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import List
 from datetime import datetime
-from utils import load_token
+from utils import load_token, load_upload_state, save_upload_state
+from transport import client
+from upload_streams import FileSliceReader, MultipartFileEncoder
+from chunking import CHUNKING, chunk_file
 from tqdm import tqdm
 
 app = typer.Typer()
-SERVER = "http://localhost:8000"
 TOKEN_FILE = ".token"
 
+# Files larger than one chunk are uploaded through a resumable upload session
+CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_WORKERS = 4
+
+# Number of files uploaded in parallel when uploading several files
+UPLOAD_FILE_WORKERS = 8
+
+# Changed files smaller than this are sent whole instead of as a delta
+DELTA_MIN_SIZE = 8 * 1024 * 1024
+
+# Downloads smaller than this are not worth splitting into parallel ranges
+DOWNLOAD_CHUNK_SIZE = 8192
+PARALLEL_MIN_SIZE = 8 * 1024 * 1024
+
 def get_auth_headers():
     """
     Function to get the authentication headers for API requests.
@@ -25,13 +46,243 @@ def get_auth_headers():
         raise typer.Exit()
     return {"Authorization": f"Bearer {token}"}
 
+def get_upload_session(file_path: str, final_name: str, file_size: int, headers: dict, checksum: str = None):
+    """
+    Function to get the upload session for a file
+
+    If an earlier upload of the same, unmodified file was interrupted, its session
+    is looked up from the server so the upload can continue where it left off.
+    Otherwise a new session is created and remembered in the local upload state.
+    """
+
+    state = load_upload_state()
+    key = os.path.abspath(file_path)
+    mtime = os.path.getmtime(file_path)
+
+    # Try to resume an earlier session for this file
+    saved = state.get(key)
+    if saved and saved.get("name") == final_name and saved.get("size") == file_size and saved.get("mtime") == mtime:
+        response = client.get(f"/files/sessions/{saved['session_id']}", headers=headers)
+        if response.ok:
+            session = response.json()
+            tqdm.write(f"Resuming upload of '{final_name}' ({len(session['received'])}/{session['total_chunks']} chunks already uploaded).")
+            return session, response
+
+    # Otherwise start a new session
+    payload = {"file_name": final_name, "size": file_size, "chunk_size": CHUNK_SIZE, "checksum": checksum}
+    response = client.post("/files/sessions", json=payload, headers=headers)
+    if not response.ok:
+        return None, response
+
+    session = response.json()
+    state[key] = {"session_id": session["session_id"], "name": final_name, "size": file_size, "mtime": mtime}
+    save_upload_state(state)
+    return session, response
+
+def upload_file_chunked(file_path: str, final_name: str, file_size: int, headers: dict, workers: int = UPLOAD_WORKERS, checksum: str = None, progress: tqdm = None):
+    """
+    Function to upload a large file in chunks through a resumable upload session
+
+    Missing chunks are sent in parallel, each read from disk only when it is sent.
+    If the upload is interrupted, running the same upload again resumes it and only
+    sends the chunks the server does not have yet. Progress is shown on its own bar
+    unless a shared progress bar is given.
+    """
+
+    session, response = get_upload_session(file_path, final_name, file_size, headers, checksum)
+    if session is None:
+        return response
+
+    session_id = session["session_id"]
+    chunk_size = session["chunk_size"]
+    received = set(session["received"])
+    missing = [i for i in range(session["total_chunks"]) if i not in received]
+    already_uploaded = sum(min(chunk_size, file_size - i * chunk_size) for i in received)
+
+    def send_chunk(index: int):
+        # Stream only this chunk from the file, counting bytes as they are sent
+        offset = index * chunk_size
+        length = min(chunk_size, file_size - offset)
+        with FileSliceReader(file_path, offset, length, callback=progress.update) as body:
+            chunk_response = client.put(
+                f"/files/sessions/{session_id}/chunks/{index}", data=body, headers=headers
+            )
+        chunk_response.raise_for_status()
+
+    # Send the missing chunks in parallel and show a progress bar
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool, (
+            nullcontext(progress) if progress is not None else tqdm(
+                total=file_size, unit="B", unit_scale=True, desc=f"Uploading {final_name}",
+            )
+        ) as progress:
+            progress.update(already_uploaded)
+            futures = [pool.submit(send_chunk, index) for index in missing]
+            for future in as_completed(futures):
+                future.result()
+    except requests.RequestException as e:
+        tqdm.write(f"Upload of '{final_name}' interrupted: {e}")
+        tqdm.write("Run the same upload again to resume it.")
+        return None
+
+    # All chunks are on the server, assemble the file
+    response = client.post(f"/files/sessions/{session_id}/commit", headers=headers)
+    if response.ok:
+        state = load_upload_state()
+        state.pop(os.path.abspath(file_path), None)
+        save_upload_state(state)
+    return response
+
+def get_file_blocks(final_name: str, headers: dict):
+    """
+    Function to get the content-defined blocks of a file on the server
+
+    Returns:
+        dict: The server's block list, or None if the file does not exist or the
+        server splits files differently than this client
+    """
+
+    response = client.get("/files/blocks", params={"file_name": final_name}, headers=headers)
+    if not response.ok:
+        return None
+    remote = response.json()
+    if remote.get("chunking") != CHUNKING:
+        return None
+    return remote
+
+def upload_file_delta(file_path: str, final_name: str, file_size: int, headers: dict, checksum: str, workers: int = UPLOAD_WORKERS, progress: tqdm = None):
+    """
+    Function to upload a new version of a file by sending only the changed blocks
+
+    Both sides split the file into content-defined blocks. The server lists the
+    blocks of the new version it does not already have in the previous one, only
+    those are sent, and the server assembles the new version.
+
+    Returns:
+        requests.Response: The final response, or None if there is no previous
+        version on the server to build on
+    """
+
+    remote = get_file_blocks(final_name, headers)
+    if remote is None:
+        return None
+
+    local_blocks = chunk_file(file_path)
+    payload = {
+        "file_name": final_name,
+        "base_checksum": remote["checksum"],
+        "size": file_size,
+        "checksum": checksum,
+        "chunking": CHUNKING,
+        "blocks": [{"hash": block_hash, "size": size} for _, size, block_hash in local_blocks],
+    }
+    response = client.post("/files/deltas", json=payload, headers=headers)
+    if not response.ok:
+        return None
+
+    delta = response.json()
+    session_id = delta["session_id"]
+    offsets = {block_hash: (start, size) for start, size, block_hash in local_blocks}
+    missing = delta["missing"]
+    missing_size = sum(offsets[block_hash][1] for block_hash in missing)
+
+    def send_block(block_hash: str):
+        # Stream only this block from the file, counting bytes as they are sent
+        start, size = offsets[block_hash]
+        with FileSliceReader(file_path, start, size, callback=progress.update) as body:
+            block_response = client.put(
+                f"/files/deltas/{session_id}/blocks/{block_hash}", data=body, headers=headers
+            )
+        block_response.raise_for_status()
+
+    # Send the changed blocks in parallel and show a progress bar; the blocks
+    # the server already has count as done
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool, (
+            nullcontext(progress) if progress is not None else tqdm(
+                total=file_size, unit="B", unit_scale=True, desc=f"Uploading {final_name} (delta)",
+            )
+        ) as progress:
+            progress.update(file_size - missing_size)
+            futures = [pool.submit(send_block, block_hash) for block_hash in missing]
+            for future in as_completed(futures):
+                future.result()
+    except requests.RequestException as e:
+        client.delete(f"/files/deltas/{session_id}", headers=headers)
+        tqdm.write(f"Upload of '{final_name}' interrupted: {e}")
+        return None
+
+    response = client.post(f"/files/deltas/{session_id}/commit", headers=headers)
+    if response.ok:
+        tqdm.write(f"Sent {missing_size} of {file_size} bytes of '{final_name}' as a delta.")
+    return response
+
+def send_file(file_path: str, final_name: str, file_size: int, headers: dict, checksum: str = None, progress: tqdm = None):
+    """
+    Function to send one file to the server
+
+    Files larger than CHUNK_SIZE are first checked against the content the server
+    already stores. If it is new, only the changed blocks are sent when an earlier
+    version of the file is on the server, otherwise the file is uploaded in chunks
+    through a resumable upload session. Smaller files are streamed from disk in a single multipart/form-data
+    request, so memory use does not grow with the file size. Progress is shown on its own bar unless a shared
+    progress bar is given.
+
+    Returns:
+        tuple: The final response (None if a chunked upload was interrupted), and
+        whether the file was linked to content already on the server
+    """
+
+    if file_size > CHUNK_SIZE:
+        # Ask the server whether it already stores this content,
+        # in which case no bytes need to be sent at all
+        checksum = checksum or file_checksum(file_path)
+        response = client.get(f"/files/blobs/{checksum}", headers=headers)
+        if response.ok:
+            payload = {"file_name": final_name, "hash": checksum}
+            response = client.post("/files/link", json=payload, headers=headers)
+            if response.ok and progress is not None:
+                progress.update(file_size)
+            return response, True
+
+        # Send only the changed blocks if an earlier version of the file is on the server
+        if file_size >= DELTA_MIN_SIZE:
+            response = upload_file_delta(file_path, final_name, file_size, headers, checksum, progress=progress)
+            if response is not None:
+                return response, False
+        return upload_file_chunked(file_path, final_name, file_size, headers, checksum=checksum, progress=progress), False
+
+    # Stream the file from disk as a multipart/form-data request
+    # Use tqdm to show a progress bar as the bytes are sent
+    with (
+        nullcontext(progress) if progress is not None else tqdm(
+            total=file_size, unit="B", unit_scale=True, desc=f"Uploading {final_name}",
+        )
+    ) as progress, MultipartFileEncoder("file", file_path, final_name, callback=progress.update) as body:
+        upload_headers = {**headers, "Content-Type": body.content_type}
+        return client.post("/files/upload", data=body, headers=upload_headers), False
+
+def response_error(response) -> str:
+    """
+    Function to describe a failed response in one line
+    """
+
+    if response.status_code == 401: # User not logged in
+        return "Authentication failed. Please log in again."
+    try:
+        error_message = response.json().get("detail", "Unknown error")
+    except ValueError:
+        error_message = response.text
+    if response.status_code == 500 and "401" in str(error_message): # user not logged in
+        return "Authentication failed. Please log in again."
+    return str(error_message)
+
 def upload_file(file_path: str, save_name: str):
     """ 
     Function to upload a file to the server    
 
-    This function reads the file in chunks and uploads it to the server.
     It uses the tqdm library to show a progress bar during the upload process.
-    The file is uploaded as a multipart/form-data request.
+    See send_file for how the file is sent.
     """
     
     # Check if the file exists
@@ -45,60 +296,426 @@ def upload_file(file_path: str, save_name: str):
     final_name = save_name if save_name else os.path.basename(file_path)
     file_size = os.path.getsize(file_path)
 
-    # Read the file in chunks and upload it to the server
-    # Use tqdm to show a progress bar during the upload process
-    with open(file_path, "rb") as f, tqdm(
-        total=file_size, unit="B", unit_scale=True, desc=f"Uploading {final_name}",
-    ) as progress:
-        chunks = []
-        for chunk in iter(lambda: f.read(8192), b""):
-            progress.update(len(chunk))
-            chunks.append(chunk)
-
-        # Join the chunks into a single byte string
-        # and send the request to the server
-        file_content = b"".join(chunks)
-        files = {"file": (final_name, file_content, "application/octet-stream")}
-        response = requests.post(f"{SERVER}/files/upload", files=files, headers=headers)
+    response, _ = send_file(file_path, final_name, file_size, headers)
+    if response is None:
+        return
 
     # Check the response from the server
     if response.ok:
         typer.echo(f"File uploaded successfully as '{final_name}'.")
-    elif response.status_code == 500: # Server error
-        error_message = response.json().get("detail", "Unknown error")
-        if "401" in error_message:  # user not logged in
-            typer.echo("Authentication failed. Please log in again.")
-        else: # Other errors
-            typer.echo(f"Failed to upload file: {error_message}")
     else:
-        typer.echo(f"Failed to upload file: {response.text}")
+        typer.echo(f"Failed to upload file: {response_error(response)}")
+
+def collect_upload_files(paths: List[str], prefix: str = None):
+    """
+    Function to expand the paths given to upload into the files to upload
+
+    Directories are uploaded recursively and glob patterns (including ** for any
+    number of directories) are expanded. Files inside a directory keep their path
+    relative to the directory's parent, so uploading `build` creates files named
+    `build/...`; files matched by a pattern keep their path relative to the part of
+    the pattern before the first wildcard. The optional prefix is prepended to
+    every name.
+
+    Returns:
+        list: (local path, name in the cloud) pairs, and the paths that matched nothing
+    """
+
+    uploads = {}
+    missing = []
+
+    def add_tree(path: str, base: str):
+        if os.path.isfile(path):
+            uploads.setdefault(path, os.path.relpath(path, base))
+            return
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file_name in sorted(files):
+                local_path = os.path.join(root, file_name)
+                uploads.setdefault(local_path, os.path.relpath(local_path, base))
+
+    for path in paths:
+        if os.path.exists(path):
+            # A file is named by its base name, a directory keeps its own name
+            add_tree(path, os.path.dirname(os.path.normpath(path)) or ".")
+        elif glob.has_magic(path):
+            matches = glob.glob(path, recursive=True)
+            if not matches:
+                missing.append(path)
+            # Names are relative to the directory the pattern starts from
+            static_parts = []
+            for part in os.path.normpath(path).split(os.sep):
+                if glob.has_magic(part):
+                    break
+                static_parts.append(part)
+            base = os.sep.join(static_parts) or "."
+            for match in sorted(matches):
+                add_tree(match, base)
+        else:
+            missing.append(path)
+
+    files = []
+    for local_path, name in uploads.items():
+        name = name.replace(os.sep, "/")
+        if prefix:
+            name = f"{prefix.rstrip('/')}/{name}"
+        files.append((local_path, name))
+    return files, missing
+
+def remote_files(headers: dict, name_prefix: str = None):
+    """
+    Function to fetch all of the user's files on the server, page by page
+
+    Returns:
+        dict: File information from the listing by file name
+    """
+
+    files = {}
+    params = {"limit": 1000}
+    if name_prefix:
+        params["name_prefix"] = name_prefix
+    while True:
+        response = client.get("/files/list", params=params, headers=headers)
+        if not response.ok:
+            raise requests.HTTPError(response_error(response), response=response)
+        for file in response.json():
+            files[file["name"]] = file
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return files
+        params["cursor"] = cursor
+
+def send_error(response):
+    """
+    Function to describe why a file sent with send_file was not stored
+
+    Returns:
+        str: The reason, or None if the server stored the file
+    """
+
+    if response is None:
+        return "Upload interrupted, run the same upload again to resume it."
+    if not response.ok:
+        return response_error(response)
+    return None
+
+def run_transfers(items, transfer, total: int, desc: str, workers: int):
+    """
+    Function to transfer many files by a bounded pool of workers
+
+    `transfer(item, progress)` is called for every item and advances the one
+    progress bar shared by all of them, whose total is `total` bytes.
+
+    Returns:
+        dict: The result of every transfer by item
+    """
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool, tqdm(
+        total=total, unit="B", unit_scale=True, desc=desc, disable=not items,
+    ) as progress:
+        futures = {pool.submit(transfer, item, progress): item for item in items}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+def summary_line(result: str, size: int, name: str, error: str = None, width: int = 10) -> str:
+    """
+    Function to format the line of one file in a transfer summary
+    """
+
+    line = f"{result:<{width}} | {format_size(size):<10} | {name}"
+    return f"{line} ({error})" if error else line
+
+def upload_files(paths: List[str], prefix: str = None, workers: int = UPLOAD_FILE_WORKERS):
+    """
+    Function to upload many files at once
+
+    Files are uploaded by a bounded pool of workers with one progress bar for the
+    total number of bytes. Files whose name and content already match a file on the
+    server are skipped, and files whose content the server already stores are
+    linked without sending any bytes. A summary line is printed for every file.
+    """
+
+    files, missing = collect_upload_files(paths, prefix)
+    for path in missing:
+        typer.echo(f"File {path} does not exist.")
+    if not files:
+        typer.echo("No files to upload.")
+        return
+
+    headers = get_auth_headers()
+    try:
+        remote = {name: file.get("checksum") for name, file in remote_files(headers).items()}
+    except requests.RequestException as e:
+        typer.echo(f"Failed to list files on the server: {e}")
+        return
+
+    sizes = {local_path: os.path.getsize(local_path) for local_path, _ in files}
+
+    def upload_one(item, progress: tqdm):
+        local_path, name = item
+        file_size = sizes[local_path]
+        try:
+            checksum = file_checksum(local_path)
+            if remote.get(name) == checksum:
+                progress.update(file_size)
+                return "unchanged", None
+            response, linked = send_file(local_path, name, file_size, headers, checksum=checksum, progress=progress)
+            error = send_error(response)
+            if error:
+                return "failed", error
+            return ("linked" if linked else "uploaded"), None
+        except (requests.RequestException, OSError) as e:
+            return "failed", str(e)
+
+    results = run_transfers(files, upload_one, sum(sizes.values()), f"Uploading {len(files)} files", workers)
+
+    # Print a summary of what happened to every file
+    typer.echo("Upload summary:")
+    typer.echo("-" * 80)
+    typer.echo(f"{'Result':<10} | {'Size':<10} | {'Name'}")
+    typer.echo("-" * 80)
+    counts = {}
+    for local_path, name in files:
+        result, error = results[(local_path, name)]
+        counts[result] = counts.get(result, 0) + 1
+        typer.echo(summary_line(result, sizes[local_path], name, error))
+    typer.echo("-" * 80)
+    typer.echo(", ".join(f"{counts.get(result, 0)} {result}" for result in ("uploaded", "linked", "unchanged", "failed")))
 
 @app.command()
 def upload(
-    file_path: str, 
+    file_paths: List[str]=typer.Argument(
+        ...,
+        help="Files, directories or glob patterns to upload. Directories are uploaded recursively."
+        ),
     save_name: str=typer.Option(
         None, 
         "--save-name", 
         "-s", 
-        help="Name to save the file as in the cloud. Default is the original file name."
+        help="Name to save the file as in the cloud. Default is the original file name. When uploading several files, the folder to save them in."
+        ),
+    workers: int=typer.Option(
+        UPLOAD_FILE_WORKERS,
+        "--workers",
+        "-w",
+        help="Number of files to upload in parallel when uploading several files."
         )
     ):
     """
-    Upload a file to cloud storage
+    Upload files to cloud storage
+
+    A single file is uploaded with its own progress bar. Several files, directories
+    and glob patterns (quote them to use ** for subdirectories) are uploaded in
+    parallel, skipping files that are already on the server, and a summary is shown
+    at the end.
 
     Threading is used to allow the user to continue using the CLI while the file is uploading.
     """
 
-    # start a new thread to upload the file
-    thread = threading.Thread(target=upload_file, args=(file_path, save_name))
-    thread.start()
+    if len(file_paths) == 1 and os.path.isfile(file_paths[0]):
+        # start a new thread to upload the file
+        # The thread is joined so that the chunk upload workers it starts are not
+        # cut off by interpreter shutdown when the command returns
+        thread = threading.Thread(target=upload_file, args=(file_paths[0], save_name))
+        thread.start()
+        thread.join()
+    else:
+        upload_files(file_paths, save_name, workers)
     
-def download_file(file_name: str, save_path: str):
+def file_checksum(file_path: str):
+    """
+    Function to compute the SHA-256 checksum of a local file
+
+    The server uses the SHA-256 checksum of a file as its ETag, so this lets the
+    client ask the server whether its local copy is still up to date.
+    """
+
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def receive_file_delta(file_name: str, local_path: str, dest_path: str, headers: dict, progress: tqdm = None):
+    """
+    Function to download a new version of a file by fetching only the changed blocks
+
+    The local copy and the file on the server are split into content-defined blocks.
+    Blocks the local copy already has are copied from it, and runs of missing blocks
+    are fetched with Range requests in parallel. The result is checked against the
+    checksum of the file on the server before it replaces the destination.
+
+    Returns:
+        requests.Response: The response listing the server's blocks, or None if the
+        file could not be downloaded as a delta
+    """
+
+    response = client.get("/files/blocks", params={"file_name": file_name}, headers=headers)
+    if not response.ok:
+        return response
+    remote = response.json()
+    if remote.get("chunking") != CHUNKING:
+        return None
+
+    local_offsets = {block_hash: start for start, _, block_hash in chunk_file(local_path)}
+
+    # Group consecutive blocks the local copy does not have into ranges
+    ranges = []
+    for block in remote["blocks"]:
+        if block["hash"] in local_offsets:
+            continue
+        end = block["start"] + block["size"]
+        if ranges and ranges[-1][1] == block["start"]:
+            ranges[-1][1] = end
+        else:
+            ranges.append([block["start"], end])
+    missing_size = sum(end - start for start, end in ranges)
+
+    part_path = f"{dest_path}.part"
+    etag = f'"{remote["checksum"]}"'
+
+    def fetch_range(start: int, end: int):
+        range_headers = {**headers, "Range": f"bytes={start}-{end - 1}", "If-Range": etag}
+        range_response = client.get("/files/download", params={"file_name": file_name}, headers=range_headers, stream=True)
+        if range_response.status_code != 206:
+            raise requests.RequestException(f"Expected a partial response, got {range_response.status_code}")
+        with open(part_path, "r+b") as f:
+            f.seek(start)
+            for chunk in range_response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                progress.update(len(chunk))
+
+    with (
+        nullcontext(progress) if progress is not None else tqdm(
+            total=remote["size"], unit="B", unit_scale=True, desc=f"Downloading {file_name} (delta)",
+        )
+    ) as progress:
+        # Copy the blocks the local copy already has into place
+        with open(part_path, "wb") as out, open(local_path, "rb") as local:
+            out.truncate(remote["size"])
+            for block in remote["blocks"]:
+                start = local_offsets.get(block["hash"])
+                if start is not None:
+                    local.seek(start)
+                    out.seek(block["start"])
+                    out.write(local.read(block["size"]))
+        progress.update(remote["size"] - missing_size)
+
+        # Fetch the rest from the server
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+            futures = [pool.submit(fetch_range, start, end) for start, end in ranges]
+            for future in as_completed(futures):
+                future.result()
+
+    if file_checksum(part_path) != remote["checksum"]:
+        os.remove(part_path)
+        return None
+    os.replace(part_path, dest_path)
+    tqdm.write(f"Received {missing_size} of {remote['size']} bytes of '{file_name}' as a delta.")
+    return response
+
+def write_response(response, f, progress: tqdm, count_wire_bytes: bool = True):
+    """
+    Function to write the body of a streamed download to a file
+
+    Compressed responses (Content-Encoding) are decompressed as they are written.
+    With count_wire_bytes the progress bar advances by the bytes received, which
+    is what Content-Length counts, otherwise by the bytes written.
+    """
+
+    received = 0
+    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+        f.write(chunk)
+        if count_wire_bytes:
+            position = response.raw.tell()
+            progress.update(position - received)
+            received = position
+        else:
+            progress.update(len(chunk))
+
+def receive_file(file_name: str, dest_path: str, headers: dict, progress: tqdm = None):
+    """
+    Function to download a file from the server to the given path
+
+    The file is written to a `.part` file next to the destination and moved into
+    place once complete, so an interrupted download never leaves a truncated file
+    behind. If a large file already exists at the destination, only the blocks that
+    changed are fetched. Progress is shown on its own bar unless a shared progress
+    bar is given.
+
+    Returns:
+        requests.Response: The response from the server
+    """
+
+    if os.path.exists(dest_path) and os.path.getsize(dest_path) >= DELTA_MIN_SIZE:
+        # Fetch only the blocks that differ from the existing copy
+        response = receive_file_delta(file_name, dest_path, dest_path, headers, progress)
+        if response is not None:
+            return response
+
+    response = client.get("/files/download", params={"file_name": file_name}, headers=headers, stream=True)
+    if not response.ok:
+        return response
+
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    part_path = f"{dest_path}.part"
+    # A shared progress bar counts file sizes, our own one the bytes on the wire
+    count_wire_bytes = progress is None
+    with open(part_path, "wb") as f, (
+        nullcontext(progress) if progress is not None else tqdm(
+            total=int(response.headers.get("Content-Length", 0)), unit="B", unit_scale=True, desc=f"Downloading {file_name}",
+        )
+    ) as progress:
+        write_response(response, f, progress, count_wire_bytes)
+    os.replace(part_path, dest_path)
+    return response
+
+def download_ranges(url: str, params: dict, headers: dict, part_path: str, file_size: int, etag: str, parts: int, file_name: str):
+    """
+    Function to download one file as several byte ranges in parallel
+
+    The local file is preallocated and every range is written at its own offset.
+    If-Range makes sure all ranges come from the same version of the file.
+    """
+
+    # Preallocate the file and split it into ranges
+    with open(part_path, "wb") as f:
+        f.truncate(file_size)
+    range_size = -(-file_size // parts)
+    ranges = [(start, min(start + range_size, file_size) - 1) for start in range(0, file_size, range_size)]
+
+    def fetch_range(start: int, end: int):
+        range_headers = {**headers, "Range": f"bytes={start}-{end}", "If-Range": etag}
+        response = client.get(url, params=params, headers=range_headers, stream=True)
+        if response.status_code != 206:
+            raise requests.RequestException(f"Expected a partial response, got {response.status_code}")
+        with open(part_path, "r+b") as f:
+            f.seek(start)
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                progress.update(len(chunk))
+
+    with ThreadPoolExecutor(max_workers=parts) as pool, tqdm(
+        total=file_size, unit="B", unit_scale=True, desc=f"Downloading {file_name}",
+    ) as progress:
+        futures = [pool.submit(fetch_range, start, end) for start, end in ranges]
+        for future in as_completed(futures):
+            future.result()
+
+def download_file(file_name: str, save_path: str, resume: bool = False, parallel: int = 1):
     """
     Function to download a file from the server
 
     This function retrieves the file from the server and saves it to the specified path.
     It uses the tqdm library to show a progress bar during the download process.
+
+    The file is first written to a `.part` file next to the destination. With resume,
+    an interrupted download continues from the end of the `.part` file as long as the
+    file has not changed on the server. With parallel > 1, large files are fetched as
+    several byte ranges at once. If the destination already exists and matches the
+    file on the server, nothing is downloaded.
     """
 
     # Check if the save path exists
@@ -107,31 +724,100 @@ def download_file(file_name: str, save_path: str):
         raise typer.Exit()
 
     # Construct the headers for the request
-    # and send the request to the server
     headers = get_auth_headers()
+    url = "/files/download"
     params = {"file_name": file_name}
-    response = requests.get(f"{SERVER}/files/download", params=params, headers=headers, stream=True)
-
-    if response.ok: # File downloaded successfully
-        # Save the file to the specified path
-        file_save_path = os.path.join(save_path, file_name)
-        total_size = int(response.headers.get("Content-Length", 0))
-        # Use tqdm to show a progress bar during the download process
-        with open(file_save_path, "wb") as f, tqdm(
-            total=total_size, unit="B", unit_scale=True, desc=f"Downloading {file_name}",
-        ) as progress:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-                progress.update(len(chunk))
-        typer.echo(f"File downloaded successfully to {file_save_path}.")
-    elif response.status_code == 500: # Server error
-        error_message = response.json().get("detail", "Unknown error")
-        if "401" in error_message: # user not logged in
+    file_save_path = os.path.join(save_path, file_name)
+    part_path = f"{file_save_path}.part"
+    etag_path = f"{part_path}.etag"
+
+    request_headers = dict(headers)
+    offset = 0
+    if resume and os.path.exists(part_path) and os.path.exists(etag_path):
+        # Continue the earlier download if the file has not changed since
+        offset = os.path.getsize(part_path)
+        with open(etag_path, "r") as f:
+            request_headers["If-Range"] = f.read().strip()
+        request_headers["Range"] = f"bytes={offset}-"
+    elif os.path.exists(file_save_path):
+        # Only download if the local copy differs from the one on the server
+        request_headers["If-None-Match"] = f'"{file_checksum(file_save_path)}"'
+
+    try:
+        if parallel > 1 and offset == 0:
+            # Ask for the size and version of the file first, uncompressed so
+            # that Content-Length is the size of the file
+            response = client.head(url, params=params, headers={**request_headers, "Accept-Encoding": "identity"})
+            etag = response.headers.get("ETag")
+            file_size = int(response.headers.get("Content-Length", 0))
+            if response.status_code == 304:
+                typer.echo(f"File {file_save_path} is already up to date.")
+                return
+            if response.status_code == 200 and etag and file_size >= PARALLEL_MIN_SIZE:
+                download_ranges(url, params, headers, part_path, file_size, etag, parallel, file_name)
+                os.replace(part_path, file_save_path)
+                typer.echo(f"File downloaded successfully to {file_save_path}.")
+                return
+
+        # Send the request to the server
+        response = client.get(url, params=params, headers=request_headers, stream=True)
+
+        if response.status_code == 200 and "If-None-Match" in request_headers and os.path.getsize(file_save_path) >= DELTA_MIN_SIZE:
+            # The local copy is outdated, fetch only the blocks that changed
+            response.close()
+            delta_response = receive_file_delta(file_name, file_save_path, file_save_path, headers)
+            if delta_response is not None and delta_response.ok:
+                typer.echo(f"File downloaded successfully to {file_save_path}.")
+                return
+            response = client.get(url, params=params, headers=request_headers, stream=True)
+
+        if response.status_code == 304: # Local copy is up to date
+            typer.echo(f"File {file_save_path} is already up to date.")
+        elif response.status_code == 416 and offset: # Earlier download was already complete
+            os.replace(part_path, file_save_path)
+            os.remove(etag_path)
+            typer.echo(f"File downloaded successfully to {file_save_path}.")
+        elif response.ok: # File downloaded successfully
+            # Append to the partial file if the server resumed the download,
+            # otherwise the file changed and the download starts over
+            resumed = response.status_code == 206
+            if resumed:
+                typer.echo(f"Resuming download of '{file_name}' from {offset} bytes.")
+            else:
+                offset = 0
+            etag = response.headers.get("ETag")
+            coding = response.headers.get("Content-Encoding")
+            if etag and coding and etag.endswith(f'-{coding}"'):
+                # The partial file holds the decoded bytes, whose ETag lacks the coding
+                etag = etag[:-len(coding) - 2] + '"'
+            if etag:
+                with open(etag_path, "w") as f:
+                    f.write(etag)
+
+            # Save the file to the specified path
+            total_size = offset + int(response.headers.get("Content-Length", 0))
+            # Use tqdm to show a progress bar during the download process
+            with open(part_path, "ab" if resumed else "wb") as f, tqdm(
+                total=total_size, initial=offset, unit="B", unit_scale=True, desc=f"Downloading {file_name}",
+            ) as progress:
+                write_response(response, f, progress)
+            os.replace(part_path, file_save_path)
+            if os.path.exists(etag_path):
+                os.remove(etag_path)
+            typer.echo(f"File downloaded successfully to {file_save_path}.")
+        elif response.status_code == 401: # User not logged in
             typer.echo("Authentication failed. Please log in again.")
-        else: # Other errors
-            typer.echo(f"Failed to upload file: {error_message}")
-    else:
-        typer.echo(f"Failed to download file: {response.text}")
+        elif response.status_code == 500: # Server error
+            error_message = response.json().get("detail", "Unknown error")
+            if "401" in error_message: # user not logged in
+                typer.echo("Authentication failed. Please log in again.")
+            else: # Other errors
+                typer.echo(f"Failed to download file: {error_message}")
+        else:
+            typer.echo(f"Failed to download file: {response.text}")
+    except requests.RequestException as e:
+        typer.echo(f"Download interrupted: {e}")
+        typer.echo("Run the download again with --resume to continue it.")
 
 # Download file from the "cloud" storage
 @app.command()
@@ -142,6 +828,18 @@ def download(
         "--save-path", 
         "-p", 
         help="Path to save the downloaded file."
+        ),
+    resume: bool=typer.Option(
+        False,
+        "--resume",
+        "-r",
+        help="Resume an interrupted download of the file."
+        ),
+    parallel: int=typer.Option(
+        1,
+        "--parallel",
+        "-n",
+        help="Number of byte ranges to download in parallel for large files."
         )
     ):
     
@@ -152,8 +850,11 @@ def download(
     """
 
     # start a new thread to download the file
-    thread = threading.Thread(target=download_file, args=(file_name, save_path))
+    # The thread is joined so that parallel range downloads are not cut off
+    # by interpreter shutdown when the command returns
+    thread = threading.Thread(target=download_file, args=(file_name, save_path, resume, parallel))
     thread.start()
+    thread.join()
 
 @app.command()
 def delete(
@@ -181,13 +882,15 @@ def delete(
     # Otherwise, delete the file as a regular user
     if admin:
         # Admin delete
-        response = requests.delete(f"{SERVER}/admin/files/{file_id}", headers=headers)
+        response = client.delete(f"/admin/files/{file_id}", headers=headers)
     else:
         # User delete
-        response = requests.delete(f"{SERVER}/files/{file_id}", headers=headers)
+        response = client.delete(f"/files/{file_id}", headers=headers)
 
     if response.ok:
         typer.echo(f"File with file_id {file_id} deleted successfully.")
+    elif response.status_code == 401: # User not logged in
+        typer.echo("Authentication failed. Please log in again.")
     elif response.status_code == 500: # Server error
         error_message = response.json().get("detail", "Unknown error")
         if "401" in error_message: # user not logged in
@@ -201,6 +904,56 @@ def delete(
     else:
         typer.echo(f"Failed to delete file: {response.text}")
 
+def format_size(size: int) -> str:
+    """
+    Function to format a number of bytes for display
+    """
+
+    if size < 1024:
+        return f"{size} B"
+    elif size < 1024 * 1024:
+        return f"{size/1024:.1f} KB"
+    else:
+        return f"{size/(1024*1024):.1f} MB"
+
+def print_files(files, admin: bool, header: bool):
+    """
+    Function to print a page of files as a table
+
+    Admin listings include the owner of each file.
+    """
+
+    if header:
+        typer.echo("Files in cloud storage:")
+        typer.echo("-" * 80)
+        if admin:
+            typer.echo(f"{'ID':<5} | {'Owner':<10} | {'Name':<30} | {'Size':<10} | {'Uploaded'}")
+        else:
+            typer.echo(f"{'ID':<5} | {'Name':<30} | {'Size':<10} | {'Uploaded'}")
+        typer.echo("-" * 80)
+
+    for file in files:
+        file_id = file.get('id', 'N/A')
+        file_owner = file.get('owner_username', 'Unknown')
+        name = file.get('name', 'Unknown')
+        size = file.get('size', 0)
+        timestamp = file.get('timestamp', 'Unknown')
+        
+        # Convert timestamp to datetime object and format it
+        try:
+            timestamp_dt = datetime.fromisoformat(timestamp)
+            timestamp_str = timestamp_dt.strftime("%d.%m.%Y %H:%M:%S")
+        except ValueError:
+            timestamp_str = "Invalid timestamp"
+
+        # Format size
+        size_str = format_size(size)
+        # Display file information
+        if admin:
+            typer.echo(f"{file_id:<5} | {file_owner:<10} | {name:<30} | {size_str:<10} | {timestamp_str}")
+        else:
+            typer.echo(f"{file_id:<5} | {name:<30} | {size_str:<10} | {timestamp_str}")
+
 @app.command()
 def list(
     admin: bool=typer.Option(
@@ -208,6 +961,52 @@ def list(
         "--admin", 
         "-a", 
         help="List all files (admin only)."
+        ),
+    page_size: int=typer.Option(
+        50,
+        "--page-size",
+        "-n",
+        help="Number of files to show per page."
+        ),
+    all_pages: bool=typer.Option(
+        False,
+        "--all",
+        help="Show all pages without asking."
+        ),
+    sort: str=typer.Option(
+        "id",
+        "--sort",
+        help="Sort by id, name, size or timestamp."
+        ),
+    desc: bool=typer.Option(
+        False,
+        "--desc",
+        help="Sort in descending order."
+        ),
+    name: str=typer.Option(
+        None,
+        "--name",
+        help="Only list files whose name starts with this."
+        ),
+    min_size: int=typer.Option(
+        None,
+        "--min-size",
+        help="Only list files of at least this many bytes."
+        ),
+    max_size: int=typer.Option(
+        None,
+        "--max-size",
+        help="Only list files of at most this many bytes."
+        ),
+    since: str=typer.Option(
+        None,
+        "--since",
+        help="Only list files uploaded at or after this time (ISO 8601)."
+        ),
+    until: str=typer.Option(
+        None,
+        "--until",
+        help="Only list files uploaded before this time (ISO 8601)."
         )
     ):
     
@@ -216,6 +1015,8 @@ def list(
 
     Admin can view all files with tag --admin or -a
     User can view only their own files
+
+    Files are shown one page at a time; use --all to show every page.
     """
     # Construct the headers for the request
     headers = get_auth_headers()
@@ -223,84 +1024,42 @@ def list(
     # Check if the user is admin or not
     # If admin is True, list all files as admin
     # Otherwise, list the files as a regular user
-    if admin:
-        # Admin view
-        # Make a request to the server to list all files
-        response = requests.get(f"{SERVER}/admin/files", headers=headers)
-        if response.ok:
-            # Parse the JSON response and display the file information
-            files = response.json()
-            if files:
-                typer.echo("Files in cloud storage:")
-                typer.echo("-" * 80)
-                typer.echo(f"{'ID':<5} | {'Owner':<10} | {'Name':<30} | {'Size':<10} | {'Uploaded'}")
-                typer.echo("-" * 80)
-                for file in files:
-                    file_id = file.get('id', 'N/A')
-                    file_owner = file.get('owner_username', 'Unknown')
-                    name = file.get('name', 'Unknown')
-                    size = file.get('size', 0)
-                    timestamp = file.get('timestamp', 'Unknown')
-                    
-                    # Convert timestamp to datetime object and format it
-                    try:
-                        timestamp_dt = datetime.fromisoformat(timestamp)
-                        timestamp_str = timestamp_dt.strftime("%d.%m.%Y %H:%M:%S")
-                    except ValueError:
-                        timestamp_str = "Invalid timestamp"
-
-                    # Format size
-                    if size < 1024:
-                        size_str = f"{size} B"
-                    elif size < 1024 * 1024:
-                        size_str = f"{size/1024:.1f} KB"
-                    else:
-                        size_str = f"{size/(1024*1024):.1f} MB"
-                    # Display file information
-                    typer.echo(f"{file_id:<5} | {file_owner:<10} | {name:<30} | {size_str:<10} | {timestamp_str}")
-            else:
-                typer.echo("No files found in cloud storage.")
-        elif response.status_code == 401: # User not logged in
-            typer.echo("Authentication failed. Please log in again.")   
-        else:
-            typer.echo(f"Failed to list files: {response.text}")
-    else:
-        # User view
-        # Make a request to the server to list the files
-        response = requests.get(f"{SERVER}/files/list", headers=headers)
-        if response.ok:
-            # Parse the JSON response and display the file information
-            files = response.json()
-            if files:
-                typer.echo("Files in cloud storage:")
-                typer.echo("-" * 80)
-                typer.echo(f"{'ID':<5} | {'Name':<30} | {'Size':<10} | {'Uploaded'}")
-                typer.echo("-" * 80)
-                for file in files:
-                    file_id = file.get('id', 'N/A')
-                    name = file.get('name', 'Unknown')
-                    size = file.get('size', 0)
-                    timestamp = file.get('timestamp', 'Unknown')
-                    
-                    # Convert timestamp to datetime object and format it
-                    try:
-                        timestamp_dt = datetime.fromisoformat(timestamp)
-                        timestamp_str = timestamp_dt.strftime("%d.%m.%Y %H:%M:%S")
-                    except ValueError:
-                        timestamp_str = "Invalid timestamp"
-
-                    # Format size
-                    if size < 1024:
-                        size_str = f"{size} B"
-                    elif size < 1024 * 1024:
-                        size_str = f"{size/1024:.1f} KB"
-                    else:
-                        size_str = f"{size/(1024*1024):.1f} MB"
-                    # Display file information
-                    typer.echo(f"{file_id:<5} | {name:<30} | {size_str:<10} | {timestamp_str}")
-            else:
-                typer.echo("No files found in cloud storage.")
-        elif response.status_code == 401: # User not logged in
+    url = "/admin/files" if admin else "/files/list"
+    params = {
+        "limit": page_size,
+        "sort": sort,
+        "order": "desc" if desc else "asc",
+        "name_prefix": name,
+        "min_size": min_size,
+        "max_size": max_size,
+        "since": since,
+        "until": until,
+    }
+    params = {key: value for key, value in params.items() if value is not None}
+
+    # Fetch and display one page at a time
+    first_page = True
+    while True:
+        response = client.get(url, params=params, headers=headers)
+        if response.status_code == 401: # User not logged in
             typer.echo("Authentication failed. Please log in again.")
-        else:
-            typer.echo(f"Failed to list files: {response.text}")
\ No newline at end of file
+            return
+        if not response.ok:
+            typer.echo(f"Failed to list files: {response.text}")
+            return
+
+        # Parse the JSON response and display the file information
+        files = response.json()
+        if first_page and not files:
+            typer.echo("No files found in cloud storage.")
+            return
+        print_files(files, admin, header=first_page)
+        first_page = False
+
+        # Continue from where this page ended, if there are more files
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return
+        if not all_pages and not typer.confirm("Show more?", default=True):
+            return
+        params["cursor"] = cursor
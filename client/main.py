@@ -3,10 +3,40 @@ import typer
 import auth
 import files
 import admin
+import sync
+from transport import client
 
 # Create a Typer app instance
 app = typer.Typer()
 
+@app.callback()
+def configure(
+    server: str=typer.Option(
+        None,
+        "--server",
+        envvar="CLOUD_SERVER",
+        help="URL of the cloud storage server. Default is http://localhost:8000."
+        ),
+    timeout: float=typer.Option(
+        None,
+        "--timeout",
+        help="Seconds to wait for the server to respond before giving up."
+        ),
+    retries: int=typer.Option(
+        None,
+        "--retries",
+        help="Number of times to retry failed connections and temporary server errors."
+        )
+    ):
+    """
+    Cloud storage client
+
+    Connection settings apply to every command and can also be set with the
+    CLOUD_SERVER, CLOUD_CONNECT_TIMEOUT, CLOUD_READ_TIMEOUT and CLOUD_RETRIES
+    environment variables.
+    """
+    client.configure(server=server, read_timeout=timeout, retries=retries)
+
 # Define the commands for the app
 app.command()(auth.register)
 app.command()(auth.login)
@@ -17,6 +47,8 @@ app.command()(files.download)
 app.command()(files.delete)
 app.command()(files.list)
 
+app.command()(sync.sync)
+
 app.command()(admin.list_users)
 app.command()(admin.delete_user)
 
@@ -4,7 +4,7 @@ from setuptools import setup
 setup(
     name="cloud",
     version="0.1",
-    py_modules=["main", "auth", "files", "admin", "utils"],
+    py_modules=["main", "auth", "files", "admin", "utils", "transport", "upload_streams", "sync", "chunking"],
     install_requires=[
         "typer",
         "requests",
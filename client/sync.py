@@ -0,0 +1,328 @@
+import typer
+import requests
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+from transport import client
+from files import (
+    get_auth_headers,
+    file_checksum,
+    receive_file,
+    remote_files,
+    response_error,
+    run_transfers,
+    send_error,
+    send_file,
+    summary_line,
+    UPLOAD_FILE_WORKERS,
+)
+
+app = typer.Typer()
+
+# Manifest of the last successful sync, kept in the synced directory
+MANIFEST_FILE = ".cloudsync.json"
+MANIFEST_VERSION = 1
+
+DIRECTIONS = ("both", "up", "down")
+
+def load_manifest(local_dir: str, remote_prefix: str):
+    """
+    Function to load the manifest of the last sync of a directory
+
+    The manifest records, for every file that was in sync after the last run, its
+    path, size, modification time, content checksum and id on the server. A
+    manifest written for another remote folder or server is ignored.
+
+    Returns:
+        dict: Manifest entries by path relative to the directory
+    """
+
+    path = os.path.join(local_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (ValueError, OSError):
+        return {}
+    if (
+        manifest.get("version") != MANIFEST_VERSION
+        or manifest.get("remote") != remote_prefix
+        or manifest.get("server") != client.server
+    ):
+        return {}
+    return manifest.get("files", {})
+
+def save_manifest(local_dir: str, remote_prefix: str, entries: dict):
+    """
+    Function to save the manifest of a directory
+
+    The manifest is written to a temporary file first so an interrupted write
+    never leaves a corrupt manifest behind.
+    """
+
+    path = os.path.join(local_dir, MANIFEST_FILE)
+    manifest = {"version": MANIFEST_VERSION, "server": client.server, "remote": remote_prefix, "files": entries}
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+def scan_local(local_dir: str, manifest: dict, workers: int):
+    """
+    Function to find the files in a local directory and their checksums
+
+    Files whose size and modification time match the manifest are assumed to be
+    unchanged and are not read; only new and modified files are hashed.
+
+    Returns:
+        dict: {"size", "mtime", "checksum"} by path relative to the directory
+    """
+
+    local = {}
+    for root, dirs, files in os.walk(local_dir):
+        dirs.sort()
+        for file_name in sorted(files):
+            if file_name in (MANIFEST_FILE, f"{MANIFEST_FILE}.tmp") or file_name.endswith(".part"):
+                continue
+            file_path = os.path.join(root, file_name)
+            stat = os.stat(file_path)
+            path = os.path.relpath(file_path, local_dir).replace(os.sep, "/")
+            local[path] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "checksum": None}
+
+            entry = manifest.get(path)
+            if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime_ns:
+                local[path]["checksum"] = entry["checksum"]
+
+    # Hash new and modified files in parallel
+    changed = [path for path, info in local.items() if info["checksum"] is None]
+    if changed:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            checksums = pool.map(lambda path: file_checksum(local_path(local_dir, path)), changed)
+            for path, checksum in zip(changed, checksums):
+                local[path]["checksum"] = checksum
+    return local
+
+def local_path(local_dir: str, path: str) -> str:
+    """
+    Function to get the local path of a synced file
+
+    Raises:
+        ValueError: If the path would point outside the synced directory
+    """
+
+    full_path = os.path.normpath(os.path.join(local_dir, *path.split("/")))
+    if os.path.commonpath([os.path.abspath(full_path), os.path.abspath(local_dir)]) != os.path.abspath(local_dir):
+        raise ValueError(f"Path {path} is outside the synced directory")
+    return full_path
+
+def plan_action(local: str, remote: str, base: str, direction: str):
+    """
+    Function to decide what to do with one file
+
+    The local checksum, the checksum on the server and the checksum recorded at
+    the last sync (None when the file is missing or was not synced) are compared
+    to find out which side changed. When syncing in both directions, a file that
+    changed on both sides is a conflict and is left alone.
+
+    Returns:
+        str: "same", "upload", "download", "delete_remote", "delete_local",
+        "conflict", or None when there is nothing to do
+    """
+
+    if local == remote:
+        return "same" if local else None
+
+    if direction == "up":
+        # The local directory wins; only delete remote files that were synced before
+        if local:
+            return "upload"
+        return "delete_remote" if base == remote else None
+
+    if direction == "down":
+        # The server wins; only delete local files that were synced before
+        if remote:
+            return "download"
+        return "delete_local" if base == local else None
+
+    local_changed = local != base
+    remote_changed = remote != base
+    if local_changed and not remote_changed:
+        return "upload" if local else "delete_remote"
+    if remote_changed and not local_changed:
+        return "download" if remote else "delete_local"
+    return "conflict"
+
+def sync_directory(local_dir: str, remote_prefix: str, direction: str, workers: int, dry_run: bool):
+    """
+    Function to sync a local directory with a folder in cloud storage
+
+    Local files are compared with the manifest of the last sync, so unchanged files
+    are only stat'ed, and with one listing of the remote folder. Only the files that
+    changed are transferred, by a pool of workers with one progress bar. The
+    manifest is updated with the result of every file that was synced.
+    """
+
+    headers = get_auth_headers()
+    manifest = load_manifest(local_dir, remote_prefix)
+    local = scan_local(local_dir, manifest, workers)
+
+    try:
+        remote = {
+            name[len(remote_prefix) + 1:]: file
+            for name, file in remote_files(headers, f"{remote_prefix}/").items()
+        }
+    except requests.RequestException as e:
+        typer.echo(f"Failed to list files on the server: {e}")
+        return
+
+    # Decide what to do with every file seen on either side or in the manifest
+    actions = {}
+    for path in sorted(set(local) | set(remote) | set(manifest)):
+        local_checksum = local[path]["checksum"] if path in local else None
+        remote_checksum = remote[path].get("checksum") if path in remote else None
+        base_checksum = manifest[path]["checksum"] if path in manifest else None
+        action = plan_action(local_checksum, remote_checksum, base_checksum, direction)
+        if action:
+            actions[path] = action
+
+    transfers = {path: action for path, action in actions.items() if action not in ("same", "conflict")}
+    if dry_run:
+        for path, action in transfers.items():
+            typer.echo(f"{action:<14} | {path}")
+        for path, action in actions.items():
+            if action == "conflict":
+                typer.echo(f"{'conflict':<14} | {path}")
+        typer.echo(f"{len(transfers)} changes, {sum(a == 'conflict' for a in actions.values())} conflicts.")
+        return
+
+    # Files that are in sync keep (or get) their manifest entry
+    entries = {}
+    for path, action in actions.items():
+        if action == "same":
+            entries[path] = {**local[path], "file_id": remote[path].get("id")}
+        elif action == "conflict" and path in manifest:
+            entries[path] = manifest[path]
+
+    def sync_one(path: str, progress: tqdm):
+        action = transfers[path]
+        name = f"{remote_prefix}/{path}"
+        try:
+            if action == "upload":
+                info = local[path]
+                response, _ = send_file(
+                    local_path(local_dir, path), name, info["size"], headers, checksum=info["checksum"], progress=progress
+                )
+                error = send_error(response)
+                if error:
+                    return "failed", error, None
+                return "uploaded", None, {**info, "file_id": response.json().get("file_id")}
+
+            if action == "download":
+                dest_path = local_path(local_dir, path)
+                response = receive_file(name, dest_path, headers, progress=progress)
+                if not response.ok:
+                    return "failed", response_error(response), None
+                stat = os.stat(dest_path)
+                return "downloaded", None, {
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime_ns,
+                    "checksum": remote[path]["checksum"],
+                    "file_id": remote[path].get("id"),
+                }
+
+            if action == "delete_remote":
+                response = client.delete(f"/files/{remote[path]['id']}", headers=headers)
+                if not response.ok and response.status_code != 404:
+                    return "failed", response_error(response), None
+                return "deleted remote", None, None
+
+            if action == "delete_local":
+                os.remove(local_path(local_dir, path))
+                return "deleted local", None, None
+        except (requests.RequestException, OSError, ValueError) as e:
+            return "failed", str(e), None
+
+    total = sum(local[path]["size"] for path, action in transfers.items() if action == "upload")
+    total += sum(remote[path]["size"] for path, action in transfers.items() if action == "download")
+    results = {}
+    for path, (result, error, entry) in run_transfers(
+        list(transfers), sync_one, total, f"Syncing {len(transfers)} files", workers
+    ).items():
+        results[path] = (result, error)
+        if entry is not None:
+            entries[path] = entry
+        elif result == "failed" and path in manifest:
+            # Keep the old entry so the change is picked up again next time
+            entries[path] = manifest[path]
+
+    save_manifest(local_dir, remote_prefix, entries)
+
+    # Print a summary of every change
+    counts = {}
+    for path in sorted(results):
+        result, error = results[path]
+        counts[result] = counts.get(result, 0) + 1
+        size = (remote if transfers[path] in ("download", "delete_remote") else local)[path]["size"]
+        typer.echo(summary_line(result, size, path, error, width=14))
+    for path, action in actions.items():
+        if action == "conflict":
+            counts["conflict"] = counts.get("conflict", 0) + 1
+            typer.echo(f"{'conflict':<14} | {'':<10} | {path} (changed on both sides, not synced)")
+
+    unchanged = sum(action == "same" for action in actions.values())
+    summary = [f"{count} {result}" for result, count in sorted(counts.items())]
+    typer.echo(", ".join(summary + [f"{unchanged} unchanged"]))
+
+@app.command()
+def sync(
+    local_dir: str=typer.Argument(
+        ...,
+        help="Local directory to sync."
+        ),
+    remote: str=typer.Option(
+        None,
+        "--remote",
+        "-r",
+        help="Folder in the cloud to sync with. Default is the name of the local directory."
+        ),
+    direction: str=typer.Option(
+        "both",
+        "--direction",
+        "-d",
+        help="both: sync changes both ways. up: make the cloud match the local directory. down: make the local directory match the cloud."
+        ),
+    workers: int=typer.Option(
+        UPLOAD_FILE_WORKERS,
+        "--workers",
+        "-w",
+        help="Number of files to transfer in parallel."
+        ),
+    dry_run: bool=typer.Option(
+        False,
+        "--dry-run",
+        "-n",
+        help="Only show what would be synced."
+        )
+    ):
+    """
+    Sync a local directory with a folder in cloud storage
+
+    Only files that changed since the last sync are transferred, in parallel.
+    Changes made on one side (new, modified and deleted files) are applied to the
+    other; files changed on both sides are reported as conflicts and left alone.
+    The state of the last sync is kept in a .cloudsync.json file in the directory.
+    """
+
+    if not os.path.isdir(local_dir):
+        typer.echo(f"Directory {local_dir} does not exist.")
+        raise typer.Exit()
+    if direction not in DIRECTIONS:
+        typer.echo(f"Direction must be one of: {', '.join(DIRECTIONS)}.")
+        raise typer.Exit()
+
+    remote_prefix = (remote or os.path.basename(os.path.abspath(local_dir))).strip("/")
+    if not remote_prefix:
+        typer.echo("Give the folder in the cloud to sync with using --remote.")
+        raise typer.Exit()
+    sync_directory(local_dir, remote_prefix, direction, workers, dry_run)
@@ -0,0 +1,113 @@
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Defaults, each of which can be overridden with an environment variable
+DEFAULT_SERVER = "http://localhost:8000"
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_POOL_SIZE = 16
+
+# Responses that are worth retrying: the server was briefly unavailable or overloaded
+RETRY_STATUSES = (429, 502, 503, 504)
+
+class Client:
+    """
+    Shared HTTP transport for all commands
+
+    All requests go through one requests.Session, so connections to the server
+    are kept alive and reused instead of being opened for every request. Failed
+    connections and temporary server errors are retried with exponential backoff,
+    and every request has a connect and read timeout.
+
+    Only idempotent requests (GET, HEAD, PUT, DELETE) are retried after the server
+    has received them; other requests are only retried if the connection could not
+    be made at all.
+    """
+
+    def __init__(
+        self,
+        server: str = None,
+        connect_timeout: float = None,
+        read_timeout: float = None,
+        retries: int = None,
+        backoff: float = None,
+        pool_size: int = None
+    ):
+        self.server = (server or os.environ.get("CLOUD_SERVER", DEFAULT_SERVER)).rstrip("/")
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else float(os.environ.get("CLOUD_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+            read_timeout if read_timeout is not None else float(os.environ.get("CLOUD_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)),
+        )
+        self.retries = retries if retries is not None else int(os.environ.get("CLOUD_RETRIES", DEFAULT_RETRIES))
+        self.backoff = backoff if backoff is not None else float(os.environ.get("CLOUD_BACKOFF", DEFAULT_BACKOFF))
+        self.pool_size = pool_size if pool_size is not None else int(os.environ.get("CLOUD_POOL_SIZE", DEFAULT_POOL_SIZE))
+        self._session = None
+
+    @property
+    def session(self) -> requests.Session:
+        """The HTTP session, created on first use."""
+        if self._session is None:
+            retry = Retry(
+                total=self.retries,
+                backoff_factor=self.backoff,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=self.pool_size)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    def configure(self, server: str = None, connect_timeout: float = None, read_timeout: float = None, retries: int = None):
+        """Change the settings, e.g. from command line options, before any request is made."""
+        if server:
+            self.server = server.rstrip("/")
+        if connect_timeout is not None or read_timeout is not None:
+            self.timeout = (
+                connect_timeout if connect_timeout is not None else self.timeout[0],
+                read_timeout if read_timeout is not None else self.timeout[1],
+            )
+        if retries is not None:
+            self.retries = retries
+        self.close()
+
+    def url(self, path: str) -> str:
+        """Full URL of a server path."""
+        return f"{self.server}{path}"
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request to a server path, using the default timeouts unless given."""
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, self.url(path), **kwargs)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def head(self, path: str, **kwargs) -> requests.Response:
+        return self.request("HEAD", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        """Close all pooled connections."""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+# Transport shared by all commands
+client = Client()
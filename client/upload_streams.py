@@ -0,0 +1,153 @@
+import io
+import os
+import uuid
+
+class FileSliceReader(io.RawIOBase):
+    """
+    Read-only stream over part of a file on disk
+
+    Passed as a request body it is sent straight from disk, so only one block is
+    in memory at a time. The callback is called with the number of bytes read each
+    time a block is handed to the connection to be sent. If the body is rewound
+    for a retry, the callback gets the negative number of bytes that will be sent
+    again, so progress stays accurate.
+    """
+
+    def __init__(self, file_path: str, offset: int = 0, length: int = None, callback=None):
+        self.file_path = file_path
+        self.offset = offset
+        self.length = os.path.getsize(file_path) - offset if length is None else length
+        self.callback = callback
+        self.position = 0
+        self._file = None
+
+    def __len__(self) -> int:
+        return self.length
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, position: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            position += self.position
+        elif whence == io.SEEK_END:
+            position += self.length
+        position = max(0, min(position, self.length))
+        if self.callback and position < self.position:
+            self.callback(position - self.position)
+        self.position = position
+        return position
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self.length - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size == 0:
+            return b""
+
+        if self._file is None:
+            self._file = open(self.file_path, "rb")
+        self._file.seek(self.offset + self.position)
+        data = self._file.read(size)
+        self.position += len(data)
+        if self.callback:
+            self.callback(len(data))
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().close()
+
+def format_header_param(value: str) -> str:
+    """Quote a file name for a Content-Disposition header in a multipart body."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').translate({10: "%0A", 13: "%0D"})
+
+class MultipartFileEncoder(io.RawIOBase):
+    """
+    multipart/form-data request body with a single file field, streamed from disk
+
+    requests builds multipart bodies in memory, so uploading a file that way needs
+    as much memory as the file is large. This encoder produces the same body piece
+    by piece instead: the part header, the file contents read block by block, and
+    the closing boundary. Its length is known up front, so the request is sent with
+    a Content-Length header rather than chunked encoding.
+
+    The callback is called with the number of file bytes handed to the connection,
+    as they are sent.
+
+    Usage:
+        with MultipartFileEncoder("file", path, name, callback=progress.update) as body:
+            requests.post(url, data=body, headers={"Content-Type": body.content_type})
+    """
+
+    def __init__(self, field: str, file_path: str, file_name: str, content_type: str = "application/octet-stream", callback=None):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self._head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{format_header_param(field)}"; filename="{format_header_param(file_name)}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self._file = FileSliceReader(file_path, callback=callback)
+        self.length = len(self._head) + len(self._file) + len(self._tail)
+        self.position = 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, position: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            position += self.position
+        elif whence == io.SEEK_END:
+            position += self.length
+        self.position = max(0, min(position, self.length))
+        self._file.seek(self.position - len(self._head))
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return self.readall()
+
+        head_end = len(self._head)
+        file_end = head_end + len(self._file)
+        if self.position < head_end:
+            data = self._head[self.position:self.position + size]
+        elif self.position < file_end:
+            data = self._file.read(size)
+        else:
+            start = self.position - file_end
+            data = self._tail[start:start + size]
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
@@ -1,6 +1,8 @@
 import os
+import json
 
 TOKEN_FILE = ".token"
+UPLOAD_STATE_FILE = ".uploads"
 
 # saves the token to a file
 def save_token(token: str):
@@ -23,3 +25,22 @@ def remove_token():
         os.remove(TOKEN_FILE)
     return None
 
+
+# loads the state of interrupted uploads from a file
+def load_upload_state():
+    if not os.path.exists(UPLOAD_STATE_FILE):
+        return {}
+    try:
+        with open(UPLOAD_STATE_FILE, "r") as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return {}
+
+# saves the state of interrupted uploads to a file
+def save_upload_state(state: dict):
+    if not state:
+        if os.path.exists(UPLOAD_STATE_FILE):
+            os.remove(UPLOAD_STATE_FILE)
+        return
+    with open(UPLOAD_STATE_FILE, "w") as f:
+        json.dump(state, f)
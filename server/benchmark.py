@@ -0,0 +1,486 @@
+"""
+Benchmark and load test of the storage server.
+
+Boots the server with uvicorn against a throwaway SQLite database and storage
+directory (or the database given with --database-url) and drives it over HTTP
+with concurrent clients through these scenarios, in order:
+
+    login           POST /auth/login
+    upload_small    POST /files/upload of --small-size files
+    upload_large    POST /files/upload of --large-size files
+    list            GET /files/list
+    download_small  GET /files/download of the small files
+    download_large  GET /files/download of the large files
+    delete          DELETE /files/{id} of every uploaded file
+
+Every scenario reports throughput, latency percentiles and the server's peak
+resident memory while it ran. Results are saved as JSON in --results-dir so
+that runs can be compared:
+
+    python -m server.benchmark --label before
+    python -m server.benchmark --label after --compare benchmark_results/<before>.json
+
+Run it from the repository root. Server settings can be changed with --env,
+e.g. --env STORAGE_COMPRESSION=none.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(SERVER_DIR)
+
+SCENARIOS = ("login", "upload_small", "upload_large", "list", "download_small", "download_large", "delete")
+
+# Settings of the benchmarked server: background jobs are switched off so they don't disturb the numbers
+SERVER_ENV = {
+    "SECRET_KEY": "benchmark",
+    "STORAGE_REPAIR_INTERVAL": "0",
+    "STORAGE_GC_INTERVAL": "0",
+}
+
+def parse_size(value: str) -> int:
+    """Parse a size such as "64KB", "32MB" or "1048576" into bytes."""
+    units = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+    value = value.strip().upper()
+    for suffix, multiplier in units.items():
+        if value.endswith(suffix):
+            return int(float(value[:-len(suffix)]) * multiplier)
+    return int(value)
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class Server:
+    """The server running in a uvicorn subprocess, with its own database and storage."""
+
+    def __init__(self, work_dir: str, database_url: Optional[str], env: Dict[str, str]):
+        self.work_dir = work_dir
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log_path = os.path.join(work_dir, "server.log")
+        self.env = {
+            **os.environ,
+            **SERVER_ENV,
+            "DATABASE_URL": database_url or f"sqlite:///{os.path.join(work_dir, 'benchmark.db')}",
+            "UPLOAD_FOLDER": os.path.join(work_dir, "uploads"),
+            **env,
+        }
+        self.process = None
+
+    def start(self, timeout: float = 60):
+        """Start the server and wait until it answers."""
+        with open(self.log_path, "wb") as log:
+            self.process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "server.server:app", "--port", str(self.port), "--log-level", "warning"],
+                cwd=REPOSITORY_DIR, env=self.env, stdout=log, stderr=subprocess.STDOUT
+            )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                if httpx.get(self.url + "/", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        with open(self.log_path, errors="replace") as f:
+            log_tail = f.read()[-4000:]
+        raise RuntimeError(f"The server did not start:\n{log_tail}")
+
+    def _status(self, field: str) -> Optional[int]:
+        """A memory field of /proc/<pid>/status in bytes (Linux only)."""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith(field + ":"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    def reset_peak_rss(self):
+        """Start measuring the peak resident memory anew, where the kernel supports it."""
+        try:
+            with open(f"/proc/{self.process.pid}/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+    def peak_rss(self) -> Optional[int]:
+        """Peak resident memory of the server in bytes, since the last reset."""
+        return self._status("VmHWM")
+
+    def stop(self) -> Optional[int]:
+        """
+        Stop the server.
+
+        Returns:
+            Optional[int]: Peak resident memory over its whole run in bytes, where known
+        """
+        if self.process is None or self.process.poll() is not None:
+            return None
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class Result:
+    """Timings and transferred bytes of one scenario."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.first_error: Optional[str] = None
+        self.bytes = 0
+        self.seconds = 0.0
+        self.peak_rss: Optional[int] = None
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+        ms = lambda value: None if value is None else round(value * 1000, 3)
+        operations = len(latencies) + self.errors
+        return {
+            "operations": operations,
+            "errors": self.errors,
+            "first_error": self.first_error,
+            "seconds": round(self.seconds, 3),
+            "requests_per_second": round(operations / self.seconds, 2) if self.seconds else None,
+            "mb_per_second": round(self.bytes / self.seconds / 1024 ** 2, 2) if self.seconds else None,
+            "bytes": self.bytes,
+            "latency_ms": {
+                "mean": ms(sum(latencies) / len(latencies)) if latencies else None,
+                "p50": ms(percentile(latencies, 0.50)),
+                "p90": ms(percentile(latencies, 0.90)),
+                "p95": ms(percentile(latencies, 0.95)),
+                "p99": ms(percentile(latencies, 0.99)),
+                "max": ms(latencies[-1] if latencies else None),
+            },
+            "server_peak_rss_bytes": self.peak_rss,
+        }
+
+# An operation gets the number of the worker running it and returns the bytes it transferred
+Operation = Callable[[int], Awaitable[int]]
+
+async def run_operations(result: Result, operations: List[Operation], concurrency: int):
+    """Run operations on `concurrency` workers, each taking the next operation when it is done."""
+    pending = iter(operations)
+
+    async def worker(number: int):
+        for operation in pending:
+            started = time.perf_counter()
+            try:
+                transferred = await operation(number)
+                result.latencies.append(time.perf_counter() - started)
+                result.bytes += transferred
+            except Exception as e:
+                result.errors += 1
+                if result.first_error is None:
+                    result.first_error = f"{type(e).__name__}: {e}"[:500]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    result.seconds = time.perf_counter() - started
+
+class Benchmark:
+    """The scenarios and the state they share: users, their tokens and the uploaded files."""
+
+    def __init__(self, client: httpx.AsyncClient, args, work_dir: str):
+        self.client = client
+        self.args = args
+        self.work_dir = work_dir
+        self.users: List[Tuple[str, str]] = []
+        self.tokens: List[str] = []
+        # (user number, file id, name) of the uploaded files
+        self.small_files: List[Tuple[int, int, str]] = []
+        self.large_files: List[Tuple[int, int, str]] = []
+
+    def headers(self, user: int) -> dict:
+        return {"Authorization": f"Bearer {self.tokens[user % len(self.tokens)]}"}
+
+    @staticmethod
+    def check(response: httpx.Response):
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.method} {response.request.url.path}: {response.status_code} {response.text[:200]}")
+
+    async def login(self, user: int) -> str:
+        username, password = self.users[user % len(self.users)]
+        response = await self.client.post("/auth/login", data={"username": username, "password": password})
+        self.check(response)
+        return response.json()["access_token"]
+
+    async def setup(self):
+        """Register one user per worker, so workers don't contend for the same user's files."""
+        run_id = os.urandom(4).hex()
+        for number in range(self.args.concurrency):
+            username, password = f"bench-{run_id}-{number}", "benchmark-password"
+            response = await self.client.post("/auth/register", json={
+                "username": username, "email": f"{username}@example.com", "password": password, "role": "user"
+            })
+            self.check(response)
+            self.users.append((username, password))
+        self.tokens = list(await asyncio.gather(*(self.login(number) for number in range(len(self.users)))))
+
+    async def upload(self, user: int, name: str, content, size: int, files: list) -> int:
+        response = await self.client.post("/files/upload", files={"file": (name, content)}, headers=self.headers(user))
+        self.check(response)
+        files.append((user, response.json()["file_id"], name))
+        return size
+
+    async def download(self, user: int, name: str) -> int:
+        size = 0
+        async with self.client.stream("GET", "/files/download", params={"file_name": name}, headers=self.headers(user)) as response:
+            self.check(response)
+            async for chunk in response.aiter_raw():
+                size += len(chunk)
+        return size
+
+    def large_file(self, worker: int) -> str:
+        """
+        Path of the worker's large file, with new random bytes at its start,
+        so that every upload is new content and isn't deduplicated.
+        """
+        path = os.path.join(self.work_dir, f"large-{worker}")
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                remaining = self.args.large_size
+                while remaining > 0:
+                    block = os.urandom(min(remaining, 1024 * 1024))
+                    f.write(block)
+                    remaining -= len(block)
+        with open(path, "r+b") as f:
+            f.write(os.urandom(min(32, self.args.large_size)))
+        return path
+
+    def operations(self, scenario: str) -> List[Operation]:
+        """The operations of one scenario."""
+        args = self.args
+
+        if scenario == "login":
+            async def login(worker: int, i: int) -> int:
+                await self.login(i)
+                return 0
+            return [lambda worker, i=i: login(worker, i) for i in range(args.requests)]
+
+        if scenario == "upload_small":
+            async def upload_small(worker: int, i: int) -> int:
+                return await self.upload(worker, f"small-{i}", os.urandom(args.small_size), args.small_size, self.small_files)
+            return [lambda worker, i=i: upload_small(worker, i) for i in range(args.requests)]
+
+        if scenario == "upload_large":
+            async def upload_large(worker: int, i: int) -> int:
+                with open(self.large_file(worker), "rb") as f:
+                    return await self.upload(worker, f"large-{i}", f, args.large_size, self.large_files)
+            return [lambda worker, i=i: upload_large(worker, i) for i in range(args.large_requests)]
+
+        if scenario == "list":
+            async def list_files(worker: int) -> int:
+                response = await self.client.get("/files/list", params={"limit": 100}, headers=self.headers(worker))
+                self.check(response)
+                return len(response.content)
+            return [list_files for _ in range(args.requests)]
+
+        if scenario in ("download_small", "download_large"):
+            files = self.small_files if scenario == "download_small" else self.large_files
+            count = args.requests if scenario == "download_small" else args.large_requests
+            if not files:
+                return []
+            return [
+                lambda worker, user=user, name=name: self.download(user, name)
+                for user, _, name in (files[i % len(files)] for i in range(count))
+            ]
+
+        if scenario == "delete":
+            async def delete(user: int, file_id: int) -> int:
+                response = await self.client.delete(f"/files/{file_id}", headers=self.headers(user))
+                self.check(response)
+                return 0
+            return [
+                lambda worker, user=user, file_id=file_id: delete(user, file_id)
+                for user, file_id, _ in self.small_files + self.large_files
+            ]
+
+        raise ValueError(f"Unknown scenario {scenario}")
+
+async def run(args, server: Server, work_dir: str) -> Dict[str, dict]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=server.url, timeout=args.timeout, limits=limits) as client:
+        benchmark = Benchmark(client, args, work_dir)
+        await benchmark.setup()
+
+        results = {}
+        for scenario in args.scenarios:
+            result = Result(scenario)
+            server.reset_peak_rss()
+            await run_operations(result, benchmark.operations(scenario), args.concurrency)
+            result.peak_rss = server.peak_rss()
+            results[scenario] = result.summary()
+            print_result(scenario, results[scenario])
+        return results
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPOSITORY_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def database_label(database_url: Optional[str]) -> str:
+    """Kind of database a run used, without its address or credentials."""
+    if database_url is None:
+        return "sqlite"
+    if database_url in ("sqlite://", "sqlite:///:memory:"):
+        return "sqlite-memory"
+    return database_url.split(":", 1)[0]
+
+def mb(value: Optional[int]) -> str:
+    return "-" if value is None else f"{value / 1024 ** 2:.1f}"
+
+def fmt(value) -> str:
+    return "-" if value is None else f"{value:g}"
+
+HEADER = f"{'scenario':<15} {'ops':>6} {'errors':>6} {'req/s':>9} {'MB/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'RSS MB':>8}"
+
+def print_result(scenario: str, summary: dict):
+    latency = summary["latency_ms"]
+    print(
+        f"{scenario:<15} {summary['operations']:>6} {summary['errors']:>6} {fmt(summary['requests_per_second']):>9} "
+        f"{fmt(summary['mb_per_second']):>8} {fmt(latency['p50']):>9} {fmt(latency['p95']):>9} "
+        f"{fmt(latency['p99']):>9} {fmt(latency['max']):>9} {mb(summary['server_peak_rss_bytes']):>8}",
+        flush=True
+    )
+    if summary["first_error"]:
+        print(f"    first error: {summary['first_error']}", flush=True)
+
+def change(old, new) -> str:
+    if old in (None, 0) or new is None:
+        return "-"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+def print_comparison(previous: dict, current: dict):
+    """Print throughput, p95 latency and memory of two runs side by side."""
+    print(f"\nCompared with {previous.get('label') or previous['started']} ({previous.get('git_commit') or 'unknown commit'}):")
+    print(f"{'scenario':<15} {'req/s old/new':>26} {'p95 ms old/new':>26} {'RSS MB old/new':>26}")
+    for scenario, new in current["scenarios"].items():
+        old = previous["scenarios"].get(scenario)
+        if old is None:
+            continue
+        old_rps, new_rps = old["requests_per_second"], new["requests_per_second"]
+        old_p95, new_p95 = old["latency_ms"]["p95"], new["latency_ms"]["p95"]
+        old_rss, new_rss = old["server_peak_rss_bytes"], new["server_peak_rss_bytes"]
+        print(
+            f"{scenario:<15} {fmt(old_rps):>9} {fmt(new_rps):>9} {change(old_rps, new_rps):>7} "
+            f"{fmt(old_p95):>9} {fmt(new_p95):>9} {change(old_p95, new_p95):>7} "
+            f"{mb(old_rss):>9} {mb(new_rss):>9} {change(old_rss, new_rss):>7}"
+        )
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients (default 8)")
+    parser.add_argument("--requests", type=int, default=200, help="Operations of every scenario with small requests (default 200)")
+    parser.add_argument("--large-requests", type=int, default=8, help="Large uploads and downloads (default 8)")
+    parser.add_argument("--small-size", type=parse_size, default="64KB", help="Size of small files (default 64KB)")
+    parser.add_argument("--large-size", type=parse_size, default="32MB", help="Size of large files (default 32MB)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run (default all)")
+    parser.add_argument(
+        "--database-url", help='Database to run against instead of a new SQLite file, e.g. "sqlite://" for an in-memory one'
+    )
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="Server setting, can be repeated")
+    parser.add_argument("--timeout", type=float, default=300, help="Request timeout in seconds (default 300)")
+    parser.add_argument("--label", default="", help="Name of this run, used in the result file name")
+    parser.add_argument("--results-dir", default="benchmark_results", help="Directory for result files (default benchmark_results)")
+    parser.add_argument("--compare", help="Result file of an earlier run to compare with")
+    parser.add_argument("--keep", action="store_true", help="Keep the database, stored files and server log")
+    args = parser.parse_args(argv)
+
+    args.scenarios = [scenario.strip() for scenario in args.scenarios.split(",") if scenario.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    env = {}
+    for item in args.env:
+        name, separator, value = item.partition("=")
+        if not separator:
+            parser.error(f"--env needs NAME=VALUE, got {item}")
+        env[name] = value
+
+    work_dir = tempfile.mkdtemp(prefix="storage-benchmark-")
+    server = Server(work_dir, args.database_url, env)
+    started = datetime.now(timezone.utc)
+    try:
+        server.start()
+        print(HEADER, flush=True)
+        scenarios = asyncio.run(run(args, server, work_dir))
+    finally:
+        server_peak_rss = server.stop()
+        if args.keep:
+            print(f"Database, files and server log kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "label": args.label,
+        "started": started.isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "large_requests": args.large_requests,
+            "small_size": args.small_size,
+            "large_size": args.large_size,
+            "database": database_label(args.database_url),
+            "env": env,
+        },
+        "scenarios": scenarios,
+        "server_peak_rss_bytes": server_peak_rss,
+        "client_peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+    }
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    name = started.strftime("%Y%m%d-%H%M%S") + (f"-{args.label}" if args.label else "") + ".json"
+    path = os.path.join(args.results_dir, name)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nServer peak RSS {mb(server_peak_rss)} MB, results saved to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from server.models.models import Base
+from server.utils.database_class import Database
+
+config = context.config
+
+# Only configure logging when run from the alembic command line, not when
+# the server applies migrations at startup
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+def run_migrations_offline():
+    """Emit the migration SQL without connecting to the database."""
+    context.configure(
+        url=Database().postgres_url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=True,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    """Apply the migrations to the database."""
+    with Database().engine.connect() as connection:
+        sqlite = connection.dialect.name == "sqlite"
+        if sqlite:
+            # Batch operations drop and recreate tables, which with foreign
+            # keys enforced would cascade to the rows referencing them. The
+            # setting can't change inside a transaction.
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            connection.commit()
+
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            # SQLite can only alter tables by copying them
+            render_as_batch=True,
+        )
+
+        try:
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            if sqlite:
+                connection.rollback()
+                connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+                connection.commit()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
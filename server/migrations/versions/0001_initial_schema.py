@@ -0,0 +1,97 @@
+"""initial schema
+
+Users, content-addressed blobs, files and resumable upload sessions.
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 10:58:51.216813
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('blob',
+    sa.Column('hash', sa.String(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=True),
+    sa.Column('ref_count', sa.Integer(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(), nullable=True),
+    sa.Column('email', sa.String(), nullable=True),
+    sa.Column('password_hash', sa.String(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('role', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_email'), ['email'], unique=True)
+        batch_op.create_index(batch_op.f('ix_user_username'), ['username'], unique=True)
+
+    op.create_table('file',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('file_name', sa.String(), nullable=False),
+    sa.Column('blob_hash', sa.String(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['blob_hash'], ['blob.hash'], ),
+    sa.ForeignKeyConstraint(['owner_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('owner_id', 'file_name', name='uq_file_owner_name')
+    )
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_file_blob_hash'), ['blob_hash'], unique=False)
+        batch_op.create_index('ix_file_owner_id_id', ['owner_id', 'id'], unique=False)
+        batch_op.create_index('ix_file_owner_size', ['owner_id', 'size', 'id'], unique=False)
+        batch_op.create_index('ix_file_owner_timestamp', ['owner_id', 'timestamp', 'id'], unique=False)
+        batch_op.create_index('ix_file_timestamp', ['timestamp', 'id'], unique=False)
+
+    op.create_table('upload_session',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('file_name', sa.String(), nullable=True),
+    sa.Column('size', sa.BigInteger(), nullable=True),
+    sa.Column('chunk_size', sa.Integer(), nullable=True),
+    sa.Column('total_chunks', sa.Integer(), nullable=True),
+    sa.Column('checksum', sa.String(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['owner_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('upload_session', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_upload_session_owner_id'), ['owner_id'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('upload_session', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_upload_session_owner_id'))
+
+    op.drop_table('upload_session')
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.drop_index('ix_file_timestamp')
+        batch_op.drop_index('ix_file_owner_timestamp')
+        batch_op.drop_index('ix_file_owner_size')
+        batch_op.drop_index('ix_file_owner_id_id')
+        batch_op.drop_index(batch_op.f('ix_file_blob_hash'))
+
+    op.drop_table('file')
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_username'))
+        batch_op.drop_index(batch_op.f('ix_user_email'))
+
+    op.drop_table('user')
+    op.drop_table('blob')
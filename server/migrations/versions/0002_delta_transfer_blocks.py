@@ -0,0 +1,54 @@
+"""delta transfer blocks
+
+Per-blob content-defined blocks and delta upload sessions.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 11:07:03.697636
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('blob_block',
+    sa.Column('blob_hash', sa.String(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('start', sa.BigInteger(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('hash', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['blob_hash'], ['blob.hash'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('blob_hash', 'position')
+    )
+    op.create_table('delta_session',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('file_name', sa.String(), nullable=False),
+    sa.Column('base_hash', sa.String(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('checksum', sa.String(), nullable=False),
+    sa.Column('blocks', sa.Text(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['owner_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('delta_session', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_delta_session_owner_id'), ['owner_id'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('delta_session', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_delta_session_owner_id'))
+
+    op.drop_table('delta_session')
+    op.drop_table('blob_block')
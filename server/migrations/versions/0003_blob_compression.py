@@ -0,0 +1,32 @@
+"""blob compression
+
+Content coding and size on disk of compressed blobs.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 13:42:18.204511
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('encoding', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('stored_size', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.drop_column('stored_size')
+        batch_op.drop_column('encoding')
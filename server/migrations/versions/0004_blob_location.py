@@ -0,0 +1,30 @@
+"""blob location
+
+Storage root holding each blob.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 14:31:05.118342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('location', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.drop_column('location')
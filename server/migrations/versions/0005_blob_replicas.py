@@ -0,0 +1,30 @@
+"""blob replicas
+
+Blobs record every storage root holding one of their replicas.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 15:52:40.771029
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.alter_column('location', new_column_name='locations', existing_type=sa.String(), existing_nullable=True)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.alter_column('locations', new_column_name='location', existing_type=sa.String(), existing_nullable=True)
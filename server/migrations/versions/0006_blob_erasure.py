@@ -0,0 +1,30 @@
+"""blob erasure coding
+
+Blobs record the erasure coding scheme of the shards they are stored as.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 17:20:12.508113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('erasure', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.drop_column('erasure')
@@ -0,0 +1,33 @@
+"""tombstones
+
+References dropped by deleted files are recorded as tombstones and collected
+in the background.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 18:05:47.213950
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('tombstone',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('blob_hash', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('tombstone')
@@ -0,0 +1,42 @@
+"""user storage usage and quota
+
+Users keep the total size and number of their files, so usage doesn't have
+to be summed over the file table, and an optional storage quota. Existing
+users' counters are filled in from their files.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 19:02:41.730215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('storage_used', sa.BigInteger(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('file_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('storage_quota', sa.BigInteger(), nullable=True))
+
+    op.execute(
+        'UPDATE "user" SET '
+        'storage_used = (SELECT COALESCE(SUM(file.size), 0) FROM file WHERE file.owner_id = "user".id), '
+        'file_count = (SELECT COUNT(*) FROM file WHERE file.owner_id = "user".id)'
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('storage_quota')
+        batch_op.drop_column('file_count')
+        batch_op.drop_column('storage_used')
@@ -0,0 +1,34 @@
+"""chunking v2
+
+Blocks are now cut by a gear hash over every byte (cdc-v2) instead of after
+newlines. The blocks kept for stored files were cut the old way and are
+recomputed when next needed; delta uploads in progress list blocks of the old
+kind and are discarded, so clients start them again.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 21:14:05.391772
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(sa.delete(sa.table('blob_block')))
+    op.execute(sa.delete(sa.table('delta_session')))
+
+
+def downgrade() -> None:
+    # The blocks of the newer algorithm are as unusable to older versions
+    op.execute(sa.delete(sa.table('blob_block')))
+    op.execute(sa.delete(sa.table('delta_session')))
@@ -1 +1 @@
-from .models import File, User
+from .models import Blob, BlobBlock, DeltaSession, File, Tombstone, User, UploadSession
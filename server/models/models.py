@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, BigInteger
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, BigInteger, ForeignKey, Index, Text, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, timezone
 
@@ -8,20 +8,97 @@ class User(Base):
     """User model for the database."""
     __tablename__ = "user"
     
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    username = Column(String, index=True, unique=True)
     email = Column(String, index=True, unique=True)
     password_hash = Column(String)
     is_active = Column(Boolean, default=True)
     role = Column(String, default="user")
+    # Total size and number of the user's files, kept up to date with every upload and delete
+    storage_used = Column(BigInteger, default=0, server_default="0", nullable=False)
+    file_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # Bytes the user may store, None for the STORAGE_QUOTA default
+    storage_quota = Column(BigInteger, nullable=True)
+
+class Blob(Base):
+    """Content-addressed blob holding the bytes shared by one or more files."""
+    __tablename__ = "blob"
+
+    hash = Column(String, primary_key=True)
+    size = Column(BigInteger)
+    ref_count = Column(Integer, default=0)
+    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # Names of the storage roots holding replicas of the bytes, comma-separated
+    locations = Column(String, nullable=True)
+    # Content coding of the stored bytes (e.g. "gzip"), None when stored uncompressed
+    encoding = Column(String, nullable=True)
+    stored_size = Column(BigInteger, nullable=True)
+    # Erasure coding scheme (e.g. "4+2") when the bytes are stored as shards, in
+    # which case `locations` lists the root of every shard in shard order
+    erasure = Column(String, nullable=True)
+
+class BlobBlock(Base):
+    """Content-defined block of a blob, used to transfer only the changed parts of a file."""
+    __tablename__ = "blob_block"
+
+    blob_hash = Column(String, ForeignKey("blob.hash", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    start = Column(BigInteger, nullable=False)
+    size = Column(Integer, nullable=False)
+    hash = Column(String, nullable=False)
+
+class Tombstone(Base):
+    """Reference to a blob dropped by a deleted or replaced file, not yet collected."""
+    __tablename__ = "tombstone"
+
+    id = Column(Integer, primary_key=True)
+    blob_hash = Column(String, nullable=False)
 
 class File(Base):
     """File model for the database."""
     __tablename__ = "file"
+    __table_args__ = (
+        # A user's file names are unique; also serves downloads by name,
+        # listings sorted by name and name prefix filters
+        UniqueConstraint("owner_id", "file_name", name="uq_file_owner_name"),
+        # Keyset pagination of a user's files by id, upload time and size
+        Index("ix_file_owner_id_id", "owner_id", "id"),
+        Index("ix_file_owner_timestamp", "owner_id", "timestamp", "id"),
+        Index("ix_file_owner_size", "owner_id", "size", "id"),
+        # Admin listing of all files by upload time
+        Index("ix_file_timestamp", "timestamp", "id"),
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    owner_id = Column(String)
-    file_name = Column(String, index=True)
-    path = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    file_name = Column(String, nullable=False)
+    blob_hash = Column(String, ForeignKey("blob.hash"), nullable=False, index=True)
+    size = Column(BigInteger, nullable=False)
+    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+class UploadSession(Base):
+    """Resumable chunked upload session."""
+    __tablename__ = "upload_session"
+
+    id = Column(String, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("user.id", ondelete="CASCADE"), nullable=False, index=True)
+    file_name = Column(String)
     size = Column(BigInteger)
+    chunk_size = Column(Integer)
+    total_chunks = Column(Integer)
+    checksum = Column(String, nullable=True)
+    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class DeltaSession(Base):
+    """Upload of a new version of a file that only sends the blocks the server does not have."""
+    __tablename__ = "delta_session"
+
+    id = Column(String, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("user.id", ondelete="CASCADE"), nullable=False, index=True)
+    file_name = Column(String, nullable=False)
+    base_hash = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    checksum = Column(String, nullable=False)
+    # JSON list of [hash, size] for every block of the new version
+    blocks = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
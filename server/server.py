@@ -1,21 +1,46 @@
 from typing import Annotated
 from contextlib import asynccontextmanager
-from fastapi import Depends, FastAPI, HTTPException, Query
+import asyncio
+from fastapi import Depends, FastAPI, HTTPException, Query, Response
+from starlette.concurrency import run_in_threadpool
 from .services import auth_router, file_router, admin_router
-from .utils import Database
-from .models.models import Base
+from .utils import (
+    Database,
+    METRICS_CONTENT_TYPE,
+    MetricsMiddleware,
+    QueryProfilerMiddleware,
+    collector,
+    metrics_registry,
+    password_hasher,
+    repairer,
+    run_migrations
+)
 
 db = Database()
 
 @asynccontextmanager
 async def lifespan(app):
-    # Use SQLAlchemy Base metadata
-    Base.metadata.create_all(bind=db.engine)
+    # Bring the schema up to date with the Alembic migrations
+    await run_in_threadpool(run_migrations)
+    # Check and restore stored file replicas in the background
+    repair_task = asyncio.create_task(repairer.run_forever()) if repairer.interval > 0 else None
+    # Remove deleted files' content and what failed uploads leave behind in the background
+    gc_task = asyncio.create_task(collector.run_forever()) if collector.interval > 0 else None
     yield
+    for task in (repair_task, gc_task):
+        if task is not None:
+            task.cancel()
+    password_hasher.shutdown()
+    await db.close()
 
 # Create app
 app = FastAPI(lifespan = lifespan)
 
+# Request latency, requests in progress and transferred bytes, exposed at /metrics
+app.add_middleware(MetricsMiddleware)
+# Database queries and time of sampled requests, while SQL profiling is enabled
+app.add_middleware(QueryProfilerMiddleware)
+
 # Include routers
 app.include_router(auth_router, prefix='/auth', tags=['Authentication'])
 app.include_router(file_router, prefix='/files', tags=['Files'])
@@ -24,3 +49,8 @@ app.include_router(admin_router, prefix='/admin', tags=['Admin'])
 @app.get("/")
 async def read_root():
     return {"msg": "Hello World"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Server metrics in the Prometheus text format."""
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
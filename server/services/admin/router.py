@@ -1,11 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response, status
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-import os
 
-from ...utils import Database
+from ...utils import Database, blob_store, collector, password_hasher, query_profiler, repairer
 from ...models import User, File
-from ..auth.services import require_role, UserResponse, FileResponse
+from ..auth.services import (
+    require_role,
+    invalidate_user,
+    UserResponse,
+    FileResponse,
+    QuotaUpdate,
+    SqlProfilingUpdate,
+    UserUsageResponse
+)
+from ..files.services import (
+    FileListQuery,
+    StorageUsageResponse,
+    file_list_query,
+    apply_file_list_query,
+    next_cursor,
+    effective_quota,
+    get_usage,
+    update_usage
+)
 
 router = APIRouter()
 db = Database()
@@ -14,17 +32,17 @@ db = Database()
 @router.get('/users', response_model=List[UserResponse])
 async def list_all_users(
     _current_user = Depends(require_role("admin")),
-    db: Session = Depends(db.get_db)
+    db: AsyncSession = Depends(db.get_async_db)
 ):
     """List all users (admin only)."""
-    users = db.query(User).all()
-    return users
+    result = await db.execute(select(User))
+    return result.scalars().all()
 
 @router.delete('/users/{user_id}', status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(
     user_id: int,
     _current_user = Depends(require_role("admin")),
-    db: Session = Depends(db.get_db)
+    db: AsyncSession = Depends(db.get_async_db)
 ):
     """Delete a user (admin only)."""
     # Prevent admins from deleting themselves
@@ -35,38 +53,79 @@ async def delete_user(
         )
     
     # Find the user
-    user = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User with ID {user_id} not found"
         )
     
-    # Delete any files owned by this user
-    db.query(File).filter(File.owner_id == str(user_id)).delete()
+    # Delete any files owned by this user and drop their references to the
+    # content in two statements, however many files there are; the content is
+    # removed in the background. The usage counters go away with the user row.
+    await blob_store.release_files(db, select(File.blob_hash).where(File.owner_id == user_id))
+    await db.execute(delete(File).where(File.owner_id == user_id))
     
     # Delete the user
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
+
+    # Make sure the deleted user's tokens stop working right away
+    invalidate_user(user.username)
     
     return None
 
+@router.put('/users/{user_id}/quota', response_model=StorageUsageResponse)
+async def set_user_quota(
+    user_id: int,
+    data: QuotaUpdate,
+    _current_user = Depends(require_role("admin")),
+    db: AsyncSession = Depends(db.get_async_db)
+):
+    """Set how many bytes a user may store (admin only)."""
+    if data.quota is not None and data.quota < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Quota cannot be negative")
+
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalars().first()
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with ID {user_id} not found"
+        )
+
+    # Files stored before the quota was lowered are kept, only new uploads are refused
+    user.storage_quota = data.quota
+    await db.commit()
+    return await get_usage(db, user_id)
+
 # File management routes
 @router.get('/files', response_model=List[FileResponse])
 async def list_all_files(
+    response: Response,
+    query: FileListQuery = Depends(file_list_query),
     _current_user = Depends(require_role("admin")),
-    db: Session = Depends(db.get_db)
+    db: AsyncSession = Depends(db.get_async_db)
 ):
-    """List all files in the system (admin only)."""
-    try:
-        # Get all files from the database
-        files = db.query(File).all()
+    """
+    List all files in the system (admin only).
 
-        # Get all users for reference
-        users = db.query(User).all()
+    Paginated like /files/list: the `X-Next-Cursor` response header holds the
+    `cursor` for the next page.
+    """
+    try:
+        # Get one page of files with the owner's username joined in
+        stmt = apply_file_list_query(
+            select(File, User.username).join(User, File.owner_id == User.id),
+            query
+        )
+        result = await db.execute(stmt)
+        rows = result.all()
 
-        # Create a dictionary to map user IDs to usernames
-        user_dict = {str(user.id): user.username for user in users}
+        cursor = next_cursor([file for file, _ in rows], query)
+        if cursor:
+            response.headers["X-Next-Cursor"] = cursor
 
         # Format response with user information
         return [
@@ -75,10 +134,12 @@ async def list_all_files(
                 name=file.file_name,
                 size=file.size,
                 owner_id=file.owner_id,
-                owner_username=user_dict.get(str(file.owner_id), "Unknown"),
+                owner_username=username or "Unknown",
                 timestamp=file.timestamp,
-            ) for file in files
+            ) for file, username in rows[:query.limit]
         ]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing files: {str(e)}")
 
@@ -86,11 +147,12 @@ async def list_all_files(
 async def delete_file(
     file_id: int,
     _current_user = Depends(require_role("admin")),
-    db: Session = Depends(db.get_db)
+    db: AsyncSession = Depends(db.get_async_db)
 ):
     """Delete a file from the system (admin only)."""
     # Find the file
-    file = db.query(File).filter(File.id == file_id).first()
+    result = await db.execute(select(File).where(File.id == file_id))
+    file = result.scalars().first()
     if not file:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -98,21 +160,99 @@ async def delete_file(
         )
     
     try:
-        # Get the file path from the database
-        file_path = file.path
-
-        # Delete the physical file if it exists
-        if os.path.exists(file_path):
-            os.remove(file_path)
-
-        # Delete the file record from database
-        db.delete(file)
-        db.commit()
+        # Delete the file record from database and drop its reference to the
+        # content, which is removed in the background once no other file uses it
+        await db.delete(file)
+        await blob_store.release(db, file.blob_hash)
+        await update_usage(db, file.owner_id, -file.size, -1)
+        await db.commit()
         
         return None
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error deleting file: {str(e)}"
         )
+
+# Service statistics
+@router.get('/stats/password-hashing')
+async def password_hashing_stats(
+    _current_user = Depends(require_role("admin"))
+):
+    """Password hashing pool state and latency statistics (admin only)."""
+    return password_hasher.snapshot()
+
+@router.get('/sql-profiling')
+async def sql_profiling(
+    _current_user = Depends(require_role("admin"))
+):
+    """SQL profiling settings (admin only)."""
+    return query_profiler.snapshot()
+
+@router.put('/sql-profiling')
+async def configure_sql_profiling(
+    data: SqlProfilingUpdate,
+    _current_user = Depends(require_role("admin"))
+):
+    """
+    Change SQL profiling without restarting the server (admin only).
+
+    Set `slow_query_seconds` and `sample_rate` to 0 to turn profiling off.
+    Changes last until the server restarts.
+    """
+    if data.slow_query_seconds is not None and data.slow_query_seconds < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Slow query threshold cannot be negative")
+    if data.sample_rate is not None and not 0 <= data.sample_rate <= 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Sample rate must be between 0 and 1")
+    if data.max_request_queries is not None and data.max_request_queries < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Query limit cannot be negative")
+
+    query_profiler.configure(**data.model_dump())
+    return query_profiler.snapshot()
+
+@router.get('/stats/usage', response_model=List[UserUsageResponse])
+async def usage_stats(
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of users"),
+    _current_user = Depends(require_role("admin")),
+    db: AsyncSession = Depends(db.get_async_db)
+):
+    """Users storing the most bytes, with their quotas (admin only)."""
+    result = await db.execute(
+        select(User.id, User.username, User.storage_used, User.file_count, User.storage_quota)
+        .order_by(User.storage_used.desc(), User.id)
+        .limit(limit)
+    )
+    return [
+        UserUsageResponse(id=id, username=username, used=used, files=files, quota=effective_quota(quota))
+        for id, username, used, files, quota in result.all()
+    ]
+
+@router.get('/stats/storage')
+async def storage_stats(
+    _current_user = Depends(require_role("admin"))
+):
+    """Storage roots, their health, the last replica repair run and garbage collection progress (admin only)."""
+    return {**blob_store.snapshot(), "repair": repairer.snapshot(), "gc": collector.snapshot()}
+
+@router.post('/storage/repair', status_code=status.HTTP_202_ACCEPTED)
+async def repair_storage(
+    background_tasks: BackgroundTasks,
+    _current_user = Depends(require_role("admin"))
+):
+    """Start checking and repairing all stored file replicas now (admin only)."""
+    if repairer.running:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A repair run is already in progress")
+    background_tasks.add_task(repairer.run_once)
+    return repairer.snapshot()
+
+@router.post('/storage/gc', status_code=status.HTTP_202_ACCEPTED)
+async def collect_garbage(
+    background_tasks: BackgroundTasks,
+    _current_user = Depends(require_role("admin"))
+):
+    """Start removing deleted and orphaned content now (admin only)."""
+    if collector.running:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Garbage collection is already in progress")
+    background_tasks.add_task(collector.run_once)
+    return collector.snapshot()
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...utils import Database
 from ...config import settings
@@ -12,6 +12,7 @@ from .services import (
     create_access_token, 
     create_user, 
     get_current_user,
+    get_user,
     require_role,
     Token, 
     UserCreate, 
@@ -23,10 +24,10 @@ router = APIRouter()
 db = Database()
 
 @router.post('/login', response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(db.get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(db.get_async_db)):
     """Authenticate a user and return an access token."""
     # Check if the user exists and verify password
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
 
     # If the user does not exist or password is incorrect, raise an error
     if not user:
@@ -46,18 +47,20 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post('/register', response_model=UserResponse)
-async def register(user: UserCreate, db: Session = Depends(db.get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(db.get_async_db)):
     """Register a new user."""
     try:
         # Check if the user already exists
-        existing_user = db.query(User).filter(User.username == user.username).first()
+        existing_user = await get_user(db, user.username)
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already registered",
             )
         # If not, create the user
-        db_user = create_user(db, user)
+        db_user = await create_user(db, user)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -1,25 +1,27 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from ...models import User
-from ...utils import Database, check_token_validity, decode_token
+from ...utils import Database, PasswordHasherBusy, TTLCache, password_hasher
 from ...config import settings
 
 db = Database()
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # OAuth2 scheme for token extraction
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+# In-process caches of verified tokens and authenticated users. Entries live
+# at most AUTH_CACHE_TTL seconds, which bounds how stale they can get on
+# other workers when a user is changed or deleted.
+token_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL)
+user_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL)
+
 # Models
 class Token(BaseModel):
     """JWT token response model."""
@@ -38,6 +40,15 @@ class UserCreate(BaseModel):
     password: str
     role: str
 
+class CurrentUser(BaseModel):
+    """Snapshot of the authenticated user, safe to cache between requests."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    username: str
+    email: str
+    role: str
+
 class UserResponse(BaseModel):
     """Model for user response data."""
     id: int
@@ -50,42 +61,76 @@ class FileResponse(BaseModel):
     id: int
     name: str
     size: int
-    owner_id: str
+    owner_id: int
     owner_username: str
     timestamp: datetime
 
+class QuotaUpdate(BaseModel):
+    """Model for setting a user's storage quota; None falls back to the default quota."""
+    quota: Optional[int] = None
+
+class SqlProfilingUpdate(BaseModel):
+    """Model for changing SQL profiling at runtime; fields left out are unchanged."""
+    slow_query_seconds: Optional[float] = None
+    sample_rate: Optional[float] = None
+    max_request_queries: Optional[int] = None
+    echo: Optional[bool] = None
+
+class UserUsageResponse(BaseModel):
+    """Model for the storage usage of one user."""
+    id: int
+    username: str
+    used: int
+    files: int
+    quota: Optional[int]
+
 # Helper functions
-def verify_password(plain_password, hashed_password):
-    """Verify a plain password against a hashed password."""
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    """Verify a plain password against a hashed password on the hashing pool."""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, please retry",
+            headers={"Retry-After": "1"},
+        )
 
-def get_password_hash(password):
-    """Hash a password using bcrypt."""
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    """Hash a password using bcrypt on the hashing pool."""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many registrations in progress, please retry",
+            headers={"Retry-After": "1"},
+        )
 
-def get_user(db: Session, username: str):
+async def get_user(db: AsyncSession, username: str):
     """Retrieve a user from the database by username."""
-    return db.query(User).filter(User.username == username).first()
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
 
-def create_user(db: Session, user: UserCreate):
+async def create_user(db: AsyncSession, user: UserCreate):
     """Create a new user in the database."""
     db_user = User(
         username=user.username,
         email=user.email,
-        password_hash=get_password_hash(user.password),
+        password_hash=await get_password_hash(user.password),
         role=user.role
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-def authenticate_user(db: Session, username: str, password: str):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
     """Authenticate a user by username and password."""
-    user = get_user(db, username)
+    user = await get_user(db, username)
     if not user:
         return False
-    if not verify_password(password, user.password_hash):
+    if not await verify_password(password, user.password_hash):
         return False
     return user
 
@@ -105,92 +150,86 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None, u
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm="HS256")
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(db.get_db)):
-    """Get the current user from the token."""
-    if not check_token_validity(token):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    token_data = decode_token(token)
-    user = get_user(db, username=token_data.username)
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return user
+def credentials_exception(detail: str = "Could not validate credentials") -> HTTPException:
+    """401 response asking the client to authenticate again."""
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def decode_access_token(token: str) -> TokenData:
+    """
+    Decode and verify a JWT access token, caching the result.
+
+    Verified tokens are cached until they expire (or AUTH_CACHE_TTL passes),
+    so repeat requests with the same token skip signature verification.
+    """
+    token_data = token_cache.get(token)
+    if token_data is not None:
+        return token_data
 
-def get_user_from_token(token: str, db: Session):
-    """Extract user from JWT token"""
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user = get_user(db, username=username)
-        if user is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        
+    except JWTError:
+        raise credentials_exception()
+
+    username: str = payload.get("sub")
+    if username is None:
+        raise credentials_exception("Invalid token content")
+
+    token_data = TokenData(username=username, role=payload.get("role"))
+    exp = payload.get("exp")
+    ttl = exp - datetime.now(timezone.utc).timestamp() if exp is not None else None
+    token_cache.set(token, token_data, ttl=ttl)
+    return token_data
+
+async def load_user(db: AsyncSession, username: str) -> Optional[CurrentUser]:
+    """
+    Load the authenticated user, caching it by username.
+
+    Returns a detached snapshot of the user row, or None if there is no such user.
+    """
+    user = user_cache.get(username)
+    if user is not None:
         return user
-    except JWTError as e:
-        raise HTTPException(status_code=401, detail=f"Could not validate credentials: {str(e)}")
+
+    db_user = await get_user(db, username)
+    if db_user is None:
+        return None
+
+    user = CurrentUser.model_validate(db_user)
+    user_cache.set(username, user)
+    return user
+
+def invalidate_user(username: str):
+    """Drop a user from the authentication cache, e.g. after deleting it."""
+    user_cache.pop(username)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(db.get_async_db)):
+    """
+    Get the current user from the token.
+
+    This is the single authentication dependency: the token is decoded once
+    per request and both the verified token and the user are served from
+    an in-process cache when possible.
+    """
+    token_data = decode_access_token(token)
+    user = await load_user(db, token_data.username)
+    if user is None:
+        raise credentials_exception("User not found")
+    return user
 
 def require_role(required_role: str):
     """Dependency to check if the user has the required role."""
-    def role_checker(token: str = Depends(oauth2_scheme), db: Session = Depends(db.get_db)):
-        if not check_token_validity(token):
+    async def role_checker(user: CurrentUser = Depends(get_current_user)):
+        # Check if the user has the required role
+        # If not, raise an HTTPException
+        if user.role != required_role:
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        try:
-            # Decode the token to get the payload
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-            
-            # Extract the username and role from the payload
-            username: str = payload.get("sub")
-            user_role: str = payload.get("role")
-            
-            # Check if the username and role are present
-            # If not, raise an HTTPException
-            if not username or not user_role:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid token content",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
-                
-            # Check if the user has the required role
-            # If not, raise an HTTPException
-            if user_role != required_role:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=f"Role '{required_role}' required for this operation",
-                )
-                
-            # If the user has the required role, retrieve the user from the database
-            user = get_user(db, username=username)
-            if not user:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="User not found",
-                )
-            
-            # Return the user object
-            return user
-        # Handle JWTError if the token is invalid
-        except JWTError:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Role '{required_role}' required for this operation",
             )
+        return user
     
     return role_checker
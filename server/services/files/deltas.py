@@ -0,0 +1,249 @@
+# services/file/deltas.py
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Tuple
+import json
+import os
+import re
+import uuid
+
+from ...utils import Database, blob_store
+from ...config import settings
+from ...utils.chunking import CHUNKING, MAX_BLOCK_SIZE
+from ...models.models import DeltaSession, File
+from ..auth.services import CurrentUser, get_current_user
+from .services import (
+    FileUploadResponse,
+    DeltaSessionCreate,
+    DeltaSessionResponse,
+    save_stream,
+    save_file_record,
+    check_quota,
+    assemble_blocks,
+    file_sha256,
+    remove_dir
+)
+
+
+router = APIRouter()
+
+# Blocks uploaded for in-progress delta uploads are kept in their own directory per session
+DELTA_FOLDER = os.path.join(settings.UPLOAD_FOLDER, "deltas")
+
+# Blocks are named by their SHA-256 hash
+BLOCK_HASH = re.compile(r"^[0-9a-f]{64}$")
+
+def delta_dir(session_id: str) -> str:
+    """Directory holding the uploaded blocks of a delta upload."""
+    return os.path.join(DELTA_FOLDER, session_id)
+
+def block_path(session_id: str, block_hash: str) -> str:
+    """Path of a single uploaded block."""
+    return os.path.join(delta_dir(session_id), block_hash)
+
+def declared_blocks(delta_session: DeltaSession) -> List[Tuple[str, int]]:
+    """Hash and size of every block of the new version."""
+    return [tuple(block) for block in json.loads(delta_session.blocks)]
+
+def base_offsets(base_blocks: List[Tuple[int, int, str]]) -> Dict[str, int]:
+    """Offset of every block of the previous version by hash."""
+    return {block_hash: start for start, _, block_hash in base_blocks}
+
+def missing_blocks(delta_session: DeltaSession, offsets: Dict[str, int]) -> List[str]:
+    """Hashes of the blocks that are neither in the previous version nor uploaded yet."""
+    missing = []
+    for block_hash, _ in declared_blocks(delta_session):
+        if block_hash not in offsets and block_hash not in missing and not os.path.exists(block_path(delta_session.id, block_hash)):
+            missing.append(block_hash)
+    return missing
+
+async def get_owned_delta(db: AsyncSession, session_id: str, user) -> DeltaSession:
+    """Retrieve a delta upload owned by the user or raise 404."""
+    result = await db.execute(select(DeltaSession).where(
+        DeltaSession.id == session_id,
+        DeltaSession.owner_id == user.id
+    ))
+    delta_session = result.scalars().first()
+
+    if not delta_session:
+        raise HTTPException(status_code=404, detail="Delta upload not found")
+    return delta_session
+
+async def get_base_offsets(db: AsyncSession, delta_session: DeltaSession) -> Dict[str, int]:
+    """Blocks of the version a delta upload is based on, or 409 if it is gone."""
+    base = await blob_store.get(db, delta_session.base_hash)
+    if base is None or not await run_in_threadpool(blob_store.exists, base.hash, base.locations):
+        raise HTTPException(status_code=409, detail="The previous version of the file no longer exists")
+    return base_offsets(await blob_store.blocks(db, delta_session.base_hash))
+
+def delta_response(delta_session: DeltaSession, offsets: Dict[str, int]) -> DeltaSessionResponse:
+    """Build the response model describing the blocks a delta upload still needs."""
+    return DeltaSessionResponse(
+        session_id=delta_session.id,
+        file_name=delta_session.file_name,
+        missing=missing_blocks(delta_session, offsets)
+    )
+
+@router.post('', response_model=DeltaSessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_delta(
+    data: DeltaSessionCreate,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """
+    Start uploading a new version of an existing file as a delta
+
+    The client splits the new version into content-defined blocks (see
+    GET /files/blocks) and lists their hashes. The response lists the blocks
+    the server does not have in the current version, which are the only ones
+    that need to be uploaded.
+    """
+    if data.chunking != CHUNKING:
+        raise HTTPException(status_code=400, detail=f"Unsupported chunking '{data.chunking}', expected '{CHUNKING}'")
+    for block in data.blocks:
+        if not BLOCK_HASH.match(block.hash) or block.size <= 0 or block.size > MAX_BLOCK_SIZE:
+            raise HTTPException(status_code=400, detail="Invalid block")
+    if sum(block.size for block in data.blocks) != data.size:
+        raise HTTPException(status_code=400, detail="Block sizes do not add up to the file size")
+
+    # The delta is applied to the current version of the user's file
+    result = await db.execute(select(File).where(
+        File.owner_id == user.id,
+        File.file_name == data.file_name
+    ))
+    file = result.scalars().first()
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+    if file.blob_hash != data.base_checksum.lower():
+        raise HTTPException(status_code=409, detail="The file has changed on the server")
+    await check_quota(db, user.id, data.file_name, data.size)
+
+    delta_session = DeltaSession(
+        id=uuid.uuid4().hex,
+        owner_id=user.id,
+        file_name=data.file_name,
+        base_hash=file.blob_hash,
+        size=data.size,
+        checksum=data.checksum.lower(),
+        blocks=json.dumps([[block.hash, block.size] for block in data.blocks])
+    )
+    offsets = await get_base_offsets(db, delta_session)
+    os.makedirs(delta_dir(delta_session.id), exist_ok=True)
+    db.add(delta_session)
+    await db.commit()
+
+    return delta_response(delta_session, offsets)
+
+@router.get('/{session_id}', response_model=DeltaSessionResponse)
+async def get_delta(
+    session_id: str,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """Get a delta upload and the blocks still missing"""
+    delta_session = await get_owned_delta(db, session_id, user)
+    return delta_response(delta_session, await get_base_offsets(db, delta_session))
+
+@router.put('/{session_id}/blocks/{block_hash}', status_code=status.HTTP_204_NO_CONTENT)
+async def upload_block(
+    session_id: str,
+    block_hash: str,
+    request: Request,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """
+    Upload a single block of a delta upload
+
+    The request body is the raw block, which must match its hash.
+    """
+    delta_session = await get_owned_delta(db, session_id, user)
+
+    sizes = dict(declared_blocks(delta_session))
+    if block_hash not in sizes:
+        raise HTTPException(status_code=400, detail="Block is not part of this upload")
+
+    path = block_path(session_id, block_hash)
+    os.makedirs(delta_dir(session_id), exist_ok=True)
+
+    # Don't hold a database connection while the client sends the body
+    await db.commit()
+    try:
+        size = await save_stream(request.stream(), path, sizes[block_hash])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if size != sizes[block_hash] or await run_in_threadpool(file_sha256, path) != block_hash:
+        os.remove(path)
+        raise HTTPException(status_code=400, detail="Block does not match its hash")
+    return None
+
+@router.post('/{session_id}/commit', response_model=FileUploadResponse)
+async def commit_delta(
+    session_id: str,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """Assemble the new version of the file from its previous version and the uploaded blocks"""
+    delta_session = await get_owned_delta(db, session_id, user)
+    offsets = await get_base_offsets(db, delta_session)
+    base = await blob_store.get(db, delta_session.base_hash)
+
+    if missing_blocks(delta_session, offsets):
+        raise HTTPException(status_code=409, detail="Upload incomplete, blocks are missing")
+
+    blocks = declared_blocks(delta_session)
+    try:
+        # Assemble the blocks into a temporary file
+        temp_path = blob_store.temp_path()
+        file_size, checksum = await run_in_threadpool(
+            assemble_blocks, blocks, delta_dir(session_id), delta_session.base_hash, base.locations, offsets, temp_path
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
+
+    if file_size != delta_session.size or checksum != delta_session.checksum:
+        os.remove(temp_path)
+        raise HTTPException(status_code=400, detail="Checksum mismatch, the assembled file is corrupt")
+
+    # Move the content into the blob store and remember its blocks for the next delta
+    await blob_store.add(db, temp_path, checksum, file_size)
+    new_blocks = []
+    start = 0
+    for block_hash, block_size in blocks:
+        new_blocks.append((start, block_size, block_hash))
+        start += block_size
+    await blob_store.save_blocks(db, checksum, new_blocks)
+
+    # Save file metadata to database and drop the session
+    db_file = await save_file_record(db, user.id, delta_session.file_name, checksum, file_size)
+    await db.delete(delta_session)
+    await db.commit()
+
+    await run_in_threadpool(remove_dir, delta_dir(session_id))
+
+    return {
+        "message": "File uploaded successfully",
+        "file_id": db_file.id,
+        "filename": delta_session.file_name,
+        "content_type": "application/octet-stream",
+        "size": file_size,
+        "checksum": checksum
+    }
+
+@router.delete('/{session_id}', status_code=status.HTTP_204_NO_CONTENT)
+async def abort_delta(
+    session_id: str,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """Abort a delta upload and discard its blocks"""
+    delta_session = await get_owned_delta(db, session_id, user)
+
+    await db.delete(delta_session)
+    await db.commit()
+
+    await run_in_threadpool(remove_dir, delta_dir(session_id))
+    return None
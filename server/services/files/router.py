@@ -1,89 +1,197 @@
 # services/file/router.py
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Request, Response, status
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from datetime import datetime
 import os
-import uuid
 
-from ...utils import Database
-from ...models.models import File
-from ..auth.services import get_user_from_token
+from ...utils import CHUNKING, Database, blob_store, ranged_file_response
+from ...models.models import Blob, File
+from ..auth.services import CurrentUser, get_current_user
 from .services import (
     FileUploadResponse,
     FileDownload,
-    FileListResponse
+    FileListResponse,
+    FileListQuery,
+    file_list_query,
+    apply_file_list_query,
+    next_cursor,
+    save_file_record,
+    BlobResponse,
+    FileBlocksResponse,
+    FileLinkRequest,
+    StorageUsageResponse,
+    check_quota,
+    quota_exceeded,
+    get_usage,
+    update_usage,
+    save_upload_file
 )
+from .sessions import router as sessions_router
+from .deltas import router as deltas_router
 
 
 router = APIRouter()
-security = HTTPBearer()
+
+# Resumable chunked uploads live under /files/sessions
+router.include_router(sessions_router, prefix='/sessions')
+
+# Uploads of new file versions that only send the changed blocks live under /files/deltas
+router.include_router(deltas_router, prefix='/deltas')
 
 @router.post('/upload', response_model=FileUploadResponse)
 async def upload(
     file: UploadFile = File(),  
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(Database.get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
 ):
     """Upload a file"""
-    token = credentials.credentials
-    
+    # Refuse the upload before storing anything if the user has no space left,
+    # and stop storing it as soon as it outgrows the space there is
+    max_size = await check_quota(db, user.id, file.filename)
     try:
-        # Get user from token
-        user = get_user_from_token(token, db)
-        
-        # Read file content
-        contents = await file.read()
-        file_size = len(contents)
-
-        # Create a unique filename with UUID
-        original_filename = file.filename
-        file_extension = os.path.splitext(original_filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-
-        # Save file to disk in user-specific folder
-        upload_dir = os.path.join("uploads", str(user.id))
-        os.makedirs(upload_dir, exist_ok=True)
-        file_path = os.path.join(upload_dir, unique_filename)
+        # Stream the file to a temporary file, computing size and checksum on the fly
+        temp_path = blob_store.temp_path()
+        try:
+            file_size, checksum = await save_upload_file(file, temp_path, max_size=max_size)
+        except ValueError:
+            raise quota_exceeded()
+
+        # Move the content into the blob store, deduplicating identical content
+        await blob_store.add(db, temp_path, checksum, file_size)
         
-        with open(file_path, "wb") as f:
-            f.write(contents)
-        
-        # Save file metadata to database
-        db_file = File(
-            owner_id=str(user.id),
-            file_name=file.filename,
-            path=file_path,
-            size=file_size
-        )
-        db.add(db_file)
-        db.commit()
+        # Save file metadata to database, replacing an existing file with the same name
+        db_file = await save_file_record(db, user.id, file.filename, checksum, file_size)
+        await db.commit()
         
         return {
             "message": f"File uploaded successfully",
+            "file_id": db_file.id,
             "filename": file.filename,
             "content_type": file.content_type,
-            "size": file_size
+            "size": file_size,
+            "checksum": checksum
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 
+@router.get('/blobs/{blob_hash}', response_model=BlobResponse)
+async def get_blob(
+    blob_hash: str,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """
+    Check whether the server already stores content with the given SHA-256 hash
+
+    Lets clients skip sending bytes the server already has and create the file
+    with /files/link instead.
+    """
+    blob = await blob_store.get(db, blob_hash.lower())
+    if not blob or not await run_in_threadpool(blob_store.exists, blob.hash, blob.locations):
+        raise HTTPException(status_code=404, detail="Content not found")
+    return {"hash": blob.hash, "size": blob.size}
+
+@router.post('/link', response_model=FileUploadResponse)
+async def link(
+    data: FileLinkRequest,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """Create a file from content the server already stores, without uploading it"""
+
+    blob_hash = data.hash.lower()
+    blob = await blob_store.get(db, blob_hash)
+    if (
+        blob is None
+        or not await run_in_threadpool(blob_store.exists, blob_hash, blob.locations)
+        or not await blob_store.acquire(db, blob_hash)
+    ):
+        raise HTTPException(status_code=404, detail="Content not found")
+
+    db_file = await save_file_record(db, user.id, data.file_name, blob.hash, blob.size)
+    await db.commit()
+
+    return {
+        "message": "File uploaded successfully",
+        "file_id": db_file.id,
+        "filename": data.file_name,
+        "content_type": "application/octet-stream",
+        "size": blob.size,
+        "checksum": blob.hash
+    }
+
+@router.get('/usage', response_model=StorageUsageResponse)
+async def usage(
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """Get the total size and number of the user's files and their storage quota"""
+    return await get_usage(db, user.id)
+
+@router.get('/blocks', response_model=FileBlocksResponse)
+async def get_blocks(
+    file_name: str,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """
+    List the content-defined blocks of a file
+
+    Clients split their own copy of the file the same way and compare block
+    hashes, so only the blocks that differ need to be transferred: changed
+    blocks are downloaded with Range requests or uploaded with /files/deltas.
+    """
+    result = await db.execute(
+        select(File, Blob.locations)
+        .outerjoin(Blob, Blob.hash == File.blob_hash)
+        .where(File.owner_id == user.id, File.file_name == file_name)
+    )
+    row = result.first()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="File not found")
+    file, locations = row
+    if not await run_in_threadpool(blob_store.exists, file.blob_hash, locations):
+        raise HTTPException(status_code=404, detail="File not found on server")
+
+    blocks = await blob_store.blocks(db, file.blob_hash)
+    await db.commit()
+
+    return {
+        "file_name": file.file_name,
+        "size": file.size,
+        "checksum": file.blob_hash,
+        "chunking": CHUNKING,
+        "blocks": [{"start": start, "size": size, "hash": block_hash} for start, size, block_hash in blocks]
+    }
+
 @router.get('/list', response_model=List[FileListResponse])
 async def list_files(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(Database.get_db)
+    response: Response,
+    query: FileListQuery = Depends(file_list_query),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
 ):
-    """List all files belonging to the authenticated user"""
-    token = credentials.credentials
-    
+    """
+    List files belonging to the authenticated user
+
+    Results are paginated with a cursor: when more files match, the
+    `X-Next-Cursor` response header holds the `cursor` for the next page.
+    """
     try:
-        # Get user from token
-        user = get_user_from_token(token, db)
-        
-        # Query database for files owned by this user
-        files = db.query(File).filter(File.owner_id == str(user.id)).all()
+        # Query database for one page of files owned by this user
+        stmt = apply_file_list_query(select(File).where(File.owner_id == user.id), query)
+        result = await db.execute(stmt)
+        files = result.scalars().all()
+
+        cursor = next_cursor(files, query)
+        if cursor:
+            response.headers["X-Next-Cursor"] = cursor
         
         # Format response
         return [
@@ -91,77 +199,92 @@ async def list_files(
                 "id": file.id,
                 "name": file.file_name,
                 "size": file.size,
+                "checksum": file.blob_hash,
                 "timestamp": file.timestamp
-            } for file in files
+            } for file in files[:query.limit]
         ]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
 
-@router.get('/download')
+@router.api_route('/download', methods=['GET', 'HEAD'])
 async def download(
     file_name: str,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(Database.get_db)
+    request: Request,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
 ):
-    """Download a file"""
-    token = credentials.credentials
-    
+    """
+    Download a file
+
+    Supports single and multi-range requests (Range / If-Range) and
+    conditional requests (If-None-Match / If-Modified-Since). The ETag is
+    the SHA-256 checksum of the file content. Files stored compressed are
+    sent as they are stored, with Content-Encoding, to clients that accept
+    the encoding.
+    """
     try:
-        # Get user from token
-        user = get_user_from_token(token, db)
-        
-        # Find the file in database
-        file = db.query(File).filter(
-            File.owner_id == str(user.id),
-            File.file_name == file_name
-        ).first()
+        # Find the file in database, with the storage roots holding its content
+        result = await db.execute(
+            select(File, Blob.locations)
+            .outerjoin(Blob, Blob.hash == File.blob_hash)
+            .where(File.owner_id == user.id, File.file_name == file_name)
+        )
+        row = result.first()
         
-        if not file:
+        if not row:
             raise HTTPException(status_code=404, detail="File not found")
+        file, locations = row
         
         # Return the file
-        if os.path.exists(file.path):
-            return FileResponse(
-                path=file.path,
+        # Checking and opening replicas may wait on a remote storage root, so
+        # it stays off the event loop
+        if await run_in_threadpool(blob_store.exists, file.blob_hash, locations):
+            return ranged_file_response(
+                request,
+                opener=lambda: blob_store.open(file.blob_hash, locations),
+                size=file.size,
+                encoded=await run_in_threadpool(blob_store.encoded, file.blob_hash, locations),
                 filename=file.file_name,
-                media_type="application/octet-stream"
+                etag=f'"{file.blob_hash}"',
+                last_modified=file.timestamp
             )
         else:
             # File exists in DB but not on disk
             raise HTTPException(status_code=404, detail="File not found on server")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File download failed: {str(e)}")
 
 @router.delete('/{file_id}')
 async def delete(
     file_id: int,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(Database.get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
 ):
     """Delete a file"""
-    token = credentials.credentials
-    
     try:
-        # Get user from token
-        user = get_user_from_token(token, db)
-        
         # Find the file in database
-        file = db.query(File).filter(
-            File.owner_id == str(user.id),
+        result = await db.execute(select(File).where(
+            File.owner_id == user.id,
             File.id == file_id
-        ).first()
+        ))
+        file = result.scalars().first()
         
         if not file:
             raise HTTPException(status_code=404, detail="File not found")
         
-        # Delete the file from disk
-        if os.path.exists(file.path):
-            os.remove(file.path)
-        
-        # Delete the file from database
-        db.delete(file)
-        db.commit()
+        # Delete the file from database and drop its reference to the content,
+        # which is removed in the background once no other file uses it
+        await db.delete(file)
+        await blob_store.release(db, file.blob_hash)
+        await update_usage(db, user.id, -file.size, -1)
+        await db.commit()
         
         return {"message": f"File with file_id {file_id} deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File deletion failed: {str(e)}")
@@ -1,18 +1,37 @@
 # services/file/services.py
-from fastapi import UploadFile, HTTPException
+from fastapi import UploadFile, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timezone
+import base64
+import hashlib
+import json
 import os
-from typing import Dict, Any
+import shutil
+import tempfile
+from typing import AsyncIterator, Dict, Any, List, Literal, Optional, Tuple
 
 from ...config import settings
+from ...models.models import File, User
+from ...utils import blob_store
 
 class FileUploadResponse(BaseModel):
     """Model for file upload response."""
     message: str
+    file_id: int
     filename: str
     content_type: str
     size: int
+    checksum: str
+
+class StorageUsageResponse(BaseModel):
+    """Model for a user's storage usage; quota and available are None without a quota."""
+    used: int
+    files: int
+    quota: Optional[int]
+    available: Optional[int]
 
 class FileDownload(BaseModel):
     """Model for file download response."""
@@ -23,37 +42,455 @@ class FileListResponse(BaseModel):
     id: int
     name: str
     size: int
+    checksum: str
     timestamp: datetime
- 
 
-async def upload_file(file: UploadFile, user_data: Dict[str, Any]) -> FileUploadResponse:
-    """Upload a file to the server."""
+class FileBlock(BaseModel):
+    """Model for one content-defined block of a file."""
+    start: int
+    size: int
+    hash: str
+
+class FileBlocksResponse(BaseModel):
+    """Model for the blocks of a file, used for delta transfers."""
+    file_name: str
+    size: int
+    checksum: str
+    chunking: str
+    blocks: List[FileBlock]
+
+class DeltaBlock(BaseModel):
+    """Model for one block of a new file version in a delta upload."""
+    hash: str
+    size: int
+
+class DeltaSessionCreate(BaseModel):
+    """Model for starting a delta upload of a new version of an existing file."""
+    file_name: str
+    base_checksum: str
+    size: int
+    checksum: str
+    chunking: str
+    blocks: List[DeltaBlock]
+
+class DeltaSessionResponse(BaseModel):
+    """Model for a delta upload and the blocks the server still needs."""
+    session_id: str
+    file_name: str
+    missing: List[str]
+
+class FileListQuery(BaseModel):
+    """Pagination, sorting and filtering options for file listings."""
+    limit: int = 100
+    cursor: Optional[str] = None
+    sort: Literal["id", "name", "size", "timestamp"] = "id"
+    order: Literal["asc", "desc"] = "asc"
+    name_prefix: Optional[str] = None
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+
+class BlobResponse(BaseModel):
+    """Model for a stored content blob."""
+    hash: str
+    size: int
+
+class FileLinkRequest(BaseModel):
+    """Model for creating a file from content the server already stores."""
+    file_name: str
+    hash: str
+
+class UploadSessionCreate(BaseModel):
+    """Model for creating a resumable upload session."""
+    file_name: str
+    size: int
+    chunk_size: Optional[int] = None
+    checksum: Optional[str] = None
+
+class UploadSessionResponse(BaseModel):
+    """Model for upload session state."""
+    session_id: str
+    file_name: str
+    size: int
+    chunk_size: int
+    total_chunks: int
+    received: List[int]
+
+class ChunkUploadResponse(BaseModel):
+    """Model for a stored upload session chunk."""
+    index: int
+    size: int
+
+
+# Columns file listings can be sorted by
+SORT_COLUMNS = {
+    "id": File.id,
+    "name": File.file_name,
+    "size": File.size,
+    "timestamp": File.timestamp,
+}
+
+# Types of the sort column values cursors carry
+CURSOR_VALUE_TYPES = {
+    "id": int,
+    "name": str,
+    "size": int,
+    "timestamp": datetime,
+}
+
+def file_list_query(
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of files per page"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value of the previous page"),
+    sort: Literal["id", "name", "size", "timestamp"] = Query("id"),
+    order: Literal["asc", "desc"] = Query("asc"),
+    name_prefix: Optional[str] = Query(None, description="Only files whose name starts with this"),
+    min_size: Optional[int] = Query(None, ge=0),
+    max_size: Optional[int] = Query(None, ge=0),
+    since: Optional[datetime] = Query(None, description="Only files uploaded at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only files uploaded before this time"),
+) -> FileListQuery:
+    """Dependency collecting the listing query parameters."""
+    return FileListQuery(
+        limit=limit, cursor=cursor, sort=sort, order=order, name_prefix=name_prefix,
+        min_size=min_size, max_size=max_size, since=since, until=until
+    )
+
+def encode_cursor(sort: str, value: Any, file_id: int) -> str:
+    """Encode the position after a row as an opaque cursor."""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, file_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, int]:
+    """
+    Decode a cursor produced by `encode_cursor`.
+
+    Raises:
+        HTTPException: If the cursor is malformed or was made for another sort
+    """
     try:
-        # Read file content
-        contents = await file.read()
-        file_size = len(contents)
-        
-        # Make upload directory if it doesn't exist
-        upload_dir = settings.UPLOAD_FOLDER
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Create user-specific directory
-        username = user_data.get("sub")
-        user_folder = os.path.join(upload_dir, username)
-        os.makedirs(user_folder, exist_ok=True)
-        
-        # Save the file to the user's directory
-        file_path = os.path.join(user_folder, file.filename)
-        with open(file_path, "wb") as f:
-            f.write(contents)
-        
-        # Return FileUploadResponse
-        return FileUploadResponse(
-            message="File uploaded successfully",
-            filename=file.filename,
-            content_type=file.content_type,
-            size=file_size
-        )
-    # Handle exceptions during file upload
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, file_id = json.loads(raw)
+        if cursor_sort == "timestamp":
+            value = datetime.fromisoformat(value)
+        # The values end up compared with the columns in SQL
+        if not isinstance(file_id, int) or not isinstance(value, CURSOR_VALUE_TYPES.get(cursor_sort, ())):
+            raise ValueError("Cursor values don't match their columns")
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match the sort order")
+    return value, file_id
+
+def apply_file_list_query(stmt, query: FileListQuery):
+    """
+    Apply filters, sorting and keyset pagination to a select of File.
+
+    Pages are located with a (sort column, id) comparison instead of OFFSET,
+    so every page costs the same no matter how deep into the listing it is.
+    One row more than the limit is fetched to tell whether a next page exists.
+    """
+    if query.name_prefix:
+        stmt = stmt.where(File.file_name.startswith(query.name_prefix, autoescape=True))
+    if query.min_size is not None:
+        stmt = stmt.where(File.size >= query.min_size)
+    if query.max_size is not None:
+        stmt = stmt.where(File.size <= query.max_size)
+    if query.since is not None:
+        stmt = stmt.where(File.timestamp >= query.since)
+    if query.until is not None:
+        stmt = stmt.where(File.timestamp < query.until)
+
+    column = SORT_COLUMNS[query.sort]
+    if query.cursor:
+        value, file_id = decode_cursor(query.cursor, query.sort)
+        if query.sort == "id":
+            position = column > file_id if query.order == "asc" else column < file_id
+        elif query.order == "asc":
+            position = tuple_(column, File.id) > tuple_(value, file_id)
+        else:
+            position = tuple_(column, File.id) < tuple_(value, file_id)
+        stmt = stmt.where(position)
+
+    if query.order == "asc":
+        stmt = stmt.order_by(column.asc(), File.id.asc())
+    else:
+        stmt = stmt.order_by(column.desc(), File.id.desc())
+    return stmt.limit(query.limit + 1)
+
+def next_cursor(files: List[File], query: FileListQuery) -> Optional[str]:
+    """Cursor for the page after `files`, or None if this was the last page."""
+    if len(files) <= query.limit:
+        return None
+    last = files[query.limit - 1]
+    value = {"id": last.id, "name": last.file_name, "size": last.size, "timestamp": last.timestamp}[query.sort]
+    return encode_cursor(query.sort, value, last.id)
+
+def effective_quota(quota: Optional[int]) -> Optional[int]:
+    """Bytes a user with the given quota setting may store, None for no limit."""
+    if quota is not None:
+        return quota
+    return settings.STORAGE_QUOTA or None
+
+def quota_exceeded() -> HTTPException:
+    """Error for uploads that don't fit in the user's storage quota."""
+    return HTTPException(status_code=413, detail="Storage quota exceeded")
+
+async def get_usage(db: AsyncSession, user_id: int) -> StorageUsageResponse:
+    """Storage used by a user, read from the counters kept on the user row."""
+    result = await db.execute(
+        select(User.storage_used, User.file_count, User.storage_quota).where(User.id == user_id)
+    )
+    used, files, quota = result.one()
+    quota = effective_quota(quota)
+    return StorageUsageResponse(
+        used=used,
+        files=files,
+        quota=quota,
+        available=None if quota is None else max(0, quota - used)
+    )
+
+async def check_quota(
+    db: AsyncSession,
+    user_id: int,
+    file_name: str,
+    size: Optional[int] = None
+) -> Optional[int]:
+    """
+    Check that a user has room for a new version of `file_name` before its
+    bytes are received. The size of the file it replaces, if any, counts as
+    free space.
+
+    Returns:
+        Optional[int]: Largest size the file can have, None if there is no limit
+
+    Raises:
+        HTTPException: If the file doesn't fit, or when the size isn't known yet, if nothing fits
+    """
+    usage = await get_usage(db, user_id)
+    if usage.quota is None:
+        return None
+    replaced = await db.scalar(select(File.size).where(File.owner_id == user_id, File.file_name == file_name))
+    remaining = usage.quota - usage.used + (replaced or 0)
+    if remaining < 0 or (size is not None and size > remaining):
+        raise quota_exceeded()
+    return remaining
+
+async def update_usage(db: AsyncSession, owner_id: int, size: int, files: int = 0):
+    """
+    Add to a user's usage counters in the current transaction.
+
+    The counters are updated in place, so concurrent uploads of the same user
+    wait for each other's row lock and none of them is lost.
+
+    Raises:
+        HTTPException: If the usage grows beyond the user's quota
+    """
+    await db.execute(
+        update(User)
+        .where(User.id == owner_id)
+        .values(storage_used=User.storage_used + size, file_count=User.file_count + files)
+    )
+    if size > 0:
+        usage = await get_usage(db, owner_id)
+        if usage.quota is not None and usage.used > usage.quota:
+            raise quota_exceeded()
+
+async def save_file_record(
+    db: AsyncSession,
+    owner_id: int,
+    file_name: str,
+    blob_hash: str,
+    size: int
+) -> File:
+    """
+    Create a file row for newly stored content.
+
+    File names are unique per user, so uploading a name that already exists
+    replaces that file's content. The caller must already hold a reference
+    to `blob_hash`.
+
+    Raises:
+        HTTPException: If the file doesn't fit in the owner's storage quota
+    """
+    result = await db.execute(
+        select(File).where(File.owner_id == owner_id, File.file_name == file_name).with_for_update()
+    )
+    file = result.scalars().first()
+
+    if file is None:
+        file = File(owner_id=owner_id, file_name=file_name, blob_hash=blob_hash, size=size)
+        db.add(file)
+        await update_usage(db, owner_id, size, 1)
+        return file
+
+    # Point the existing file at the new content and drop the old content
+    old_hash = file.blob_hash
+    await update_usage(db, owner_id, size - file.size)
+    file.blob_hash = blob_hash
+    file.size = size
+    file.timestamp = datetime.now(timezone.utc)
+    await blob_store.release(db, old_hash)
+    return file
+
+def _write_chunk(f, hasher, chunk: bytes):
+    """Hash and write a single chunk (runs in the threadpool)."""
+    hasher.update(chunk)
+    f.write(chunk)
+
+async def save_upload_file(
+    file: UploadFile,
+    destination: str,
+    chunk_size: int = settings.UPLOAD_CHUNK_SIZE,
+    max_size: Optional[int] = None
+) -> Tuple[int, str]:
+    """
+    Stream an uploaded file to disk in bounded chunks.
+
+    The file is read `chunk_size` bytes at a time and every chunk is hashed and
+    written in the threadpool, so memory use stays constant regardless of the
+    file size and the event loop is never blocked by disk I/O.
+
+    Returns:
+        Tuple[int, str]: Number of bytes written and the SHA-256 hex digest
+
+    Raises:
+        ValueError: If the file is longer than `max_size` bytes
+    """
+    hasher = hashlib.sha256()
+    file_size = 0
+
+    f = await run_in_threadpool(open, destination, "wb")
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            if max_size is not None and file_size + len(chunk) > max_size:
+                raise ValueError(f"File exceeds the maximum size of {max_size} bytes")
+            await run_in_threadpool(_write_chunk, f, hasher, chunk)
+            file_size += len(chunk)
+    except BaseException:
+        # Don't leave partially written files behind
+        f.close()
+        if os.path.exists(destination):
+            os.remove(destination)
+        raise
+    await run_in_threadpool(f.close)
+
+    return file_size, hasher.hexdigest()
+
+async def save_stream(
+    stream: AsyncIterator[bytes],
+    destination: str,
+    max_size: int
+) -> int:
+    """
+    Stream an async byte iterator (e.g. a request body) to disk.
+
+    Data is written to a temporary `.part` file that is renamed into place
+    only once the whole stream has been received, so a half-written
+    destination is never visible to readers. Each call gets its own
+    temporary file, so concurrent uploads to the same destination (e.g. a
+    retried chunk) can't write into each other's.
+
+    Raises:
+        ValueError: If the stream is longer than `max_size` bytes
+    """
+    directory, name = os.path.split(destination)
+    fd, part_path = await run_in_threadpool(tempfile.mkstemp, prefix=f"{name}.", suffix=".part", dir=directory or None)
+    size = 0
+
+    f = os.fdopen(fd, "wb")
+    try:
+        async for chunk in stream:
+            size += len(chunk)
+            if size > max_size:
+                raise ValueError(f"Chunk exceeds expected size of {max_size} bytes")
+            await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        f.close()
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    await run_in_threadpool(f.close)
+
+    os.replace(part_path, destination)
+    return size
+
+def assemble_chunks(
+    chunk_paths: List[str],
+    destination: str,
+    chunk_size: int = settings.UPLOAD_CHUNK_SIZE
+) -> Tuple[int, str]:
+    """
+    Concatenate chunk files into `destination`, hashing on the way.
+
+    This is blocking and is meant to be run in the threadpool.
+
+    Returns:
+        Tuple[int, str]: Number of bytes written and the SHA-256 hex digest
+    """
+    hasher = hashlib.sha256()
+    file_size = 0
+
+    try:
+        with open(destination, "wb") as out:
+            for chunk_path in chunk_paths:
+                with open(chunk_path, "rb") as src:
+                    for block in iter(lambda: src.read(chunk_size), b""):
+                        _write_chunk(out, hasher, block)
+                        file_size += len(block)
+    except BaseException:
+        if os.path.exists(destination):
+            os.remove(destination)
+        raise
+
+    return file_size, hasher.hexdigest()
+
+def assemble_blocks(
+    blocks: List[Tuple[str, int]],
+    block_dir: str,
+    base_hash: str,
+    base_locations: Optional[str],
+    base_blocks: Dict[str, int],
+    destination: str
+) -> Tuple[int, str]:
+    """
+    Build a new version of a file from its blocks.
+
+    Each block is taken from the uploaded blocks in `block_dir` if it was sent,
+    otherwise from the previous version of the file, stored as blob
+    `base_hash` on `base_locations`, where `base_blocks` gives its offset by hash.
+
+    Returns:
+        Tuple[int, str]: Size of the assembled file and its SHA-256 checksum
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    with open(destination, "wb") as out, blob_store.open(base_hash, base_locations) as base:
+        for block_hash, block_size in blocks:
+            uploaded_path = os.path.join(block_dir, block_hash)
+            if os.path.exists(uploaded_path):
+                with open(uploaded_path, "rb") as f:
+                    data = f.read()
+            else:
+                base.seek(base_blocks[block_hash])
+                data = base.read(block_size)
+            _write_chunk(out, hasher, data)
+            size += len(data)
+    return size, hasher.hexdigest()
+
+def file_sha256(path: str) -> str:
+    """SHA-256 checksum of a file on disk."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def remove_dir(path: str):
+    """Remove a directory tree, ignoring it if it is already gone."""
+    shutil.rmtree(path, ignore_errors=True)
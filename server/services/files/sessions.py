@@ -0,0 +1,230 @@
+# services/file/sessions.py
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import math
+import os
+import uuid
+
+from ...utils import Database, blob_store
+from ...config import settings
+from ...models.models import UploadSession
+from ..auth.services import CurrentUser, get_current_user
+from .services import (
+    FileUploadResponse,
+    UploadSessionCreate,
+    UploadSessionResponse,
+    ChunkUploadResponse,
+    save_stream,
+    save_file_record,
+    check_quota,
+    assemble_chunks,
+    remove_dir
+)
+
+
+router = APIRouter()
+
+# Chunks of in-progress sessions are kept in their own directory per session
+SESSION_FOLDER = os.path.join(settings.UPLOAD_FOLDER, "sessions")
+
+def session_dir(session_id: str) -> str:
+    """Directory holding the chunks of an upload session."""
+    return os.path.join(SESSION_FOLDER, session_id)
+
+def chunk_path(session_id: str, index: int) -> str:
+    """Path of a single stored chunk."""
+    return os.path.join(session_dir(session_id), str(index))
+
+def received_chunks(upload_session: UploadSession) -> list:
+    """List the indexes of the chunks that are completely stored on disk."""
+    directory = session_dir(upload_session.id)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        int(name) for name in os.listdir(directory)
+        if name.isdigit() and int(name) < upload_session.total_chunks
+    )
+
+def expected_chunk_size(upload_session: UploadSession, index: int) -> int:
+    """Size of the chunk at `index`; only the last chunk may be shorter."""
+    if index == upload_session.total_chunks - 1:
+        return upload_session.size - index * upload_session.chunk_size
+    return upload_session.chunk_size
+
+async def get_owned_session(db: AsyncSession, session_id: str, user) -> UploadSession:
+    """Retrieve an upload session owned by the user or raise 404."""
+    result = await db.execute(select(UploadSession).where(
+        UploadSession.id == session_id,
+        UploadSession.owner_id == user.id
+    ))
+    upload_session = result.scalars().first()
+
+    if not upload_session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return upload_session
+
+def session_response(upload_session: UploadSession) -> UploadSessionResponse:
+    """Build the response model describing a session's progress."""
+    return UploadSessionResponse(
+        session_id=upload_session.id,
+        file_name=upload_session.file_name,
+        size=upload_session.size,
+        chunk_size=upload_session.chunk_size,
+        total_chunks=upload_session.total_chunks,
+        received=received_chunks(upload_session)
+    )
+
+@router.post('', response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_session(
+    data: UploadSessionCreate,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """Create a resumable upload session"""
+
+    chunk_size = data.chunk_size or settings.UPLOAD_SESSION_CHUNK_SIZE
+    if data.size < 0:
+        raise HTTPException(status_code=400, detail="File size cannot be negative")
+    if chunk_size <= 0 or chunk_size > settings.UPLOAD_SESSION_MAX_CHUNK_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Chunk size must be between 1 and {settings.UPLOAD_SESSION_MAX_CHUNK_SIZE} bytes"
+        )
+    # The size is declared up front, so uploads that can't fit are refused before any chunk is sent
+    await check_quota(db, user.id, data.file_name, data.size)
+
+    upload_session = UploadSession(
+        id=uuid.uuid4().hex,
+        owner_id=user.id,
+        file_name=data.file_name,
+        size=data.size,
+        chunk_size=chunk_size,
+        # An empty file is still uploaded as a single empty chunk
+        total_chunks=max(1, math.ceil(data.size / chunk_size)),
+        checksum=data.checksum
+    )
+    os.makedirs(session_dir(upload_session.id), exist_ok=True)
+    db.add(upload_session)
+    await db.commit()
+
+    return session_response(upload_session)
+
+@router.get('/{session_id}', response_model=UploadSessionResponse)
+async def get_session(
+    session_id: str,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """Get an upload session and the chunks already stored"""
+    upload_session = await get_owned_session(db, session_id, user)
+    return session_response(upload_session)
+
+@router.put('/{session_id}/chunks/{index}', response_model=ChunkUploadResponse)
+async def upload_chunk(
+    session_id: str,
+    index: int,
+    request: Request,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """
+    Upload a single chunk of a session
+
+    The request body is the raw chunk. Chunks can be sent in any order and in
+    parallel; re-sending a chunk replaces the stored copy.
+    """
+    upload_session = await get_owned_session(db, session_id, user)
+
+    if index < 0 or index >= upload_session.total_chunks:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Chunk index must be between 0 and {upload_session.total_chunks - 1}"
+        )
+
+    expected_size = expected_chunk_size(upload_session, index)
+    os.makedirs(session_dir(session_id), exist_ok=True)
+
+    # Receiving the body takes as long as the client needs; don't hold a
+    # database connection meanwhile, nothing below uses it
+    await db.commit()
+
+    try:
+        size = await save_stream(request.stream(), chunk_path(session_id, index), expected_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if size != expected_size:
+        os.remove(chunk_path(session_id, index))
+        raise HTTPException(
+            status_code=400,
+            detail=f"Chunk {index} must be {expected_size} bytes, got {size}"
+        )
+
+    return {"index": index, "size": size}
+
+@router.post('/{session_id}/commit', response_model=FileUploadResponse)
+async def commit_session(
+    session_id: str,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """Assemble the uploaded chunks into a file"""
+    upload_session = await get_owned_session(db, session_id, user)
+
+    missing = sorted(set(range(upload_session.total_chunks)) - set(received_chunks(upload_session)))
+    if missing:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Upload incomplete, missing chunks: {missing}"
+        )
+
+    try:
+        # Assemble the chunks into a temporary file
+        temp_path = blob_store.temp_path()
+        chunk_paths = [chunk_path(session_id, i) for i in range(upload_session.total_chunks)]
+        file_size, checksum = await run_in_threadpool(assemble_chunks, chunk_paths, temp_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
+
+    if upload_session.checksum and upload_session.checksum != checksum:
+        os.remove(temp_path)
+        raise HTTPException(
+            status_code=400,
+            detail="Checksum mismatch, the uploaded chunks are corrupt"
+        )
+
+    # Move the content into the blob store, deduplicating identical content
+    await blob_store.add(db, temp_path, checksum, file_size)
+
+    # Save file metadata to database and drop the session
+    db_file = await save_file_record(db, user.id, upload_session.file_name, checksum, file_size)
+    await db.delete(upload_session)
+    await db.commit()
+
+    await run_in_threadpool(remove_dir, session_dir(session_id))
+
+    return {
+        "message": "File uploaded successfully",
+        "file_id": db_file.id,
+        "filename": upload_session.file_name,
+        "content_type": "application/octet-stream",
+        "size": file_size,
+        "checksum": checksum
+    }
+
+@router.delete('/{session_id}', status_code=status.HTTP_204_NO_CONTENT)
+async def abort_session(
+    session_id: str,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(Database.get_async_db)
+):
+    """Abort an upload session and discard its chunks"""
+    upload_session = await get_owned_session(db, session_id, user)
+
+    await db.delete(upload_session)
+    await db.commit()
+
+    await run_in_threadpool(remove_dir, session_dir(session_id))
+    return None
@@ -0,0 +1,49 @@
+import atexit
+import itertools
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# The server reads its settings when first imported: run it on an in-memory
+# database and a storage folder of its own, without background tasks
+UPLOAD_FOLDER = tempfile.mkdtemp(prefix="storage-tests-")
+atexit.register(shutil.rmtree, UPLOAD_FOLDER, ignore_errors=True)
+os.environ.update({
+    "DATABASE_URL": "sqlite://",
+    "UPLOAD_FOLDER": UPLOAD_FOLDER,
+    "STORAGE_REPAIR_INTERVAL": "0",
+    "STORAGE_GC_INTERVAL": "0",
+    "BCRYPT_ROUNDS": "4",
+})
+
+usernames = (f"user{number}" for number in itertools.count())
+
+@pytest.fixture(scope="session")
+def client():
+    """Client of the server app, started once for all tests."""
+    from fastapi.testclient import TestClient
+    from server.server import app
+
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def register(client):
+    """Register a new user and return their authorization headers."""
+    def register(role: str = "user") -> dict:
+        username = next(usernames)
+        response = client.post(
+            "/auth/register",
+            json={"username": username, "email": f"{username}@example.com", "password": "password", "role": role}
+        )
+        assert response.status_code == 200, response.text
+        response = client.post("/auth/login", data={"username": username, "password": "password"})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return register
+
+@pytest.fixture
+def headers(register):
+    """Authorization headers of a new user."""
+    return register()
@@ -0,0 +1,46 @@
+from sqlalchemy import update
+
+from server.models.models import User
+from server.services.auth.services import invalidate_user, token_cache
+from server.utils.database_class import Database
+
+def set_user(username: str, **values):
+    with Database().engine.begin() as connection:
+        connection.execute(update(User).where(User.username == username).values(**values))
+
+def token(headers: dict) -> str:
+    return headers["Authorization"].split(" ", 1)[1]
+
+def test_tokens_are_verified_once(client, headers):
+    assert client.get("/auth/me", headers=headers).status_code == 200
+    assert token_cache.get(token(headers)).username == client.get("/auth/me", headers=headers).json()["username"]
+
+def test_invalid_token(client):
+    response = client.get("/auth/me", headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 401
+    assert token_cache.get("not-a-token") is None
+
+def test_user_changes_apply_once_invalidated(client, headers):
+    me = client.get("/auth/me", headers=headers).json()
+    set_user(me["username"], email="changed@example.com")
+
+    # The cached snapshot is served until the user is invalidated
+    assert client.get("/auth/me", headers=headers).json()["email"] == me["email"]
+    invalidate_user(me["username"])
+    assert client.get("/auth/me", headers=headers).json()["email"] == "changed@example.com"
+
+def test_role_changes_apply_once_invalidated(client, register):
+    admin = register("admin")
+    assert client.get("/admin/users", headers=admin).status_code == 200
+
+    username = client.get("/auth/me", headers=admin).json()["username"]
+    set_user(username, role="user")
+    invalidate_user(username)
+    assert client.get("/admin/users", headers=admin).status_code == 403
+
+def test_deleted_users_are_logged_out_at_once(client, headers, register):
+    me = client.get("/auth/me", headers=headers).json()
+
+    assert client.delete(f"/admin/users/{me['id']}", headers=register("admin")).status_code == 204
+    assert client.get("/auth/me", headers=headers).status_code == 401
+    assert client.get("/files/list", headers=headers).status_code == 401
@@ -0,0 +1,86 @@
+import importlib.util
+import io
+import random
+from pathlib import Path
+
+import pytest
+
+from server.utils import chunking
+
+# The client is not a package and ships its own copy of the module; load it by path
+CLIENT_CHUNKING = Path(__file__).resolve().parents[2] / "client" / "chunking.py"
+_spec = importlib.util.spec_from_file_location("client_chunking", CLIENT_CHUNKING)
+client_chunking = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(client_chunking)
+
+def csv_rows(count: int) -> bytes:
+    return b"".join(b"%d,name-%d,%d\n" % (i, i * 7, i * 13) for i in range(count))
+
+def random_bytes(size: int, seed: int) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+SAMPLES = {
+    "empty": b"",
+    "tiny": b"hello\n",
+    "text": csv_rows(200_000),
+    "binary": random_bytes(3 * 1024 * 1024, 1),
+    # Longer than READ_SIZE, so boundaries fall across reads
+    "large": random_bytes(chunking.READ_SIZE + 1_500_000, 2),
+    "no_newlines": bytes(1024 * 1024),
+    "only_newlines": b"\n" * (1024 * 1024),
+}
+
+@pytest.fixture(params=sorted(SAMPLES))
+def sample(request, tmp_path):
+    path = tmp_path / request.param
+    path.write_bytes(SAMPLES[request.param])
+    return path
+
+def test_client_copy_is_identical():
+    assert CLIENT_CHUNKING.read_bytes() == Path(chunking.__file__).read_bytes()
+
+def test_settings_match():
+    for name in (
+        "CHUNKING", "MIN_BLOCK_SIZE", "NORMAL_BLOCK_SIZE", "MAX_BLOCK_SIZE", "WINDOW", "STRICT_MASK", "LOOSE_MASK", "GEAR"
+    ):
+        assert getattr(chunking, name) == getattr(client_chunking, name), name
+
+def test_client_and_server_blocks_match(sample):
+    assert chunking.chunk_file(str(sample)) == client_chunking.chunk_file(str(sample))
+
+def test_blocks_cover_the_file(sample):
+    data = sample.read_bytes()
+    blocks = chunking.chunk_file(str(sample))
+
+    assert b"".join(data[start:start + size] for start, size, _ in blocks) == data
+    assert [start for start, _, _ in blocks] == [sum(size for _, size, _ in blocks[:i]) for i in range(len(blocks))]
+    # Only the last block may be shorter than the minimum
+    assert all(chunking.MIN_BLOCK_SIZE <= size <= chunking.MAX_BLOCK_SIZE for _, size, _ in blocks[:-1])
+
+def test_an_edit_only_changes_nearby_blocks(tmp_path):
+    original = csv_rows(200_000)
+    middle = len(original) // 2
+    edited = original[:middle] + b"inserted,row,0\n" + original[middle:]
+    (tmp_path / "a").write_bytes(original)
+    (tmp_path / "b").write_bytes(edited)
+
+    before = {block_hash for _, _, block_hash in client_chunking.chunk_file(str(tmp_path / "a"))}
+    after = [block_hash for _, _, block_hash in chunking.chunk_file(str(tmp_path / "b"))]
+    assert sum(block_hash not in before for block_hash in after) <= 2
+
+def test_an_edit_of_binary_data_only_changes_nearby_blocks(tmp_path):
+    # Every byte position is a candidate boundary, not only those after newlines
+    original = random_bytes(4 * 1024 * 1024, 3)
+    middle = len(original) // 2
+    edited = original[:middle] + b"x" * 7 + original[middle + 100:]
+    (tmp_path / "a").write_bytes(original)
+    (tmp_path / "b").write_bytes(edited)
+
+    before = {block_hash for _, _, block_hash in chunking.chunk_file(str(tmp_path / "a"))}
+    after = [block_hash for _, _, block_hash in chunking.chunk_file(str(tmp_path / "b"))]
+    assert sum(block_hash not in before for block_hash in after) <= 2
+
+def test_block_sizes_stay_near_the_normal_size():
+    blocks = chunking.chunk_stream(io.BytesIO(SAMPLES["binary"]))
+    average = sum(size for _, size, _ in blocks) / len(blocks)
+    assert chunking.MIN_BLOCK_SIZE < average < 2 * chunking.NORMAL_BLOCK_SIZE
@@ -0,0 +1,104 @@
+import gzip
+import json
+import random
+
+import pytest
+
+from server.utils import compression
+from server.utils.compression import FRAME_SIZE, FramedReader, compress_file, get_codec, index_path, write_index
+
+# About 3.5 frames of compressible data
+DATA = b"".join(b"%d,row,%d\n" % (i, i * 3) for i in range(int(FRAME_SIZE * 3.5) // 12))
+
+CODECS = [
+    "gzip",
+    pytest.param("zstd", marks=pytest.mark.skipif(compression.zstandard is None, reason="zstandard is not installed")),
+]
+
+@pytest.fixture(params=CODECS)
+def stored(request, tmp_path):
+    source, destination = tmp_path / "file", tmp_path / "file.z"
+    source.write_bytes(DATA)
+    codec = get_codec(request.param, 6)
+    stored_size, offsets = compress_file(str(source), str(destination), codec, 0.1)
+    write_index(str(destination), codec, len(DATA), stored_size, offsets)
+    with open(index_path(str(destination))) as f:
+        index = json.load(f)
+    return destination, index
+
+def open_reader(stored) -> FramedReader:
+    destination, index = stored
+    return FramedReader(open(destination, "rb"), index)
+
+def test_index(stored):
+    destination, index = stored
+    assert index["size"] == len(DATA)
+    assert index["stored_size"] == destination.stat().st_size
+    assert len(index["offsets"]) == -(-len(DATA) // FRAME_SIZE) + 1
+
+def test_read_whole_file(stored):
+    with open_reader(stored) as reader:
+        assert reader.read() == DATA
+        assert reader.read() == b""
+
+def test_gzip_file_is_one_gzip_stream(tmp_path):
+    source, destination = tmp_path / "file", tmp_path / "file.gz"
+    source.write_bytes(DATA)
+    compress_file(str(source), str(destination), get_codec("gzip", 6), 0.1)
+    assert gzip.decompress(destination.read_bytes()) == DATA
+
+@pytest.mark.parametrize("start, size", [
+    (0, 10),
+    (FRAME_SIZE - 5, 10),
+    (FRAME_SIZE, 1),
+    (FRAME_SIZE - 1, 2 * FRAME_SIZE + 2),
+    (3 * FRAME_SIZE + 7, FRAME_SIZE),
+    (len(DATA) - 1, 10),
+    (len(DATA), 10),
+    (len(DATA) + 100, 10),
+])
+def test_seek_and_read(stored, start, size):
+    with open_reader(stored) as reader:
+        assert reader.seek(start) == start
+        assert reader.read(size) == DATA[start:start + size]
+        assert reader.tell() == min(start + size, max(start, len(DATA)))
+
+def test_seek_backwards_and_relative(stored):
+    with open_reader(stored) as reader:
+        reader.seek(2 * FRAME_SIZE + 3)
+        assert reader.read(5) == DATA[2 * FRAME_SIZE + 3:2 * FRAME_SIZE + 8]
+        reader.seek(-FRAME_SIZE, 1)
+        assert reader.read(5) == DATA[FRAME_SIZE + 8:FRAME_SIZE + 13]
+        reader.seek(-5, 2)
+        assert reader.read() == DATA[-5:]
+        reader.seek(0)
+        assert reader.read(3) == DATA[:3]
+
+def test_random_reads(stored):
+    rng = random.Random(0)
+    with open_reader(stored) as reader:
+        for _ in range(50):
+            start, size = rng.randrange(len(DATA)), rng.randrange(1, 2 * FRAME_SIZE)
+            reader.seek(start)
+            assert reader.read(size) == DATA[start:start + size]
+
+def test_incompressible_data_is_not_stored_compressed(tmp_path):
+    source, destination = tmp_path / "file", tmp_path / "file.z"
+    source.write_bytes(random.Random(1).randbytes(2 * FRAME_SIZE))
+    assert compress_file(str(source), str(destination), get_codec("gzip", 6), 0.1) is None
+    assert not destination.exists()
+
+def test_index_larger_than_data_raises(stored):
+    destination, index = stored
+    index = dict(index, size=index["size"] + 100)
+    with FramedReader(open(destination, "rb"), index) as reader:
+        reader.seek(len(DATA) - 10)
+        with pytest.raises(ValueError):
+            reader.read()
+
+def test_frame_missing_from_index_raises(stored):
+    destination, index = stored
+    index = dict(index, offsets=index["offsets"][:-1])
+    with FramedReader(open(destination, "rb"), index) as reader:
+        with pytest.raises(ValueError):
+            reader.read()
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+
+from server.models.models import Blob, UploadSession
+from server.utils.database_class import Database, is_memory_url, to_async_url
+
+@pytest.mark.parametrize("url, expected", [
+    ("sqlite:///data/storage.db", "sqlite+aiosqlite:///data/storage.db"),
+    ("postgresql://user:secret@db/storage", "postgresql+asyncpg://user:secret@db/storage"),
+    ("postgresql+asyncpg://db/storage", "postgresql+asyncpg://db/storage"),
+])
+def test_to_async_url(url, expected):
+    assert to_async_url(url) == expected
+
+@pytest.mark.parametrize("url, expected", [
+    ("sqlite://", True),
+    ("sqlite:///:memory:", True),
+    ("sqlite:///storage.db", False),
+    ("postgresql://db/storage", False),
+])
+def test_is_memory_url(url, expected):
+    assert is_memory_url(url) is expected
+
+def pragma(connection, name: str):
+    return connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+def test_in_memory_database_is_a_wal_file(client):
+    database = Database()
+    assert database.memory
+    assert os.path.exists(os.path.join(database.memory_directory, "storage.db"))
+    with database.engine.connect() as connection:
+        assert pragma(connection, "journal_mode") == "wal"
+        assert pragma(connection, "foreign_keys") == 1
+        # Nothing to sync for a database that is lost on restart anyway
+        assert pragma(connection, "synchronous") == 0
+
+def test_async_connections_are_configured(client):
+    async def pragmas():
+        async with Database().async_engine.connect() as connection:
+            return [(await connection.exec_driver_sql(f"PRAGMA {name}")).scalar() for name in ("journal_mode", "foreign_keys")]
+
+    assert client.portal.call(pragmas) == ["wal", 1]
+
+def test_deleting_a_user_deletes_their_sessions(client, headers, register):
+    response = client.post("/files/sessions", json={"file_name": "pending.bin", "size": 100}, headers=headers)
+    assert response.status_code == 201
+    user_id = client.get("/auth/me", headers=headers).json()["id"]
+
+    assert client.delete(f"/admin/users/{user_id}", headers=register("admin")).status_code == 204
+    with Database().engine.connect() as connection:
+        assert connection.execute(
+            select(func.count()).select_from(UploadSession).where(UploadSession.owner_id == user_id)
+        ).scalar() == 0
+        assert connection.exec_driver_sql("PRAGMA foreign_key_check").all() == []
+
+def test_blobs_of_files_cannot_be_deleted(client, headers):
+    response = client.post("/files/upload", files={"file": ("kept.bin", os.urandom(100))}, headers=headers)
+    blob_hash = response.json()["checksum"]
+
+    with pytest.raises(IntegrityError):
+        with Database().engine.begin() as connection:
+            connection.execute(delete(Blob).where(Blob.hash == blob_hash))
@@ -0,0 +1,83 @@
+import hashlib
+import os
+
+from sqlalchemy import func, select
+
+from server.models.models import Blob, Tombstone
+from server.utils import blob_store, collector
+from server.utils.database_class import Database
+
+def upload(client, headers, name: str, data: bytes) -> dict:
+    response = client.post("/files/upload", files={"file": (name, data)}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def ref_count(blob_hash: str):
+    with Database().engine.connect() as connection:
+        return connection.execute(select(Blob.ref_count).where(Blob.hash == blob_hash)).scalar()
+
+def tombstones(blob_hash: str) -> int:
+    with Database().engine.connect() as connection:
+        return connection.execute(select(func.count()).where(Tombstone.blob_hash == blob_hash)).scalar()
+
+def file_ids(client, headers) -> dict:
+    return {file["name"]: file["id"] for file in client.get("/files/list", headers=headers).json()}
+
+def test_identical_uploads_share_one_blob(client, register):
+    data = os.urandom(3000)
+    blob_hash = hashlib.sha256(data).hexdigest()
+    first, second = register(), register()
+
+    assert upload(client, first, "a.bin", data)["checksum"] == blob_hash
+    upload(client, first, "b.bin", data)
+    upload(client, second, "c.bin", data)
+
+    assert ref_count(blob_hash) == 3
+    assert len(blob_store.find(blob_hash)) == blob_store.replicas
+    response = client.get("/files/download", params={"file_name": "c.bin"}, headers=second)
+    assert response.content == data
+
+def test_link_takes_a_reference(client, headers):
+    data = os.urandom(3000)
+    blob_hash = upload(client, headers, "original.bin", data)["checksum"]
+
+    assert client.get(f"/files/blobs/{blob_hash}", headers=headers).json() == {"hash": blob_hash, "size": len(data)}
+    response = client.post("/files/link", json={"file_name": "linked.bin", "hash": blob_hash}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert ref_count(blob_hash) == 2
+    assert client.get("/files/download", params={"file_name": "linked.bin"}, headers=headers).content == data
+
+def test_link_unknown_content(client, headers):
+    blob_hash = hashlib.sha256(b"never uploaded").hexdigest()
+    assert client.get(f"/files/blobs/{blob_hash}", headers=headers).status_code == 404
+    response = client.post("/files/link", json={"file_name": "missing.bin", "hash": blob_hash}, headers=headers)
+    assert response.status_code == 404
+    assert "missing.bin" not in file_ids(client, headers)
+
+def test_deleting_files_releases_their_references(client, headers):
+    data = os.urandom(3000)
+    blob_hash = upload(client, headers, "one.bin", data)["checksum"]
+    upload(client, headers, "two.bin", data)
+    ids = file_ids(client, headers)
+
+    # A delete only records a tombstone; the collector applies it
+    assert client.delete(f"/files/{ids['one.bin']}", headers=headers).status_code == 200
+    assert ref_count(blob_hash) == 2 and tombstones(blob_hash) == 1
+    client.portal.call(collector.run_once)
+    assert ref_count(blob_hash) == 1 and tombstones(blob_hash) == 0
+    assert client.get("/files/download", params={"file_name": "two.bin"}, headers=headers).content == data
+
+    # Releasing the last reference removes the blob and its bytes
+    assert client.delete(f"/files/{ids['two.bin']}", headers=headers).status_code == 200
+    client.portal.call(collector.run_once)
+    assert ref_count(blob_hash) is None
+    assert blob_store.find(blob_hash) == []
+    response = client.post("/files/link", json={"file_name": "late.bin", "hash": blob_hash}, headers=headers)
+    assert response.status_code == 404
+
+def test_replacing_a_file_releases_its_old_content(client, headers):
+    old = upload(client, headers, "replaced.bin", os.urandom(3000))["checksum"]
+    new = upload(client, headers, "replaced.bin", os.urandom(3000))["checksum"]
+
+    client.portal.call(collector.run_once)
+    assert ref_count(old) is None and ref_count(new) == 1
@@ -0,0 +1,132 @@
+import hashlib
+import itertools
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from server.utils.erasure import (
+    UNIT_SIZE,
+    ErasureReader,
+    decode_data,
+    encode_parity,
+    parse_scheme,
+    rebuild_shards,
+    write_shards,
+)
+from server.utils.storage_backends import MemoryBackend
+
+SCHEMES = [(2, 1), (3, 2), (4, 2), (2, 3)]
+
+def lost_shards(k: int, m: int):
+    """Every set of m shards that can be lost."""
+    return list(itertools.combinations(range(k + m), m))
+
+@pytest.fixture(scope="module")
+def pool():
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        yield executor
+
+def test_parse_scheme():
+    assert parse_scheme("4+2") == (4, 2)
+    assert parse_scheme("") is None
+    for scheme in ("4", "0+2", "4+0", "200+100"):
+        with pytest.raises(ValueError):
+            parse_scheme(scheme)
+
+@pytest.mark.parametrize("k, m", SCHEMES)
+def test_decode_stripe_with_any_m_shards_missing(k, m):
+    rng = random.Random(k * 10 + m)
+    data = [rng.randbytes(64) for _ in range(k)]
+    units = data + encode_parity(data, m)
+
+    for lost in lost_shards(k, m):
+        available = {shard: unit for shard, unit in enumerate(units) if shard not in lost}
+        assert decode_data(available, k) == data, lost
+
+@pytest.mark.parametrize("k, m", SCHEMES)
+def test_decode_needs_k_shards(k, m):
+    data = [bytes([shard]) * 16 for shard in range(k)]
+    units = data + encode_parity(data, m)
+    with pytest.raises(ValueError):
+        decode_data({shard: units[shard] for shard in range(m + 1, k + m)}, k)
+
+def write(pool, tmp_path, data: bytes, k: int, m: int):
+    """Erasure code `data` into k + m shards kept in memory."""
+    source = tmp_path / "source"
+    source.write_bytes(data)
+    backend = MemoryBackend()
+    hashes = write_shards(str(source), [backend.writer(str(shard)) for shard in range(k + m)], k, m, pool)
+    manifest = {"k": k, "m": m, "unit": UNIT_SIZE, "size": len(data)}
+    return backend, hashes, manifest
+
+def open_reader(backend, manifest, pool, lost=()) -> ErasureReader:
+    shards = {
+        shard: (lambda shard=shard: backend.open(str(shard)))
+        for shard in range(manifest["k"] + manifest["m"]) if shard not in lost
+    }
+    return ErasureReader(shards, manifest, pool)
+
+@pytest.mark.parametrize("k, m", SCHEMES)
+def test_read_with_any_m_shards_missing(pool, tmp_path, k, m):
+    # Two and a half stripes, so the last one is padded
+    data = random.Random(k).randbytes(int(2.5 * k * UNIT_SIZE))
+    backend, hashes, manifest = write(pool, tmp_path, data, k, m)
+    assert all(hashes)
+
+    for lost in lost_shards(k, m):
+        with open_reader(backend, manifest, pool, lost) as reader:
+            assert reader.read() == data, lost
+
+def test_read_with_too_many_shards_missing(pool, tmp_path):
+    backend, _, manifest = write(pool, tmp_path, bytes(UNIT_SIZE * 4), 2, 1)
+    with open_reader(backend, manifest, pool, lost=(0, 2)) as reader:
+        with pytest.raises(OSError):
+            reader.read()
+
+def test_read_with_a_corrupt_shard_length(pool, tmp_path):
+    data = random.Random(0).randbytes(3 * UNIT_SIZE)
+    backend, _, manifest = write(pool, tmp_path, data, 2, 1)
+    # A truncated shard is treated as lost
+    backend.put_bytes("0", backend.read_bytes("0")[:UNIT_SIZE // 2])
+    with open_reader(backend, manifest, pool) as reader:
+        assert reader.read() == data
+
+def test_read_past_the_stored_stripes_raises(pool, tmp_path):
+    data = random.Random(2).randbytes(2 * UNIT_SIZE)
+    backend, _, manifest = write(pool, tmp_path, data, 2, 1)
+    manifest = dict(manifest, size=len(data) + 10)
+    with open_reader(backend, manifest, pool) as reader:
+        with pytest.raises(OSError):
+            reader.read()
+
+def test_read_a_short_stripe_raises(pool, tmp_path):
+    backend, _, manifest = write(pool, tmp_path, bytes(2 * UNIT_SIZE), 2, 1)
+    with open_reader(backend, manifest, pool) as reader:
+        reader.read_stripe = lambda number: [b"", b""]
+        with pytest.raises(ValueError):
+            reader.read()
+
+def test_seek_across_stripes(pool, tmp_path):
+    k, m = 3, 2
+    data = random.Random(1).randbytes(4 * k * UNIT_SIZE + 123)
+    backend, _, manifest = write(pool, tmp_path, data, k, m)
+    stripe = k * UNIT_SIZE
+
+    with open_reader(backend, manifest, pool, lost=(1, 3)) as reader:
+        for start, size in [(stripe - 10, 20), (UNIT_SIZE - 1, 2 * stripe), (len(data) - 5, 50), (0, 1)]:
+            reader.seek(start)
+            assert reader.read(size) == data[start:start + size]
+
+@pytest.mark.parametrize("k, m", SCHEMES)
+def test_rebuild_lost_shards(pool, tmp_path, k, m):
+    data = random.Random(2).randbytes(int(1.5 * k * UNIT_SIZE))
+    backend, hashes, manifest = write(pool, tmp_path, data, k, m)
+
+    for lost in lost_shards(k, m):
+        rebuilt = MemoryBackend()
+        with open_reader(backend, manifest, pool, lost) as reader:
+            rebuilt_hashes = rebuild_shards(reader, {shard: rebuilt.writer(str(shard)) for shard in lost})
+        for shard in lost:
+            assert rebuilt_hashes[shard] == hashes[shard]
+            assert hashlib.sha256(rebuilt.read_bytes(str(shard))).hexdigest() == hashes[shard]
@@ -0,0 +1,21 @@
+def upload(client, headers, name: str) -> int:
+    response = client.post("/files/upload", files={"file": (name, b"delete me")}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["file_id"]
+
+def test_delete_missing_file(client, headers):
+    response = client.delete("/files/999999", headers=headers)
+    assert response.status_code == 404
+    assert response.json() == {"detail": "File not found"}
+
+def test_delete_twice(client, headers):
+    file_id = upload(client, headers, "twice.txt")
+    assert client.delete(f"/files/{file_id}", headers=headers).status_code == 200
+    assert client.delete(f"/files/{file_id}", headers=headers).status_code == 404
+
+def test_delete_file_of_another_user(client, headers, register):
+    file_id = upload(client, headers, "kept.txt")
+
+    assert client.delete(f"/files/{file_id}", headers=register()).status_code == 404
+    names = [file["name"] for file in client.get("/files/list", headers=headers).json()]
+    assert names == ["kept.txt"]
@@ -0,0 +1,78 @@
+import base64
+import json
+
+import pytest
+
+from server.services.files.services import decode_cursor, encode_cursor
+
+SIZES = [30, 10, 20, 10, 50, 40, 10]
+
+@pytest.fixture
+def files(client, headers):
+    """Names of the files of a new user, in upload order."""
+    names = [f"file{number}.txt" for number in range(len(SIZES))]
+    for number, (name, size) in enumerate(zip(names, SIZES)):
+        response = client.post("/files/upload", files={"file": (name, bytes([number]) * size)}, headers=headers)
+        assert response.status_code == 200, response.text
+    return names
+
+def list_all(client, headers, **params) -> list:
+    """Every page of a listing, following the cursors."""
+    pages = []
+    while True:
+        response = client.get("/files/list", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        pages.append([file["name"] for file in response.json()])
+        if "X-Next-Cursor" not in response.headers:
+            return pages
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+def test_cursor_round_trip():
+    for sort, value in [("id", 7), ("name", "a/b é"), ("size", 123)]:
+        assert decode_cursor(encode_cursor(sort, value, 7), sort) == (value, 7)
+
+@pytest.mark.parametrize("sort, order", [("id", "asc"), ("name", "desc"), ("size", "asc"), ("size", "desc"), ("timestamp", "asc")])
+def test_pages_cover_every_file_once(client, headers, files, sort, order):
+    pages = list_all(client, headers, limit=2, sort=sort, order=order)
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+
+    listed = [name for page in pages for name in page]
+    sizes = dict(zip(files, SIZES))
+    # Ties are broken by id, in the same direction
+    key = {
+        "id": lambda name: files.index(name),
+        "name": lambda name: name,
+        "size": lambda name: (sizes[name], files.index(name)),
+        "timestamp": lambda name: files.index(name),
+    }[sort]
+    assert listed == sorted(files, key=key, reverse=order == "desc")
+
+def test_pages_with_a_filter(client, headers, files):
+    pages = list_all(client, headers, limit=2, sort="size", min_size=20)
+    assert pages == [["file2.txt", "file0.txt"], ["file5.txt", "file4.txt"]]
+
+def encode(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"not json").decode(),
+    encode(5),
+    encode(["size", 10]),
+    encode(["size", "10", 1]),
+    encode(["size", 10, "1"]),
+    encode(["timestamp", 10, 1]),
+    encode(["timestamp", "yesterday", 1]),
+    encode({"sort": "size", "value": 10, "id": 1}),
+])
+def test_invalid_cursor(client, headers, cursor):
+    response = client.get("/files/list", params={"sort": "size", "cursor": cursor}, headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+def test_cursor_of_another_sort(client, headers, files):
+    response = client.get("/files/list", params={"limit": 2, "sort": "name"}, headers=headers)
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get("/files/list", params={"sort": "size", "cursor": cursor}, headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cursor does not match the sort order"
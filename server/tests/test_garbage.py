@@ -0,0 +1,91 @@
+import hashlib
+import os
+
+from sqlalchemy import func, select, update
+
+from server.models.models import Blob, Tombstone
+from server.utils import blob_store, collector
+from server.utils.database_class import Database
+
+def upload(client, headers, name: str, data: bytes) -> dict:
+    response = client.post("/files/upload", files={"file": (name, data)}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def ref_count(blob_hash: str):
+    with Database().engine.connect() as connection:
+        return connection.execute(select(Blob.ref_count).where(Blob.hash == blob_hash)).scalar()
+
+def download(client, headers, name: str) -> bytes:
+    response = client.get("/files/download", params={"file_name": name}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.content
+
+def test_content_uploaded_again_before_collection_is_kept(client, headers):
+    data = os.urandom(3000)
+    uploaded = upload(client, headers, "first.bin", data)
+    assert client.delete(f"/files/{uploaded['file_id']}", headers=headers).status_code == 200
+
+    # The tombstone of the deleted file is still pending when the content comes back
+    upload(client, headers, "second.bin", data)
+    client.portal.call(collector.run_once)
+
+    assert ref_count(uploaded["checksum"]) == 1
+    assert blob_store.find(uploaded["checksum"])
+    assert download(client, headers, "second.bin") == data
+
+def test_unreferenced_blob_uploaded_again_is_revived(client, headers):
+    data = os.urandom(3000)
+    uploaded = upload(client, headers, "dead.bin", data)
+    blob_hash = uploaded["checksum"]
+
+    # As left by a collection that was interrupted after removing the bytes
+    client.delete(f"/files/{uploaded['file_id']}", headers=headers)
+    with Database().engine.begin() as connection:
+        connection.execute(update(Blob).where(Blob.hash == blob_hash).values(ref_count=0))
+        connection.execute(Tombstone.__table__.delete().where(Tombstone.blob_hash == blob_hash))
+    blob_store.remove(blob_hash)
+
+    # Linking needs a live blob, uploading writes the bytes again
+    response = client.post("/files/link", json={"file_name": "linked.bin", "hash": blob_hash}, headers=headers)
+    assert response.status_code == 404
+    upload(client, headers, "revived.bin", data)
+    assert ref_count(blob_hash) == 1
+
+    client.portal.call(collector.run_once)
+    assert ref_count(blob_hash) == 1
+    assert download(client, headers, "revived.bin") == data
+
+def test_deleted_users_release_their_files(client, headers, register):
+    contents = [os.urandom(3000) for _ in range(3)]
+    for number, data in enumerate(contents):
+        upload(client, headers, f"{number}.bin", data)
+    user_id = client.get("/auth/me", headers=headers).json()["id"]
+
+    assert client.delete(f"/admin/users/{user_id}", headers=register("admin")).status_code == 204
+    client.portal.call(collector.run_once)
+
+    for data in contents:
+        blob_hash = hashlib.sha256(data).hexdigest()
+        assert ref_count(blob_hash) is None
+        assert blob_store.find(blob_hash) == []
+
+def test_orphans_are_removed_after_the_grace_period(client, headers, monkeypatch):
+    kept = upload(client, headers, "kept.bin", os.urandom(3000))["checksum"]
+    orphan = hashlib.sha256(b"orphan").hexdigest()
+    location = next(iter(blob_store.backends))
+    blob_store.backends[location].put_bytes(blob_store.key(orphan), b"orphan")
+    with open(os.path.join(blob_store.temp_root, "stale-upload"), "wb") as f:
+        f.write(b"stale")
+
+    monkeypatch.setattr(collector, "grace_seconds", -1)
+    progress = client.portal.call(collector.run_once)
+
+    assert progress["orphans_removed"] >= 1 and progress["staged_files_removed"] >= 1
+    assert not blob_store.backends[location].exists(blob_store.key(orphan))
+    assert not os.path.exists(os.path.join(blob_store.temp_root, "stale-upload"))
+    assert ref_count(orphan) is None
+    # Blobs with a row are not orphans
+    assert blob_store.find(kept)
+    with Database().engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(Tombstone)).scalar() == 0
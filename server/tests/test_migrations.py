@@ -0,0 +1,111 @@
+import hashlib
+import importlib
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+
+from server.utils.blob_store import BlobStore
+from server.utils.legacy_schema import LEGACY_TARGET_REVISION, is_legacy_schema, upgrade_legacy_schema
+from server.utils.migrations import migration_config
+
+# The tables `create_all` made before migrations were added
+legacy = sa.MetaData()
+sa.Table("user", legacy,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("username", sa.String, index=True),
+    sa.Column("email", sa.String, index=True, unique=True),
+    sa.Column("password_hash", sa.String),
+    sa.Column("is_active", sa.Boolean),
+    sa.Column("role", sa.String),
+)
+sa.Table("file", legacy,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("owner_id", sa.String),
+    sa.Column("file_name", sa.String, index=True),
+    sa.Column("path", sa.String, index=True),
+    sa.Column("size", sa.BigInteger),
+    sa.Column("timestamp", sa.DateTime),
+)
+
+def schema(connection) -> dict:
+    """Everything about the tables that a revision decides."""
+    inspector = sa.inspect(connection)
+    return {
+        table: {
+            "columns": [(c["name"], str(c["type"]), c["nullable"]) for c in inspector.get_columns(table)],
+            "indexes": sorted((i["name"], tuple(i["column_names"]), bool(i["unique"])) for i in inspector.get_indexes(table)),
+            "foreign_keys": sorted(
+                (tuple(f["constrained_columns"]), f["referred_table"], f["options"].get("ondelete"))
+                for f in inspector.get_foreign_keys(table)
+            ),
+            "unique": sorted(tuple(u["column_names"]) for u in inspector.get_unique_constraints(table)),
+        }
+        for table in sorted(inspector.get_table_names())
+    }
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'storage.db'}")
+    yield engine
+    engine.dispose()
+
+def test_legacy_schema_is_upgraded_to_the_released_revision(engine, tmp_path):
+    legacy.create_all(engine)
+    with engine.begin() as connection:
+        assert is_legacy_schema(connection)
+        upgrade_legacy_schema(connection)
+        assert not is_legacy_schema(connection)
+        upgraded = schema(connection)
+
+    released = sa.create_engine(f"sqlite:///{tmp_path / 'released.db'}")
+    revision = ScriptDirectory.from_config(migration_config()).get_revision(LEGACY_TARGET_REVISION)
+    with released.begin() as connection:
+        context = MigrationContext.configure(connection, opts={"render_as_batch": True})
+        with Operations.context(context):
+            revision.module.upgrade()
+        assert schema(connection) == upgraded
+    released.dispose()
+
+def test_released_revision_starts_from_an_empty_database():
+    revision = ScriptDirectory.from_config(migration_config()).get_revision(LEGACY_TARGET_REVISION)
+    assert revision.down_revision is None
+
+@pytest.fixture
+def store(monkeypatch):
+    store = BlobStore(roots={"a": "memory://", "b": "memory://"}, replicas=2)
+    monkeypatch.setattr(importlib.import_module("server.utils.blob_store"), "blob_store", store)
+    return store
+
+def test_legacy_files_are_imported_into_blobs(engine, tmp_path, store):
+    legacy.create_all(engine)
+    for name, content in [("a", b"same"), ("b", b"same"), ("old", b"old"), ("new", b"new"), ("orphan", b"x")]:
+        (tmp_path / name).write_bytes(content)
+    old, new = datetime(2024, 1, 1), datetime(2024, 1, 2)
+    with engine.begin() as connection:
+        connection.execute(sa.text("INSERT INTO user (id, username) VALUES (1, 'ann')"))
+        connection.execute(legacy.tables["file"].insert(), [
+            {"id": 1, "owner_id": "1", "file_name": "a.txt", "path": str(tmp_path / "a"), "timestamp": old},
+            {"id": 2, "owner_id": "1", "file_name": "b.txt", "path": str(tmp_path / "b"), "timestamp": old},
+            # Names are unique now: the newest one is kept
+            {"id": 3, "owner_id": "1", "file_name": "c.txt", "path": str(tmp_path / "new"), "timestamp": new},
+            {"id": 4, "owner_id": "1", "file_name": "c.txt", "path": str(tmp_path / "old"), "timestamp": old},
+            {"id": 5, "owner_id": "2", "file_name": "d.txt", "path": str(tmp_path / "orphan"), "timestamp": old},
+            {"id": 6, "owner_id": "1", "file_name": "e.txt", "path": str(tmp_path / "missing"), "timestamp": old},
+        ])
+
+    with engine.begin() as connection:
+        upgrade_legacy_schema(connection)
+        files = connection.execute(sa.text("SELECT id, owner_id, file_name, blob_hash, size FROM file ORDER BY id")).all()
+        blobs = dict(connection.execute(sa.text("SELECT hash, ref_count FROM blob")).all())
+
+    same, newest = hashlib.sha256(b"same").hexdigest(), hashlib.sha256(b"new").hexdigest()
+    assert files == [(1, 1, "a.txt", same, 4), (2, 1, "b.txt", same, 4), (3, 1, "c.txt", newest, 3)]
+    assert blobs == {same: 2, newest: 1}
+    for blob_hash, content in [(same, b"same"), (newest, b"new")]:
+        for location in store.placement(blob_hash):
+            with store.open_replica(blob_hash, location) as f:
+                assert f.read() == content
@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+import pytest
+
+from server.utils.password_hasher import PasswordHasher, PasswordHasherBusy
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(rounds=4, workers=2, max_queue=2)
+
+    async def run():
+        hashed = await hasher.hash("secret")
+        return await hasher.verify("secret", hashed), await hasher.verify("wrong", hashed)
+
+    assert asyncio.run(run()) == (True, False)
+    assert hasher.pending == 0
+    assert hasher.stats["hash"].count == 1 and hasher.stats["verify"].count == 2
+    hasher.shutdown()
+
+def test_cancelled_operations_count_until_their_worker_is_done():
+    hasher = PasswordHasher(rounds=4, workers=1, max_queue=0)
+    release = threading.Event()
+
+    async def run():
+        task = asyncio.create_task(hasher._submit("hash", release.wait))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The worker is still busy, so there is no room for another operation
+        assert hasher.pending == 1
+        with pytest.raises(PasswordHasherBusy):
+            await hasher.hash("secret")
+
+        release.set()
+        for _ in range(100):
+            if hasher.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert hasher.pending == 0
+        await hasher.hash("secret")
+
+    try:
+        asyncio.run(run())
+    finally:
+        release.set()
+        hasher.shutdown()
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+from sqlalchemy import select
+
+from server.models.models import Blob
+from server.utils import blob_store
+from server.utils.database_class import Database
+
+@pytest.fixture
+def user(client, register):
+    """Headers of a new user and a function setting their quota as an admin."""
+    headers = register()
+    user_id = client.get("/auth/me", headers=headers).json()["id"]
+    admin = register("admin")
+
+    def set_quota(quota):
+        response = client.put(f"/admin/users/{user_id}/quota", json={"quota": quota}, headers=admin)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    return headers, set_quota
+
+def upload(client, headers, name: str, size: int):
+    return client.post("/files/upload", files={"file": (name, os.urandom(size))}, headers=headers)
+
+def usage(client, headers) -> dict:
+    return client.get("/files/usage", headers=headers).json()
+
+def test_usage_follows_uploads_and_deletes(client, user):
+    headers, _ = user
+    assert usage(client, headers)["used"] == 0 and usage(client, headers)["files"] == 0
+
+    file_id = upload(client, headers, "a.bin", 3000).json()["file_id"]
+    upload(client, headers, "b.bin", 2000)
+    assert usage(client, headers) == {"used": 5000, "files": 2, "quota": None, "available": None}
+
+    # Replacing a file only counts the difference
+    upload(client, headers, "b.bin", 500)
+    assert usage(client, headers)["used"] == 3500 and usage(client, headers)["files"] == 2
+
+    client.delete(f"/files/{file_id}", headers=headers)
+    assert usage(client, headers)["used"] == 500 and usage(client, headers)["files"] == 1
+
+def test_upload_over_quota(client, user):
+    headers, set_quota = user
+    assert set_quota(5000)["available"] == 5000
+
+    assert upload(client, headers, "a.bin", 3000).status_code == 200
+    staged = os.listdir(blob_store.temp_root)
+    response = upload(client, headers, "b.bin", 3000)
+    assert response.status_code == 413
+    assert usage(client, headers) == {"used": 3000, "files": 1, "quota": 5000, "available": 2000}
+    # The refused upload leaves nothing behind
+    assert os.listdir(blob_store.temp_root) == staged
+
+    # The size of a replaced file counts as free space
+    assert upload(client, headers, "a.bin", 5000).status_code == 200
+    assert usage(client, headers)["available"] == 0
+
+def test_link_over_quota(client, user, register):
+    headers, set_quota = user
+    blob_hash = upload(client, register(), "shared.bin", 3000).json()["checksum"]
+    set_quota(1000)
+
+    response = client.post("/files/link", json={"file_name": "shared.bin", "hash": blob_hash}, headers=headers)
+    assert response.status_code == 413
+    assert usage(client, headers)["used"] == 0
+    # The reference taken for the link is rolled back with it
+    with Database().engine.connect() as connection:
+        assert connection.execute(select(Blob.ref_count).where(Blob.hash == blob_hash)).scalar() == 1
+
+def test_session_over_quota(client, user):
+    headers, set_quota = user
+    set_quota(1000)
+
+    response = client.post("/files/sessions", json={"file_name": "big.bin", "size": 2000}, headers=headers)
+    assert response.status_code == 413
+    response = client.post("/files/sessions", json={"file_name": "small.bin", "size": 1000}, headers=headers)
+    assert response.status_code == 201
+
+def test_lowered_quota_keeps_existing_files(client, user):
+    headers, set_quota = user
+    upload(client, headers, "a.bin", 3000)
+
+    assert set_quota(1000) == {"used": 3000, "files": 1, "quota": 1000, "available": 0}
+    assert upload(client, headers, "b.bin", 1).status_code == 413
+    assert client.get("/files/download", params={"file_name": "a.bin"}, headers=headers).status_code == 200
+
+    assert set_quota(None)["quota"] is None
+    assert upload(client, headers, "b.bin", 1).status_code == 200
+
+def test_invalid_quota(client, register):
+    admin = register("admin")
+    user_id = client.get("/auth/me", headers=register()).json()["id"]
+
+    assert client.put(f"/admin/users/{user_id}/quota", json={"quota": -1}, headers=admin).status_code == 400
+    assert client.put("/admin/users/999999/quota", json={"quota": 1}, headers=admin).status_code == 404
@@ -0,0 +1,90 @@
+import io
+
+import pytest
+from starlette.requests import Request
+
+from server.utils.range_helpers import MAX_RANGES, RangeNotSatisfiable, parse_range_header, ranged_file_response
+
+SIZE = 100
+ETAG = '"abc"'
+
+def make_request(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(name.replace("_", "-").lower().encode(), value.encode()) for name, value in headers.items()],
+    })
+
+def respond(request: Request):
+    return ranged_file_response(request, lambda: io.BytesIO(bytes(SIZE)), SIZE, "f.bin", etag=ETAG)
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", [(0, 9)]),
+    ("bytes=90-", [(90, 99)]),
+    ("bytes=-10", [(90, 99)]),
+    # Ranges reaching past the end are cut at the last byte
+    ("bytes=50-500", [(50, 99)]),
+    ("bytes=-500", [(0, 99)]),
+    ("BYTES = 0-0", [(0, 0)]),
+])
+def test_single_range(header, expected):
+    assert parse_range_header(header, SIZE) == expected
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-10,5-20", [(0, 20)]),
+    ("bytes=0-9,10-19", [(0, 19)]),
+    ("bytes=0-50,10-20", [(0, 50)]),
+    ("bytes=50-59,0-9", [(0, 9), (50, 59)]),
+    ("bytes=0-9, 20-29, -10", [(0, 9), (20, 29), (90, 99)]),
+    ("bytes=80-89,-15", [(80, 99)]),
+])
+def test_ranges_are_sorted_and_merged(header, expected):
+    assert parse_range_header(header, SIZE) == expected
+
+def test_unsatisfiable_ranges_are_dropped():
+    assert parse_range_header("bytes=0-9,200-300,-0", SIZE) == [(0, 9)]
+
+@pytest.mark.parametrize("header", [
+    "items=0-9",
+    "bytes=",
+    "bytes=9-0",
+    "bytes=a-9",
+    "bytes=0-b",
+    "bytes=10",
+])
+def test_malformed_header_is_ignored(header):
+    assert parse_range_header(header, SIZE) is None
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=100-", SIZE),
+    ("bytes=100-200", SIZE),
+    ("bytes=-0", SIZE),
+    ("bytes=200-300,100-", SIZE),
+    ("bytes=0-0", 0),
+    ("bytes=-1", 0),
+])
+def test_no_satisfiable_range(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header(header, size)
+
+def test_max_ranges():
+    disjoint = [f"{i * 10}-{i * 10}" for i in range(MAX_RANGES + 1)]
+    size = len(disjoint) * 10
+
+    assert len(parse_range_header("bytes=" + ",".join(disjoint[:MAX_RANGES]), size)) == MAX_RANGES
+    assert parse_range_header("bytes=" + ",".join(disjoint), size) is None
+
+def test_max_ranges_counts_merged_ranges():
+    overlapping = ",".join(f"{i}-{i + 1}" for i in range(MAX_RANGES * 2))
+    assert parse_range_header(f"bytes={overlapping}", SIZE * 10) == [(0, MAX_RANGES * 2)]
+
+def test_unsatisfiable_range_response():
+    response = respond(make_request(range="bytes=100-"))
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{SIZE}"
+
+def test_unsatisfiable_range_with_stale_if_range_serves_whole_file():
+    response = respond(make_request(range="bytes=100-", if_range='"other"'))
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(SIZE)
@@ -0,0 +1,45 @@
+import hashlib
+
+from sqlalchemy import select, update
+
+from server.models.models import Blob
+from server.utils.database_class import Database
+from server.utils.repair import repairer
+
+def upload(client, headers, data: bytes) -> str:
+    response = client.post("/files/upload", files={"file": ("file.bin", data)}, headers=headers)
+    assert response.status_code == 200, response.text
+    return hashlib.sha256(data).hexdigest()
+
+def set_locations(blob_hash: str, locations):
+    with Database().engine.begin() as connection:
+        connection.execute(update(Blob).where(Blob.hash == blob_hash).values(locations=locations))
+
+def get_locations(blob_hash: str):
+    with Database().engine.connect() as connection:
+        return connection.execute(select(Blob.locations).where(Blob.hash == blob_hash)).scalar_one()
+
+def test_repair_records_the_locations_found(client, headers):
+    blob_hash = upload(client, headers, b"repair me")
+    recorded = get_locations(blob_hash)
+    set_locations(blob_hash, None)
+
+    client.portal.call(repairer.run_once)
+    assert get_locations(blob_hash) == recorded
+
+def test_repair_leaves_locations_changed_during_the_check(client, headers, monkeypatch):
+    blob_hash = upload(client, headers, b"changed meanwhile")
+    recorded = get_locations(blob_hash)
+    set_locations(blob_hash, None)
+    repair_blob = repairer.repair_blob
+
+    def repair_while_changed(checked_hash, locations):
+        result = repair_blob(checked_hash, locations)
+        if checked_hash == blob_hash:
+            # e.g. an upload of the same content recording its replicas
+            set_locations(blob_hash, f"{recorded},elsewhere")
+        return result
+
+    monkeypatch.setattr(repairer, "repair_blob", repair_while_changed)
+    client.portal.call(repairer.run_once)
+    assert get_locations(blob_hash) == f"{recorded},elsewhere"
@@ -0,0 +1,421 @@
+import hashlib
+import hmac
+import importlib
+import os
+import random
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, quote, unquote, urlsplit
+from typing import Tuple
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+import pytest
+
+from server.utils.blob_store import BlobStore
+from server.utils.storage_backends import MemoryBackend, S3Backend, get_backend
+
+ACCESS_KEY = "test-access-key"
+SECRET_KEY = "test-secret-key"
+REGION = "us-east-1"
+
+# server.utils re-exports the blob_store instance under the module's name
+blob_store_module = importlib.import_module("server.utils.blob_store")
+
+class S3Stub(ThreadingHTTPServer):
+    """
+    In-process stand-in for an S3 service: path-style PUT, GET (with Range),
+    HEAD, DELETE, ListObjectsV2 and multipart uploads, with every request's
+    SigV4 signature checked against SECRET_KEY. Listings return `page_size`
+    keys per page so that pagination is exercised.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, page_size: int = 3):
+        super().__init__(("127.0.0.1", 0), S3StubHandler)
+        self.objects = {}
+        # Multipart uploads in progress: path and parts by upload id
+        self.uploads = {}
+        self.page_size = page_size
+        # Status to answer every request with, for testing error handling
+        self.fail_status = None
+        # Answer CompleteMultipartUpload with an error document and status 200, as S3 may
+        self.fail_complete = False
+        self.requests = []
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+def signature_matches(method: str, raw_path: str, headers) -> bool:
+    """Check a request's AWS Signature Version 4 the way S3 does."""
+    authorization = headers.get("authorization", "")
+    algorithm, _, fields = authorization.partition(" ")
+    if algorithm != "AWS4-HMAC-SHA256":
+        return False
+    fields = dict(field.strip().split("=", 1) for field in fields.split(","))
+    access_key, scope = fields["Credential"].split("/", 1)
+    if access_key != ACCESS_KEY:
+        return False
+
+    path, _, query = raw_path.partition("?")
+    signed_headers = fields["SignedHeaders"].split(";")
+    canonical_request = "\n".join([
+        method,
+        path,
+        "&".join(
+            f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}"
+            for name, value in sorted(parse_qsl(query, keep_blank_values=True))
+        ),
+        "".join(f"{name}:{headers[name].strip()}\n" for name in signed_headers),
+        fields["SignedHeaders"],
+        headers["x-amz-content-sha256"],
+    ])
+    string_to_sign = "\n".join([
+        algorithm, headers["x-amz-date"], scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+    ])
+    key = f"AWS4{SECRET_KEY}".encode()
+    for part in scope.split("/"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    expected = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, fields["Signature"])
+
+class S3StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status: int, body: bytes = b"", headers: dict = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if "Content-Length" not in (headers or {}):
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def handle_request(self):
+        server = self.server
+        length = int(self.headers.get("content-length") or 0)
+        body = self.rfile.read(length) if self.command in ("PUT", "POST") else b""
+        server.requests.append((self.command, self.path, self.headers.get("range")))
+
+        if server.fail_status is not None:
+            return self.send(server.fail_status)
+        if not signature_matches(self.command, self.path, self.headers):
+            return self.send(403, b"<Error><Code>SignatureDoesNotMatch</Code></Error>")
+
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+        params = dict(parse_qsl(parts.query, keep_blank_values=True))
+        if self.command == "GET" and params.get("list-type") == "2":
+            return self.list_objects(path.strip("/"), params)
+        if "uploads" in params or "uploadId" in params:
+            return self.multipart_upload(path, params, body)
+
+        if self.command == "PUT":
+            server.objects[path] = body
+            return self.send(200)
+        if self.command == "DELETE":
+            server.objects.pop(path, None)
+            return self.send(204)
+
+        data = server.objects.get(path)
+        if data is None:
+            return self.send(404, headers={"Content-Length": "0"} if self.command == "HEAD" else None)
+        if self.command == "HEAD":
+            return self.send(200, headers={"Content-Length": str(len(data))})
+        byte_range = self.headers.get("range")
+        if byte_range:
+            start, end = (int(value) for value in byte_range.removeprefix("bytes=").split("-"))
+            return self.send(206, data[start:end + 1])
+        self.send(200, data)
+
+    def list_objects(self, bucket: str, params: dict):
+        prefix = params.get("prefix", "")
+        keys = sorted(
+            path[len(bucket) + 2:] for path in self.server.objects
+            if path.startswith(f"/{bucket}/") and path[len(bucket) + 2:].startswith(prefix)
+        )
+        start = int(params.get("continuation-token", 0))
+        page = keys[start:start + self.server.page_size]
+        truncated = start + len(page) < len(keys)
+        body = '<?xml version="1.0" encoding="UTF-8"?>'
+        body += '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+        for key in page:
+            size = len(self.server.objects[f"/{bucket}/{key}"])
+            body += (
+                f"<Contents><Key>{escape(key)}</Key><Size>{size}</Size>"
+                "<LastModified>2024-01-01T00:00:00.000Z</LastModified></Contents>"
+            )
+        body += f"<IsTruncated>{str(truncated).lower()}</IsTruncated>"
+        if truncated:
+            body += f"<NextContinuationToken>{start + len(page)}</NextContinuationToken>"
+        body += "</ListBucketResult>"
+        self.send(200, body.encode())
+
+    def multipart_upload(self, path: str, params: dict, body: bytes):
+        server = self.server
+        if self.command == "POST" and "uploads" in params:
+            upload_id = uuid.uuid4().hex
+            server.uploads[upload_id] = (path, {})
+            return self.send(200, (
+                "<InitiateMultipartUploadResult xmlns=\"http://s3.amazonaws.com/doc/2006-03-01/\">"
+                f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            ).encode())
+
+        upload = server.uploads.get(params["uploadId"])
+        if upload is None or upload[0] != path:
+            return self.send(404, b"<Error><Code>NoSuchUpload</Code></Error>")
+        if self.command == "PUT":
+            upload[1][int(params["partNumber"])] = body
+            return self.send(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"', "Content-Length": "0"})
+        if self.command == "DELETE":
+            del server.uploads[params["uploadId"]]
+            return self.send(204)
+
+        if server.fail_complete:
+            return self.send(200, b"<Error><Code>InternalError</Code></Error>")
+        root = ElementTree.fromstring(body)
+        listed = [(int(part.findtext("PartNumber")), part.findtext("ETag")) for part in root.iter("Part")]
+        if [f'"{hashlib.md5(upload[1][number]).hexdigest()}"' for number, _ in listed] != [etag for _, etag in listed]:
+            return self.send(400, b"<Error><Code>InvalidPart</Code></Error>")
+        server.objects[path] = b"".join(upload[1][number] for number, _ in listed)
+        del server.uploads[params["uploadId"]]
+        self.send(200, b"<CompleteMultipartUploadResult></CompleteMultipartUploadResult>")
+
+    do_GET = do_PUT = do_POST = do_HEAD = do_DELETE = handle_request
+
+@pytest.fixture
+def s3():
+    server = S3Stub()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def s3_backend(s3: S3Stub, prefix: str = "blobs", secret_key: str = SECRET_KEY, part_size: int = 1024) -> S3Backend:
+    return S3Backend(
+        "bucket", prefix, endpoint=s3.endpoint, access_key=ACCESS_KEY, secret_key=secret_key, region=REGION,
+        part_size=part_size
+    )
+
+@pytest.fixture(params=["memory", "local", "s3"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return get_backend("memory://")
+    if request.param == "local":
+        return get_backend(str(tmp_path / "root"))
+    return s3_backend(request.getfixturevalue("s3"))
+
+def test_get_backend():
+    assert isinstance(get_backend("memory://"), MemoryBackend)
+    # Every memory root is a store of its own
+    assert get_backend("memory://") is not get_backend("memory://")
+    with pytest.raises(ValueError):
+        get_backend("ftp://host/path")
+
+def test_put_get_and_delete(backend):
+    data = random.Random(0).randbytes(100_000)
+    backend.put_bytes("ab/cd/object", data)
+
+    assert backend.exists("ab/cd/object")
+    assert backend.stat("ab/cd/object") == len(data)
+    assert backend.read_bytes("ab/cd/object") == data
+    assert backend.read_range("ab/cd/object", 1000, 50) == data[1000:1050]
+    assert backend.read_range("ab/cd/object", len(data) - 10, 50) == data[-10:]
+    with backend.open("ab/cd/object") as f:
+        f.seek(5000)
+        assert f.read(10) == data[5000:5010]
+        f.seek(-10, os.SEEK_END)
+        assert f.read() == data[-10:]
+
+    backend.delete("ab/cd/object")
+    assert not backend.exists("ab/cd/object")
+    backend.delete("ab/cd/object")
+
+def test_missing_object(backend):
+    assert backend.stat("no/such/object") is None
+    assert backend.read_bytes("no/such/object") is None
+    with pytest.raises(FileNotFoundError):
+        backend.open("no/such/object")
+
+def test_aborted_writer_leaves_nothing(backend):
+    with pytest.raises(RuntimeError):
+        with backend.writer("ab/cd/object") as writer:
+            writer.write(b"partial")
+            raise RuntimeError
+    assert not backend.exists("ab/cd/object")
+
+def test_list_objects(backend):
+    keys = [f"{i:02x}/{i:02x}/object-{i}" for i in range(10)]
+    for i, key in enumerate(keys):
+        backend.put_bytes(key, bytes(i))
+
+    assert sorted((key, size) for key, size, _ in backend.list_objects()) == [(key, i) for i, key in enumerate(keys)]
+
+def test_s3_list_objects_pages_and_prefix(s3):
+    backend, other = s3_backend(s3), s3_backend(s3, prefix="other")
+    for i in range(7):
+        backend.put_bytes(f"key-{i}", b"x")
+    other.put_bytes("key-0", b"y")
+
+    assert [key for key, _, _ in backend.list_objects()] == [f"key-{i}" for i in range(7)]
+    listings = [params for method, params, _ in s3.requests if method == "GET" and "list-type=2" in params]
+    assert len(listings) == 3
+    assert [key for key, _, _ in other.list_objects()] == ["key-0"]
+
+def test_s3_requests(s3):
+    backend = s3_backend(s3)
+    backend.put_bytes("ab/cd/object name", b"0123456789")
+
+    assert s3.objects == {"/bucket/blobs/ab/cd/object name": b"0123456789"}
+    assert backend.read_range("ab/cd/object name", 2, 3) == b"234"
+    assert s3.requests[-1] == ("GET", "/bucket/blobs/ab/cd/object%20name", "bytes=2-4")
+
+    requests = len(s3.requests)
+    with backend.open("ab/cd/object name") as f:
+        assert f.read() == b"0123456789"
+    # A HEAD for the size and a single GET for the content
+    assert [method for method, _, _ in s3.requests[requests:]] == ["HEAD", "GET"]
+
+def test_s3_multipart_upload(s3):
+    backend = s3_backend(s3, part_size=5)
+    with backend.writer("key") as writer:
+        for number in range(6):
+            writer.write(b"%04d" % number)
+        # Nothing is visible until the upload is complete
+        assert s3.objects == {}
+
+    assert backend.read_bytes("key") == b"000000010002000300040005"
+    assert s3.uploads == {}
+    methods = [method for method, path, _ in s3.requests if path.startswith("/bucket/blobs/key?")]
+    assert methods == ["POST"] + ["PUT"] * 5 + ["POST"]
+
+def test_s3_small_object_is_one_put(s3):
+    s3_backend(s3, part_size=5).put_bytes("key", b"1234")
+    assert [(method, path) for method, path, _ in s3.requests] == [("PUT", "/bucket/blobs/key")]
+
+@pytest.mark.parametrize("fail", ["write", "complete"])
+def test_s3_failed_multipart_upload_is_aborted(s3, fail):
+    backend = s3_backend(s3, part_size=5)
+    s3.fail_complete = fail == "complete"
+    with pytest.raises(OSError):
+        with backend.writer("key") as writer:
+            writer.write(b"0123456789ab")
+            if fail == "write":
+                raise OSError("source failed")
+
+    assert s3.objects == {} and s3.uploads == {}
+    assert s3.requests[-1][0] == "DELETE"
+
+def test_s3_wrong_secret_key(s3):
+    backend = s3_backend(s3, secret_key="wrong")
+    with pytest.raises(OSError) as error:
+        backend.put_bytes("key", b"data")
+    assert not isinstance(error.value, FileNotFoundError)
+    assert "403" in str(error.value)
+
+def test_s3_server_errors(s3):
+    backend = s3_backend(s3)
+    backend.put_bytes("key", b"data")
+    s3.fail_status = 503
+
+    for operation in (
+        lambda: backend.read_bytes("key"),
+        lambda: backend.stat("key"),
+        lambda: backend.put_bytes("key", b"other"),
+        lambda: backend.delete("key"),
+        lambda: list(backend.list_objects()),
+    ):
+        with pytest.raises(OSError) as error:
+            operation()
+        assert not isinstance(error.value, FileNotFoundError)
+
+    s3.fail_status = None
+    assert backend.read_bytes("key") == b"data"
+
+def test_s3_unreachable():
+    backend = S3Backend("bucket", endpoint="http://127.0.0.1:9", access_key=ACCESS_KEY, secret_key=SECRET_KEY)
+    with pytest.raises(OSError):
+        backend.stat("key")
+
+@pytest.fixture
+def store_factory(s3, tmp_path, monkeypatch):
+    """BlobStores whose "s3://" roots are buckets of the stand-in."""
+    def backend_for(url: str):
+        if url.startswith("s3://"):
+            return s3_backend(s3, prefix=urlsplit(url).path)
+        return get_backend(url)
+    monkeypatch.setattr(blob_store_module, "get_backend", backend_for)
+
+    def make(roots: dict, **options) -> BlobStore:
+        return BlobStore(roots=roots, temp_root=str(tmp_path / "tmp"), **options)
+    return make
+
+def place(store: BlobStore, data: bytes) -> Tuple[str, str]:
+    """Store `data` the way an upload does and return its hash and the roots it went to."""
+    blob_hash = hashlib.sha256(data).hexdigest()
+    path = store.temp_path()
+    with open(path, "wb") as f:
+        f.write(data)
+    locations, _, _, _ = store._place(path, blob_hash)
+    return blob_hash, ",".join(locations)
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_blob_store_replicas(store_factory, compression):
+    store = store_factory(
+        {"s3": "s3://bucket/s3", "mem": "memory://"},
+        replicas=2, write_quorum=2, compression=compression, erasure=""
+    )
+    data = b"".join(b"%d,row\n" % i for i in range(300_000))
+    blob_hash, locations = place(store, data)
+
+    assert sorted(locations.split(",")) == ["mem", "s3"]
+    assert store.find(blob_hash) == store.placement(blob_hash)
+    for location in ("s3", "mem"):
+        with store.open_replica(blob_hash, location) as f:
+            assert f.read() == data
+            f.seek(1_500_000)
+            assert f.read(100) == data[1_500_000:1_500_100]
+    encoded = store.encoded(blob_hash, locations)
+    assert (encoded is None) == (compression == "none")
+    assert store.key(blob_hash) in [key for key, _, _ in store.backends["s3"].list_objects()]
+
+    store.remove(blob_hash)
+    assert store.find(blob_hash) == []
+    assert list(store.backends["s3"].list_objects()) == []
+
+def test_blob_store_reads_other_replica_when_s3_fails(s3, store_factory):
+    store = store_factory({"s3": "s3://bucket/s3", "mem": "memory://"}, replicas=2, write_quorum=2, compression="none", erasure="")
+    data = random.Random(1).randbytes(10_000)
+    blob_hash, _ = place(store, data)
+
+    s3.fail_status = 500
+    with store.open(blob_hash, "s3,mem") as f:
+        assert f.read() == data
+
+def test_blob_store_erasure_coded(s3, store_factory):
+    store = store_factory(
+        {"a": "s3://bucket/a", "b": "s3://bucket/b", "c": "memory://"},
+        compression="none", erasure="2+1", erasure_min_size=0
+    )
+    data = random.Random(2).randbytes(1_300_000)
+    blob_hash, locations = place(store, data)
+
+    assert sorted(locations.split(",")) == ["a", "b", "c"]
+    with store.open(blob_hash, locations) as f:
+        f.seek(600_000)
+        assert f.read(200_000) == data[600_000:800_000]
+        f.seek(0)
+        assert f.read() == data
+
+    # Any one root can be lost
+    store.remove_replica(blob_hash, store.shard_locations(blob_hash)[0])
+    with store.open(blob_hash, locations) as f:
+        assert f.read() == data
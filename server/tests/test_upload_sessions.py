@@ -0,0 +1,97 @@
+import hashlib
+import os
+
+import pytest
+
+from server.services.files import sessions
+from server.services.files.sessions import save_stream
+from server.utils.database_class import Database
+
+DATA = os.urandom(2500)
+
+def create_session(client, headers, name: str, data: bytes = DATA, checksum: str = None) -> dict:
+    response = client.post(
+        "/files/sessions",
+        json={"file_name": name, "size": len(data), "chunk_size": 1000, "checksum": checksum or hashlib.sha256(data).hexdigest()},
+        headers=headers
+    )
+    assert response.status_code == 201, response.text
+    return response.json()
+
+def put_chunk(client, headers, session_id: str, index: int, data: bytes = DATA):
+    return client.put(f"/files/sessions/{session_id}/chunks/{index}", content=data[index * 1000:(index + 1) * 1000], headers=headers)
+
+def test_resume_and_commit(client, headers):
+    session = create_session(client, headers, "resumed.bin")
+    assert session["total_chunks"] == 3 and session["received"] == []
+
+    # The first attempt only gets the last chunk through
+    assert put_chunk(client, headers, session["session_id"], 2).json() == {"index": 2, "size": 500}
+
+    # Resuming starts from the chunks the server lists as received
+    response = client.get(f"/files/sessions/{session['session_id']}", headers=headers)
+    assert response.json()["received"] == [2]
+    for index in (0, 1):
+        assert put_chunk(client, headers, session["session_id"], index).status_code == 200
+
+    response = client.post(f"/files/sessions/{session['session_id']}/commit", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["size"] == len(DATA)
+    assert response.json()["checksum"] == hashlib.sha256(DATA).hexdigest()
+
+    response = client.get("/files/download", params={"file_name": "resumed.bin"}, headers=headers)
+    assert response.status_code == 200 and response.content == DATA
+    # A committed session is gone
+    assert client.get(f"/files/sessions/{session['session_id']}", headers=headers).status_code == 404
+
+def test_commit_with_missing_chunks(client, headers):
+    session = create_session(client, headers, "incomplete.bin")
+    put_chunk(client, headers, session["session_id"], 1)
+
+    response = client.post(f"/files/sessions/{session['session_id']}/commit", headers=headers)
+    assert response.status_code == 409
+    assert "[0, 2]" in response.json()["detail"]
+
+@pytest.mark.parametrize("index, size", [(0, 999), (2, 501)])
+def test_chunk_of_the_wrong_size(client, headers, index, size):
+    session = create_session(client, headers, "wrong-size.bin")
+    response = client.put(f"/files/sessions/{session['session_id']}/chunks/{index}", content=bytes(size), headers=headers)
+    assert response.status_code == 400
+    assert client.get(f"/files/sessions/{session['session_id']}", headers=headers).json()["received"] == []
+
+def test_checksum_mismatch(client, headers):
+    session = create_session(client, headers, "corrupt.bin", checksum="0" * 64)
+    for index in range(3):
+        put_chunk(client, headers, session["session_id"], index)
+
+    response = client.post(f"/files/sessions/{session['session_id']}/commit", headers=headers)
+    assert response.status_code == 400
+    assert client.get("/files/download", params={"file_name": "corrupt.bin"}, headers=headers).status_code == 404
+
+def test_sessions_of_other_users_are_hidden(client, headers, register):
+    session = create_session(client, headers, "private.bin")
+    other = register()
+
+    assert client.get(f"/files/sessions/{session['session_id']}", headers=other).status_code == 404
+    assert put_chunk(client, other, session["session_id"], 0).status_code == 404
+    assert client.post(f"/files/sessions/{session['session_id']}/commit", headers=other).status_code == 404
+
+def test_abort(client, headers):
+    session = create_session(client, headers, "aborted.bin")
+    put_chunk(client, headers, session["session_id"], 0)
+
+    assert client.delete(f"/files/sessions/{session['session_id']}", headers=headers).status_code == 204
+    assert client.get(f"/files/sessions/{session['session_id']}", headers=headers).status_code == 404
+
+def test_no_database_connection_is_held_while_receiving_a_chunk(client, headers, monkeypatch):
+    session = create_session(client, headers, "streamed.bin")
+    pool = Database().async_engine.pool
+    in_use = []
+
+    async def save_and_count(stream, path, max_size):
+        in_use.append(pool.checkedout())
+        return await save_stream(stream, path, max_size)
+
+    monkeypatch.setattr(sessions, "save_stream", save_and_count)
+    assert put_chunk(client, headers, session["session_id"], 0).status_code == 200
+    assert in_use == [0]
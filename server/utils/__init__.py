@@ -1,2 +1,12 @@
 from .database_class import Database
 from .jwt_helpers import check_token_validity, decode_token, get_token_payload, is_token_expired
+from .range_helpers import ranged_file_response
+from .blob_store import BlobStore, WriteQuorumError, blob_store
+from .password_hasher import PasswordHasher, PasswordHasherBusy, password_hasher
+from .cache import TTLCache
+from .migrations import run_migrations
+from .chunking import CHUNKING, chunk_file
+from .repair import Repairer, repairer
+from .garbage import Collector, collector
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, registry as metrics_registry
+from .query_profiler import QueryProfiler, QueryProfilerMiddleware, query_profiler
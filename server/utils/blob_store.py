@@ -0,0 +1,617 @@
+import json
+import os
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from threading import Lock
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import Select, case, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..models.models import Blob, BlobBlock, Tombstone
+from .chunking import chunk_stream
+from .hash_ring import HashRing
+from .compression import FramedReader, compress_file, get_codec, index_path, write_index
+from .erasure import UNIT_SIZE, ErasureReader, manifest_path, parse_scheme, rebuild_shards, shard_path, write_shards
+from .storage_backends import get_backend
+from .metrics import Counter, Histogram
+
+# Seconds a storage root is avoided for reads after it failed one
+ROOT_RETRY_SECONDS = 30
+
+operation_duration = Histogram(
+    "storage_operation_duration_seconds",
+    "Time taken by operations on one storage root: writing, copying, opening and deleting objects.",
+    ("root", "operation")
+)
+root_errors = Counter("storage_errors_total", "Failed reads and writes of a storage root.", ("root",))
+
+class WriteQuorumError(OSError):
+    """Raised when fewer replicas than the write quorum could be written."""
+
+class RootHealth:
+    """Read speed and recent failures of one storage root."""
+
+    def __init__(self, location: str):
+        self.location = location
+        self._lock = Lock()
+        self.seconds_per_mb = None
+        self.errors = 0
+        self.down_until = 0.0
+
+    def observe_read(self, size: int, seconds: float):
+        """Record the time taken to read `size` bytes, as a moving average."""
+        if size <= 0:
+            return
+        sample = seconds / (size / (1024 * 1024))
+        with self._lock:
+            if self.seconds_per_mb is None:
+                self.seconds_per_mb = sample
+            else:
+                self.seconds_per_mb = 0.8 * self.seconds_per_mb + 0.2 * sample
+
+    def observe_error(self):
+        """Record a failed read or write and avoid the root for a while."""
+        root_errors.labels(self.location).inc()
+        with self._lock:
+            self.errors += 1
+            self.down_until = time.monotonic() + ROOT_RETRY_SECONDS
+
+    def rank(self) -> Tuple[bool, float]:
+        """Sort key putting healthy, then faster roots first."""
+        return time.monotonic() < self.down_until, self.seconds_per_mb or 0.0
+
+    def snapshot(self) -> dict:
+        """Current state as a dictionary."""
+        with self._lock:
+            return {
+                "healthy": time.monotonic() >= self.down_until,
+                "errors": self.errors,
+                "read_mb_per_second": 1 / self.seconds_per_mb if self.seconds_per_mb else None,
+            }
+
+class BlobStore:
+    """
+    Content-addressed store for file contents.
+
+    Every distinct content is stored once, named by its SHA-256 hash, and
+    shared by all File rows that reference it. The Blob table keeps a
+    reference count per object so the bytes are only removed once the last
+    file using them is deleted, which the garbage collector does in the
+    background.
+
+    Objects are spread over one or more storage roots (directories, normally
+    on different volumes or nodes, or other backends, see
+    utils/storage_backends.py) by consistent hashing of their hash. With
+    `replicas` > 1 every object is written to that many roots, the next ones
+    clockwise on the ring, and an upload succeeds once `write_quorum` copies
+    are written; the rest finish in the background. The roots an object was
+    written to are recorded in its row, so adding a root only sends new
+    objects to it and never moves existing ones. Reads use the healthy
+    replica on the fastest root and fall back to the others on errors;
+    missing and corrupt replicas are restored by the repairer
+    (utils/repair.py).
+
+    With erasure coding enabled, large objects are stored as k data and m
+    parity shards on k + m roots instead of as replicas (see
+    utils/erasure.py): any k shards are enough to read them, for (k + m) / k
+    times their size rather than `replicas` times.
+
+    Objects that compress well are stored compressed, with a frame index next
+    to them (see utils/compression.py). `open` always returns the original
+    bytes; `encoded` exposes the compressed bytes so they can be sent to
+    clients that accept the encoding without decompressing them.
+    """
+
+    def __init__(
+        self,
+        roots: Optional[Dict[str, str]] = None,
+        temp_root: str = os.path.join(settings.UPLOAD_FOLDER, "tmp"),
+        replicas: int = settings.STORAGE_REPLICAS,
+        write_quorum: Optional[int] = settings.STORAGE_WRITE_QUORUM,
+        compression: str = settings.STORAGE_COMPRESSION,
+        compression_level: int = settings.STORAGE_COMPRESSION_LEVEL,
+        min_saving: float = settings.STORAGE_COMPRESSION_MIN_SAVING,
+        erasure: str = settings.STORAGE_ERASURE,
+        erasure_min_size: int = settings.STORAGE_ERASURE_MIN_SIZE
+    ):
+        self.roots = roots or settings.STORAGE_ROOTS or {"default": os.path.join(settings.UPLOAD_FOLDER, "blobs")}
+        self.backends = {location: get_backend(url) for location, url in self.roots.items()}
+        self.ring = HashRing(self.roots)
+        self.health = {location: RootHealth(location) for location in self.roots}
+        self.replicas = max(1, min(replicas, len(self.roots)))
+        # A majority of the replicas by default
+        self.write_quorum = min(write_quorum or self.replicas // 2 + 1, self.replicas)
+        self.temp_root = temp_root
+        self.codec = get_codec(compression, compression_level)
+        self.min_saving = min_saving
+        self.erasure = parse_scheme(erasure)
+        if self.erasure is not None and sum(self.erasure) > len(self.roots):
+            raise ValueError(f"Erasure coding {erasure} needs at least {sum(self.erasure)} storage roots")
+        self.erasure_min_size = erasure_min_size
+        self._pool = ThreadPoolExecutor(max_workers=4 * len(self.roots), thread_name_prefix="blob-replica")
+
+    def key(self, blob_hash: str) -> str:
+        """Key of an object in every storage root, fanned out over two directory levels."""
+        return f"{blob_hash[:2]}/{blob_hash[2:4]}/{blob_hash}"
+
+    def placement(self, blob_hash: str) -> List[str]:
+        """Storage roots a new object is written to."""
+        return self.ring.preference_list(blob_hash, self.replicas)
+
+    def _read_json(self, location: str, key: str) -> Optional[dict]:
+        data = self.backends[location].read_bytes(key)
+        return None if data is None else json.loads(data)
+
+    def _present(self, blob_hash: str, location: str) -> bool:
+        backend, key = self.backends[location], self.key(blob_hash)
+        return backend.exists(key) or backend.exists(manifest_path(key))
+
+    def find(self, blob_hash: str) -> List[str]:
+        """
+        Storage roots holding an object or one of its shards, looked for in every root.
+
+        The roots the object hashes to come first; the others only matter for
+        objects stored before roots were added.
+        """
+        placement = self.placement(blob_hash)
+        return [
+            location for location in placement + [root for root in self.roots if root not in placement]
+            if self._present(blob_hash, location)
+        ]
+
+    def replica_locations(self, blob_hash: str, locations: Optional[str] = None) -> List[str]:
+        """
+        Storage roots of an object's replicas, best first for reading.
+
+        `locations` is the comma-separated list recorded in the blob row; when
+        it is unknown the roots are searched.
+        """
+        known = [location for location in (locations or "").split(",") if location in self.roots]
+        if not known:
+            known = self.find(blob_hash) or self.placement(blob_hash)
+        return sorted(known, key=lambda location: self.health[location].rank())
+
+    def _best_location(self, blob_hash: str, locations: Optional[str]) -> str:
+        candidates = self.replica_locations(blob_hash, locations)
+        for location in candidates:
+            if self._present(blob_hash, location):
+                return location
+        return candidates[0]
+
+    def temp_path(self) -> str:
+        """Path for a new temporary file that will later be added to the store."""
+        os.makedirs(self.temp_root, exist_ok=True)
+        return os.path.join(self.temp_root, uuid.uuid4().hex)
+
+    def exists(self, blob_hash: str, locations: Optional[str] = None) -> bool:
+        """Check whether the bytes of an object are present."""
+        return self._present(blob_hash, self._best_location(blob_hash, locations))
+
+    def read_manifest(self, blob_hash: str, location: str) -> Optional[dict]:
+        """Manifest of the shard of an object on one root, or None if it holds no shard of it."""
+        return self._read_json(location, manifest_path(self.key(blob_hash)))
+
+    def write_manifest(self, blob_hash: str, location: str, manifest: dict):
+        """Write the manifest of a shard, which makes the shard visible."""
+        self.backends[location].put_bytes(manifest_path(self.key(blob_hash)), json.dumps(manifest).encode())
+
+    def shard_locations(self, blob_hash: str) -> Dict[int, str]:
+        """Storage roots holding the shards of an erasure coded object by shard number, looked for in every root."""
+        shards = {}
+        for location, backend in self.backends.items():
+            manifest = self.read_manifest(blob_hash, location)
+            if manifest is not None and backend.exists(shard_path(self.key(blob_hash))):
+                shards[manifest["shard"]] = location
+        return shards
+
+    def open_shards(self, blob_hash: str, shards: Dict[int, str], manifest: dict) -> ErasureReader:
+        """Open an erasure coded object for reading its stored bytes from the given shards."""
+        key = shard_path(self.key(blob_hash))
+        openers = {shard: partial(self.backends[location].open, key) for shard, location in shards.items()}
+        return ErasureReader(openers, manifest, self._pool)
+
+    def _open_stored(self, blob_hash: str, location: str) -> BinaryIO:
+        """Open the stored, possibly compressed bytes of an object through one root."""
+        manifest = self.read_manifest(blob_hash, location)
+        if manifest is None:
+            return self.backends[location].open(self.key(blob_hash))
+        return self.open_shards(blob_hash, self.shard_locations(blob_hash), manifest)
+
+    def open_replica(self, blob_hash: str, location: str) -> BinaryIO:
+        """Open one replica of a stored object for reading its original bytes, decompressing if needed."""
+        with operation_duration.labels(location, "open").time():
+            f = self._open_stored(blob_hash, location)
+            index = self._read_json(location, index_path(self.key(blob_hash)))
+        if index is None:
+            return f
+        return FramedReader(f, index)
+
+    def open(self, blob_hash: str, locations: Optional[str] = None) -> BinaryIO:
+        """
+        Open a stored object for reading its original bytes.
+
+        Replicas are tried best first; a root that fails is avoided for a while.
+        """
+        for location in self.replica_locations(blob_hash, locations):
+            try:
+                return self.open_replica(blob_hash, location)
+            except FileNotFoundError:
+                continue
+            except OSError:
+                self.health[location].observe_error()
+        raise FileNotFoundError(f"No replica of {blob_hash} is available")
+
+    def encoded(self, blob_hash: str, locations: Optional[str] = None) -> Optional[Tuple[str, Callable[[], BinaryIO], int]]:
+        """
+        Compressed form of a stored object.
+
+        Returns:
+            Optional[Tuple[str, Callable[[], BinaryIO], int]]: Content coding,
+            opener and size of the stored bytes, or None if the object is
+            stored uncompressed
+        """
+        location = self._best_location(blob_hash, locations)
+        index = self._read_json(location, index_path(self.key(blob_hash)))
+        if index is None:
+            return None
+        return index["encoding"], lambda: self._open_stored(blob_hash, location), index["stored_size"]
+
+    def snapshot(self) -> dict:
+        """Storage roots and their health as a dictionary."""
+        return {
+            "replicas": self.replicas,
+            "write_quorum": self.write_quorum,
+            "erasure": "+".join(map(str, self.erasure)) if self.erasure else None,
+            "roots": {
+                location: {"path": path, **self.health[location].snapshot()}
+                for location, path in self.roots.items()
+            },
+        }
+
+    async def get(self, db: AsyncSession, blob_hash: str):
+        """Retrieve a blob row, or None if the content is not stored."""
+        result = await db.execute(
+            select(Blob).where(Blob.hash == blob_hash).execution_options(populate_existing=True)
+        )
+        return result.scalars().first()
+
+    async def acquire(self, db: AsyncSession, blob_hash: str) -> bool:
+        """
+        Take a reference to an existing blob.
+
+        Only live blobs count: the bytes of a blob without references may be
+        being removed by the garbage collector.
+
+        Returns:
+            bool: False if there is no such blob
+        """
+        result = await db.execute(
+            update(Blob).where(Blob.hash == blob_hash, Blob.ref_count > 0).values(ref_count=Blob.ref_count + 1)
+        )
+        return result.rowcount > 0
+
+    def _insert(self, db: AsyncSession):
+        """INSERT construct of the database dialect, supporting ON CONFLICT."""
+        return postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+
+    def write_replica(self, source: str, blob_hash: str, location: str):
+        """Copy a staged object and its frame index to a storage root."""
+        backend, key = self.backends[location], self.key(blob_hash)
+        with operation_duration.labels(location, "write").time():
+            # The index goes first: an object only exists once its bytes are in place
+            if os.path.exists(index_path(source)):
+                with open(index_path(source), "rb") as f:
+                    backend.put(index_path(key), f)
+            with open(source, "rb") as f:
+                backend.put(key, f)
+
+    def copy_replica(self, blob_hash: str, source_location: str, location: str, throttle=None):
+        """Copy a stored object and its frame index from one storage root to another."""
+        source, backend, key = self.backends[source_location], self.backends[location], self.key(blob_hash)
+        with operation_duration.labels(location, "copy").time():
+            index = source.read_bytes(index_path(key))
+            if index is not None:
+                backend.put_bytes(index_path(key), index)
+            with source.open(key) as f:
+                backend.put(key, f, throttle)
+
+    def _replicate(self, source: str, blob_hash: str, locations: List[str]):
+        """
+        Write replicas of a staged object to several roots in parallel.
+
+        Returns once the write quorum is reached. The remaining copies keep
+        going in the background and the staged file is removed after the
+        last one.
+
+        Raises:
+            WriteQuorumError: If too many replicas failed for the quorum to be reached
+        """
+        remaining = [len(locations)]
+        lock = Lock()
+
+        def write(location: str):
+            try:
+                self.write_replica(source, blob_hash, location)
+            except OSError:
+                self.health[location].observe_error()
+                raise
+            finally:
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    for path in (source, index_path(source)):
+                        if os.path.exists(path):
+                            os.remove(path)
+
+        futures = [self._pool.submit(write, location) for location in locations]
+        written = failed = 0
+        for future in as_completed(futures):
+            if future.exception() is None:
+                written += 1
+            else:
+                failed += 1
+            if written >= self.write_quorum:
+                return
+            if failed > len(locations) - self.write_quorum:
+                raise WriteQuorumError(
+                    f"{failed} of {len(locations)} replicas could not be written, {self.write_quorum} needed"
+                )
+
+    def _place_shards(self, source: str, blob_hash: str) -> List[str]:
+        """
+        Erasure code a staged object over k + m storage roots.
+
+        The frame index of a compressed object is copied next to every shard
+        before the shards are written, and each shard's manifest after it,
+        since an object only exists once its manifests are in place. The
+        staged file is removed afterwards.
+
+        Returns:
+            List[str]: Storage roots holding the shards written, in shard order
+
+        Raises:
+            WriteQuorumError: If fewer than k + ceil(m / 2) shards could be written
+        """
+        k, m = self.erasure
+        quorum = k + (m + 1) // 2
+        locations = self.ring.preference_list(blob_hash, k + m)
+        key = self.key(blob_hash)
+        try:
+            index = None
+            if os.path.exists(index_path(source)):
+                with open(index_path(source), "rb") as f:
+                    index = f.read()
+            writers = []
+            for location in locations:
+                try:
+                    if index is not None:
+                        self.backends[location].put_bytes(index_path(key), index)
+                    writers.append(self.backends[location].writer(shard_path(key)))
+                except OSError:
+                    writers.append(None)
+
+            size = os.path.getsize(source)
+            started = time.perf_counter()
+            hashes = write_shards(source, writers, k, m, self._pool)
+            # The shards are written in parallel, so each took about as long as all of them
+            for location, shard_hash in zip(locations, hashes):
+                if shard_hash is not None:
+                    operation_duration.labels(location, "write_shard").observe(time.perf_counter() - started)
+            written = []
+            for shard, (location, shard_hash) in enumerate(zip(locations, hashes)):
+                try:
+                    if shard_hash is None:
+                        raise OSError(f"Shard {shard} of {blob_hash} could not be written")
+                    self.write_manifest(blob_hash, location, {
+                        "k": k, "m": m, "unit": UNIT_SIZE, "size": size, "shard": shard, "hashes": hashes
+                    })
+                    written.append(location)
+                except OSError:
+                    self.health[location].observe_error()
+                    self.remove_replica(blob_hash, location)
+
+            if len(written) < quorum:
+                for location in written:
+                    self.remove_replica(blob_hash, location)
+                raise WriteQuorumError(
+                    f"{k + m - len(written)} of {k + m} shards could not be written, {quorum} needed"
+                )
+            return written
+        finally:
+            for path in (source, index_path(source)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def rebuild_shards(self, blob_hash: str, good: Dict[int, str], targets: Dict[int, str], throttle=None):
+        """
+        Recompute shards of an erasure coded object from good ones.
+
+        `good` and `targets` map shard numbers to the storage roots holding
+        them and the roots to write them to.
+
+        Raises:
+            OSError: If the shards could not be rebuilt; nothing is left on the targets
+        """
+        key = self.key(blob_hash)
+        source = next(iter(good.values()))
+        manifest = self.read_manifest(blob_hash, source)
+        try:
+            index = self.backends[source].read_bytes(index_path(key))
+            writers = {}
+            for shard, location in targets.items():
+                if index is not None:
+                    self.backends[location].put_bytes(index_path(key), index)
+                writers[shard] = self.backends[location].writer(shard_path(key))
+            with self.open_shards(blob_hash, good, manifest) as reader:
+                hashes = rebuild_shards(reader, writers, throttle)
+            for shard, shard_hash in hashes.items():
+                if shard_hash != manifest["hashes"][shard]:
+                    raise OSError(f"Rebuilt shard {shard} of {blob_hash} does not match its hash")
+            for shard, location in targets.items():
+                self.write_manifest(blob_hash, location, {**manifest, "shard": shard})
+        except OSError:
+            for location in targets.values():
+                self.remove_replica(blob_hash, location)
+            raise
+
+    def _place(self, temp_path: str, blob_hash: str) -> Tuple[List[str], Optional[str], int, Optional[str]]:
+        """
+        Move a temporary file into place, compressing it if that saves enough space.
+
+        Objects go to the storage roots the hash ring assigns them, as
+        replicas or, when erasure coding is enabled and their stored size is
+        at least `erasure_min_size`, as shards.
+
+        Returns:
+            Tuple[List[str], Optional[str], int, Optional[str]]: Storage roots,
+            content coding and size of the stored bytes, and erasure coding scheme
+        """
+        source = temp_path
+        encoding = None
+        if self.codec is not None:
+            compressed = compress_file(temp_path, f"{temp_path}.z", self.codec, self.min_saving)
+            if compressed is not None:
+                stored_size, offsets = compressed
+                write_index(f"{temp_path}.z", self.codec, os.path.getsize(temp_path), stored_size, offsets)
+                os.remove(temp_path)
+                source = f"{temp_path}.z"
+                encoding = self.codec.name
+        stored_size = os.path.getsize(source)
+
+        if self.erasure is not None and stored_size >= self.erasure_min_size:
+            erasure = "+".join(map(str, self.erasure))
+            return self._place_shards(source, blob_hash), encoding, stored_size, erasure
+
+        locations = self.placement(blob_hash)
+        if len(locations) == 1:
+            backend, key = self.backends[locations[0]], self.key(blob_hash)
+            with operation_duration.labels(locations[0], "write").time():
+                if encoding is not None:
+                    backend.put_file(index_path(key), index_path(source))
+                backend.put_file(key, source)
+        else:
+            self._replicate(source, blob_hash, locations)
+        return locations, encoding, stored_size, None
+
+    async def add(self, db: AsyncSession, temp_path: str, blob_hash: str, size: int) -> Blob:
+        """
+        Add a fully written temporary file to the store and take a reference.
+
+        If a live blob already holds the content the temporary file is
+        discarded and only the reference count changes, so repeat uploads cost
+        no disk space. Otherwise the row is claimed before the bytes are
+        written: it stays locked until the caller commits, and the garbage
+        collector only removes bytes while holding the rows of their blobs,
+        so it can't remove the new bytes of a blob it is collecting. The row
+        is upserted in a single statement, so concurrent uploads of the same
+        content cannot race each other.
+        """
+        if await self.acquire(db, blob_hash):
+            await run_in_threadpool(os.remove, temp_path)
+            return await self.get(db, blob_hash)
+
+        # A row without references is being collected: revive it with this reference
+        result = await db.execute(
+            self._insert(db)(Blob)
+            .values(hash=blob_hash, size=size, ref_count=1)
+            .on_conflict_do_update(
+                index_elements=[Blob.hash],
+                set_={"ref_count": case((Blob.ref_count > 0, Blob.ref_count + 1), else_=1)}
+            )
+            .returning(Blob.ref_count)
+        )
+        if result.scalar_one() > 1:
+            # A concurrent upload of the same content stored it first
+            await run_in_threadpool(os.remove, temp_path)
+            return await self.get(db, blob_hash)
+
+        locations, encoding, stored_size, erasure = await run_in_threadpool(self._place, temp_path, blob_hash)
+        await db.execute(
+            update(Blob)
+            .where(Blob.hash == blob_hash)
+            .values(locations=",".join(locations), encoding=encoding, stored_size=stored_size, erasure=erasure)
+        )
+        return await self.get(db, blob_hash)
+
+    async def release(self, db: AsyncSession, blob_hash: str):
+        """
+        Drop a reference to a blob.
+
+        The reference is recorded as a tombstone, so deleting a file is a
+        single insert. The garbage collector (utils/garbage.py) applies
+        tombstones to the reference counts in batches and removes content
+        that is no longer referenced.
+        """
+        await db.execute(insert(Tombstone).values(blob_hash=blob_hash))
+
+    async def release_files(self, db: AsyncSession, blob_hashes: Select):
+        """Drop the references of many files at once, given a query selecting their blob hashes."""
+        await db.execute(insert(Tombstone).from_select(["blob_hash"], blob_hashes))
+
+    async def blocks(self, db: AsyncSession, blob_hash: str) -> List[Tuple[int, int, str]]:
+        """
+        Content-defined blocks of a blob, used for delta transfers.
+
+        The blocks are computed from the stored bytes the first time they are
+        needed and kept in the database afterwards.
+
+        Returns:
+            List[Tuple[int, int, str]]: Offset, size and SHA-256 hash of every block
+        """
+        result = await db.execute(
+            select(BlobBlock.start, BlobBlock.size, BlobBlock.hash)
+            .where(BlobBlock.blob_hash == blob_hash)
+            .order_by(BlobBlock.position)
+        )
+        blocks = [tuple(row) for row in result.all()]
+        if blocks:
+            return blocks
+
+        blob = await self.get(db, blob_hash)
+        blocks = await run_in_threadpool(self._chunk, blob_hash, blob.locations if blob else None)
+        await self.save_blocks(db, blob_hash, blocks)
+        return blocks
+
+    def _chunk(self, blob_hash: str, locations: Optional[str]) -> List[Tuple[int, int, str]]:
+        with self.open(blob_hash, locations) as f:
+            return chunk_stream(f)
+
+    async def save_blocks(self, db: AsyncSession, blob_hash: str, blocks: List[Tuple[int, int, str]]):
+        """Store the blocks of a blob, unless a concurrent request already did."""
+        if not blocks:
+            return
+        await db.execute(
+            self._insert(db)(BlobBlock).on_conflict_do_nothing(),
+            [
+                {"blob_hash": blob_hash, "position": position, "start": start, "size": size, "hash": block_hash}
+                for position, (start, size, block_hash) in enumerate(blocks)
+            ]
+        )
+
+    def remove_replica(self, blob_hash: str, location: str):
+        """Delete one replica or shard of an object."""
+        backend, key = self.backends[location], self.key(blob_hash)
+        with operation_duration.labels(location, "delete").time():
+            for name in (manifest_path(key), key, shard_path(key), index_path(key)):
+                backend.delete(name)
+
+    def remove(self, blob_hash: str):
+        """Delete the bytes of an unreferenced blob from every storage root."""
+        for location in self.roots:
+            self.remove_replica(blob_hash, location)
+
+    def remove_many(self, blob_hashes: List[str]):
+        """Delete the bytes of several unreferenced blobs in parallel."""
+        for _ in self._pool.map(self.remove, blob_hashes):
+            pass
+
+blob_store = BlobStore()
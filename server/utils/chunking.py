@@ -0,0 +1,104 @@
+import hashlib
+from typing import BinaryIO, Iterator, List, Tuple
+
+# Content-defined chunking used for delta transfers. The client is installed
+# on its own, so client/chunking.py is a copy of server/utils/chunking.py that
+# must stay identical to it (test_chunking.py checks this). Any change to the
+# algorithm or its parameters needs a new name.
+CHUNKING = "cdc-v2"
+MIN_BLOCK_SIZE = 32 * 1024
+NORMAL_BLOCK_SIZE = 64 * 1024
+MAX_BLOCK_SIZE = 256 * 1024
+
+# FastCDC: a gear hash rolls over every byte, h = (h << 1) + GEAR[byte] in 32
+# bits, so it only depends on the last WINDOW bytes. A position is a boundary
+# when the hash has none of the mask bits set. Up to NORMAL_BLOCK_SIZE the
+# stricter mask makes a boundary less likely and after it the looser one more
+# likely, which keeps block sizes close to the normal size.
+WINDOW = 32
+HASH_MASK = 0xFFFFFFFF
+STRICT_MASK = ((1 << 18) - 1) << 14
+LOOSE_MASK = ((1 << 14) - 1) << 18
+# Random 32-bit value of every byte, the same everywhere
+GEAR = tuple(int.from_bytes(hashlib.sha256(b"gear %d" % value).digest()[:4], "big") for value in range(256))
+
+READ_SIZE = 4 * 1024 * 1024
+
+def find_boundary(buffer: bytes, start: int, end: int) -> int:
+    """
+    End of the block starting at `start`, no further than `end`.
+
+    Boundaries before MIN_BLOCK_SIZE are not considered, so only the WINDOW
+    bytes before the first possible one are hashed to fill the window.
+    """
+    if end - start <= MIN_BLOCK_SIZE:
+        return end
+    gear = GEAR
+    h = 0
+    for value in buffer[start + MIN_BLOCK_SIZE - WINDOW:start + MIN_BLOCK_SIZE - 1]:
+        h = ((h << 1) + gear[value]) & HASH_MASK
+
+    position = start + MIN_BLOCK_SIZE - 1
+    normal = min(start + NORMAL_BLOCK_SIZE, end)
+    for value in buffer[position:normal]:
+        h = ((h << 1) + gear[value]) & HASH_MASK
+        position += 1
+        if not h & STRICT_MASK:
+            return position
+    for value in buffer[normal:end]:
+        h = ((h << 1) + gear[value]) & HASH_MASK
+        position += 1
+        if not h & LOOSE_MASK:
+            return position
+    return end
+
+def iter_blocks(f: BinaryIO) -> Iterator[bytes]:
+    """
+    Split a stream into content-defined blocks.
+
+    Block boundaries depend only on the bytes just before them, so inserting or
+    removing data only changes the blocks around the edit and the rest of the
+    file still splits into the same blocks. Each block is between MIN_BLOCK_SIZE
+    and MAX_BLOCK_SIZE bytes, except the last one which may be shorter.
+
+    The hash runs in the interpreter, at about 10 MB/s; the first
+    MIN_BLOCK_SIZE bytes of every block are skipped, which is about half of
+    them.
+    """
+    buffer = b""
+    pos = 0
+    eof = False
+
+    while True:
+        if not eof and len(buffer) - pos < MAX_BLOCK_SIZE:
+            data = f.read(READ_SIZE)
+            eof = not data
+            buffer = buffer[pos:] + data
+            pos = 0
+            continue
+
+        if pos >= len(buffer):
+            return
+
+        cut = find_boundary(buffer, pos, min(pos + MAX_BLOCK_SIZE, len(buffer)))
+        yield buffer[pos:cut]
+        pos = cut
+
+def chunk_stream(f: BinaryIO) -> List[Tuple[int, int, str]]:
+    """
+    Split a stream into content-defined blocks.
+
+    Returns:
+        List[Tuple[int, int, str]]: Offset, size and SHA-256 hash of every block
+    """
+    blocks = []
+    offset = 0
+    for block in iter_blocks(f):
+        blocks.append((offset, len(block), hashlib.sha256(block).hexdigest()))
+        offset += len(block)
+    return blocks
+
+def chunk_file(path: str) -> List[Tuple[int, int, str]]:
+    """Split a file into content-defined blocks, see `chunk_stream`."""
+    with open(path, "rb") as f:
+        return chunk_stream(f)
@@ -0,0 +1,255 @@
+import io
+import json
+import os
+import struct
+import zlib
+from typing import BinaryIO, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd support is optional
+    zstandard = None
+
+# Files are compressed in independent frames of this many bytes, so that any
+# byte range can be read by decompressing only the frames that contain it
+FRAME_SIZE = 1024 * 1024
+
+class Codec:
+    """
+    Compression format used for stored blobs.
+
+    The name is the HTTP content coding of the format. Stored files are a
+    single valid stream in that coding, so they can be sent to clients as-is
+    with a Content-Encoding header, made of frames that can each be
+    decompressed on their own.
+    """
+
+    def __init__(self, name: str, level: int):
+        self.name = name
+        self.level = level
+
+    def header(self) -> bytes:
+        """Bytes written before the first frame."""
+        return b""
+
+    def compressor(self):
+        """
+        New compressor for one file, with `compress(frame) -> bytes` returning
+        an independent frame and `finish() -> bytes` the end of the stream.
+        """
+        raise NotImplementedError
+
+    def decompress(self, data: bytes) -> bytes:
+        """Decompress one frame."""
+        raise NotImplementedError
+
+class _DeflateFrames:
+    """Raw deflate stream with a full flush after every frame, followed by the gzip trailer."""
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        self._crc = 0
+        self._size = 0
+
+    def compress(self, data: bytes) -> bytes:
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        # A full flush resets the compressor, so the frame does not refer to earlier data
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FULL_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush() + struct.pack("<II", self._crc, self._size & 0xFFFFFFFF)
+
+class GzipCodec(Codec):
+    """gzip as a single member, so that every gzip decoder can read it."""
+
+    def header(self) -> bytes:
+        # Magic, deflate, no flags, no modification time, no extra flags, unknown OS
+        return b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+    def compressor(self):
+        return _DeflateFrames(self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompressobj(-15).decompress(data)
+
+class _ZstdFrames:
+    """Sequence of zstd frames, which is itself a valid zstd stream."""
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return b""
+
+class ZstdCodec(Codec):
+    """Zstandard (requires the zstandard package)."""
+
+    def compressor(self):
+        return _ZstdFrames(self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zstandard.ZstdDecompressor().decompress(data)
+
+def get_codec(name: str, level: int) -> Optional[Codec]:
+    """
+    Codec by content coding name, or None to store files uncompressed.
+
+    Raises:
+        ValueError: If the codec is unknown or its package is not installed
+    """
+    name = (name or "none").lower()
+    if name == "none":
+        return None
+    if name == "gzip":
+        return GzipCodec(name, level)
+    if name == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        return ZstdCodec(name, level)
+    raise ValueError(f"Unknown compression codec '{name}'")
+
+def index_path(path: str) -> str:
+    """Path of the frame index stored next to a compressed file."""
+    return f"{path}.idx"
+
+def compress_file(source: str, destination: str, codec: Codec, min_saving: float) -> Optional[Tuple[int, List[int]]]:
+    """
+    Compress a file frame by frame.
+
+    The first frame is compressed before anything is written, so data that
+    does not compress (archives, media, encrypted files) costs a single frame.
+    Compression is abandoned if it does not save at least `min_saving` of the
+    size.
+
+    Returns:
+        Optional[Tuple[int, List[int]]]: Compressed size and the offset of
+        every frame followed by the offset where the last one ends, or None if
+        the file was not worth compressing
+    """
+    size = os.path.getsize(source)
+    if size == 0:
+        return None
+
+    compressor = codec.compressor()
+    with open(source, "rb") as src:
+        frame = src.read(FRAME_SIZE)
+        compressed = compressor.compress(frame)
+        if len(compressed) > len(frame) * (1 - min_saving):
+            return None
+
+        header = codec.header()
+        offsets = [len(header)]
+        with open(destination, "wb") as dest:
+            dest.write(header)
+            while frame:
+                dest.write(compressed)
+                offsets.append(offsets[-1] + len(compressed))
+                frame = src.read(FRAME_SIZE)
+                if frame:
+                    compressed = compressor.compress(frame)
+            trailer = compressor.finish()
+            dest.write(trailer)
+
+    stored_size = offsets[-1] + len(trailer)
+    if stored_size > size * (1 - min_saving):
+        os.remove(destination)
+        return None
+    return stored_size, offsets
+
+def write_index(path: str, codec: Codec, size: int, stored_size: int, offsets: List[int]):
+    """Write the frame index of a compressed file."""
+    with open(index_path(path), "w") as f:
+        json.dump({
+            "encoding": codec.name,
+            "size": size,
+            "stored_size": stored_size,
+            "frame_size": FRAME_SIZE,
+            "offsets": offsets,
+        }, f)
+
+class FramedReader(io.RawIOBase):
+    """
+    Seekable reader of the decompressed contents of a frame-compressed file,
+    given a seekable reader of the compressed bytes.
+
+    Reads only decompress the frames they touch, and the last frame is kept
+    so that sequential reads decompress every frame once.
+    """
+
+    def __init__(self, f: BinaryIO, index: dict):
+        self.codec = get_codec(index["encoding"], 0)
+        self.size = index["size"]
+        self.frame_size = index["frame_size"]
+        self.offsets = index["offsets"]
+        self.position = 0
+        self._file = f
+        self._frame_number = None
+        self._frame = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, position: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            position += self.position
+        elif whence == io.SEEK_END:
+            position += self.size
+        self.position = max(0, position)
+        return self.position
+
+    def _load_frame(self, number: int) -> bytes:
+        """
+        Decompressed content of one frame.
+
+        Raises:
+            ValueError: If the frame doesn't decompress to the length the index gives it
+        """
+        if number != self._frame_number:
+            expected = min(self.frame_size, self.size - number * self.frame_size)
+            if number + 1 >= len(self.offsets):
+                raise ValueError(f"Frame {number} is missing from the index")
+            start, end = self.offsets[number], self.offsets[number + 1]
+            self._file.seek(start)
+            frame = self.codec.decompress(self._file.read(end - start))
+            # A short frame would make read() loop forever
+            if len(frame) != expected:
+                raise ValueError(f"Frame {number} is {len(frame)} bytes, expected {expected}")
+            self._frame = frame
+            self._frame_number = number
+        return self._frame
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self.position
+        size = min(size, self.size - self.position)
+        if size <= 0:
+            return b""
+
+        parts = []
+        while size > 0:
+            number, offset = divmod(self.position, self.frame_size)
+            frame = self._load_frame(number)
+            part = frame[offset:offset + size]
+            parts.append(part)
+            self.position += len(part)
+            size -= len(part)
+        return b"".join(parts)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
@@ -1,17 +1,118 @@
-from sqlalchemy import create_engine
+import atexit
+import os
+import shutil
+import tempfile
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from ..config import settings
+from .metrics import Gauge
+from .query_profiler import query_profiler
 
 # Base class for all database models
 Base = declarative_base()
 
+# Async drivers used for the sync database URLs
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(url: str) -> str:
+    """
+    Convert a database URL to use the async driver of its dialect.
+
+    URLs that already name an async driver are returned unchanged.
+    """
+    parsed = make_url(url)
+    async_driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if async_driver is None or parsed.drivername in ASYNC_DRIVERS.values():
+        return url
+    return parsed.set(drivername=async_driver).render_as_string(hide_password=False)
+
+def is_memory_url(url: str) -> bool:
+    """Whether a URL asks for an in-memory SQLite database ("sqlite://" or "sqlite:///:memory:")."""
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+
+def memory_database_directory() -> str:
+    """
+    Directory for a new, empty SQLite database kept in memory, removed at exit or by Database.close().
+
+    SQLite's own in-memory databases belong to a single connection, which
+    would make every request wait for the one using it, and the sync and async
+    engines couldn't share it. Instead the database is a file on a RAM-backed
+    file system (/dev/shm where there is one), which works like any other
+    SQLite file, concurrent readers included, without touching the disk.
+    """
+    directory = tempfile.mkdtemp(prefix="storage-db-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    return directory
+
+def configure_sqlite(engine: Engine, synchronous: str = settings.SQLITE_SYNCHRONOUS):
+    """
+    Apply the SQLITE_* settings to every new connection of an engine.
+
+    In WAL mode readers don't block the writer or each other; SQLite still
+    allows a single writer at a time, and other writers wait up to
+    SQLITE_BUSY_TIMEOUT for it instead of failing. The drivers begin
+    transactions only at the first write, so a request that reads before
+    writing waits for the lock too, rather than failing on a stale snapshot.
+    Foreign keys are enforced, as on PostgreSQL, so deleting a user also
+    deletes their upload sessions and usage counters.
+    """
+    pragmas = [
+        f"journal_mode={settings.SQLITE_JOURNAL_MODE}",
+        f"synchronous={synchronous}",
+        f"busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT * 1000)}",
+        # A negative cache size is in KiB
+        f"cache_size={-settings.SQLITE_CACHE_SIZE_MB * 1024}",
+        f"mmap_size={settings.SQLITE_MMAP_SIZE_MB * 1024 * 1024}",
+        "temp_store=MEMORY",
+        "foreign_keys=ON",
+    ]
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+def pool_connections() -> dict:
+    """Connections of the async engine's pool by state, for the metrics."""
+    pool = Database().async_engine.pool
+    if not hasattr(pool, "checkedout"):
+        # Pools that don't keep connections (e.g. NullPool) have nothing to report
+        return {}
+    return {
+        ("in_use",): pool.checkedout(),
+        ("idle",): pool.checkedin(),
+        ("overflow",): max(0, pool.overflow()),
+    }
+
+Gauge("db_pool_connections", "Database connections of the pool by state.", ("state",), function=pool_connections)
+Gauge(
+    "db_pool_size", "Connections the database pool keeps open.",
+    function=lambda: getattr(Database().async_engine.pool, "size", lambda: 0)()
+)
+
 class Database:
     """
     Singleton database connection manager.
     
     This class ensures only one database connection is created throughout the application
     and provides methods to get database sessions and create tables.
+
+    Two engines share the same database: a synchronous one for scripts and table
+    creation, and an async one used by the request handlers so that queries do not
+    block the event loop.
+
+    The database is PostgreSQL, or SQLite for single-node deployments, tests and
+    benchmarks, either a file in WAL mode or in memory (see config.py).
     """
 
     # Singleton instance
@@ -29,10 +130,38 @@ class Database:
         if self._initialized:
             return
 
-        self.postgres_url = settings.DATABASE_URL
-        self.engine = create_engine(self.postgres_url, echo=True)
+        self.memory = is_memory_url(settings.DATABASE_URL)
+        self.memory_directory = memory_database_directory() if self.memory else None
+        if self.memory:
+            self.postgres_url = f"sqlite:///{os.path.join(self.memory_directory, 'storage.db')}"
+            self.async_url = to_async_url(self.postgres_url)
+        else:
+            self.postgres_url = settings.DATABASE_URL
+            self.async_url = settings.ASYNC_DATABASE_URL or to_async_url(self.postgres_url)
+
+        self.engine = create_engine(self.postgres_url, echo=settings.DB_ECHO)
+        self.async_engine = create_async_engine(self.async_url, echo=settings.DB_ECHO)
+        if self.engine.dialect.name == "sqlite":
+            # Syncing a database that is lost on restart anyway is wasted time
+            synchronous = "OFF" if self.memory else settings.SQLITE_SYNCHRONOUS
+            configure_sqlite(self.engine, synchronous)
+            configure_sqlite(self.async_engine.sync_engine, synchronous)
+        # Slow query log and per-request query profiling, see utils/query_profiler.py
+        query_profiler.instrument(self.engine)
+        query_profiler.instrument(self.async_engine.sync_engine)
+        self.async_session_factory = async_sessionmaker(
+            self.async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
         self._initialized = True
 
+    async def close(self):
+        """Close all connections, and remove the database if it is in memory."""
+        await self.async_engine.dispose()
+        self.engine.dispose()
+        if self.memory_directory is not None:
+            # Servers stopped by a signal may never reach the atexit handlers
+            shutil.rmtree(self.memory_directory, ignore_errors=True)
+
     def create_db_and_tables(self):
         """Create all tables defined by the Base metadata."""
         Base.metadata.create_all(self.engine)
@@ -67,3 +196,18 @@ class Database:
             yield db
         finally:
             db.close()
+
+    @classmethod
+    async def get_async_db(cls):
+        """
+        Get an async database session for dependency injection.
+
+        Objects are not expired on commit, so their attributes can still be read
+        after committing without another round-trip.
+
+        Yields:
+            AsyncSession: SQLAlchemy async session that will be automatically closed
+        """
+        instance = cls()
+        async with instance.async_session_factory() as db:
+            yield db
@@ -0,0 +1,330 @@
+import hashlib
+import io
+from concurrent.futures import Executor
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from .storage_backends import ObjectWriter
+
+# Reed-Solomon erasure coding over GF(2^8).
+#
+# A file is cut into units of UNIT_SIZE bytes which are dealt round-robin
+# over k data shards, so a stripe (one row of units, k * UNIT_SIZE bytes of
+# the file) is spread over k disks and sequential reads use all of them. For
+# every stripe, m parity units are computed with a Cauchy matrix, which makes
+# any k of the k + m shards enough to rebuild the others.
+#
+# Multiplying a buffer by a constant is a bytes.translate with that
+# constant's multiplication table, and additions are XORs of the buffers as
+# big integers, so encoding and decoding run in C.
+
+UNIT_SIZE = 256 * 1024
+
+_EXP = [0] * 512
+_LOG = [0] * 256
+_value = 1
+for _power in range(255):
+    _EXP[_power] = _value
+    _LOG[_value] = _power
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11D
+for _power in range(255, 512):
+    _EXP[_power] = _EXP[_power - 255]
+
+def gf_mul(a: int, b: int) -> int:
+    """Multiply two elements of GF(2^8)."""
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+def gf_inv(a: int) -> int:
+    """Multiplicative inverse of a non-zero element of GF(2^8)."""
+    return _EXP[255 - _LOG[a]]
+
+# Translation table multiplying every byte by a constant, for each constant
+_MUL_TABLES = [bytes(gf_mul(c, x) for x in range(256)) for c in range(256)]
+
+def parse_scheme(scheme: str) -> Optional[Tuple[int, int]]:
+    """
+    Parse an erasure coding scheme like "4+2" into (k, m), or None if disabled.
+
+    Raises:
+        ValueError: If the scheme is malformed
+    """
+    if not scheme:
+        return None
+    data, _, parity = scheme.partition("+")
+    k, m = int(data), int(parity)
+    if k < 1 or m < 1 or k + m > 255:
+        raise ValueError(f"Invalid erasure coding scheme '{scheme}'")
+    return k, m
+
+def generator_row(shard: int, k: int) -> List[int]:
+    """Coefficients producing a shard from the k data shards."""
+    if shard < k:
+        return [1 if i == shard else 0 for i in range(k)]
+    return [gf_inv(shard ^ i) for i in range(k)]
+
+def combine(coefficients: List[int], units: List[bytes]) -> bytes:
+    """Linear combination of equally sized units over GF(2^8)."""
+    result = 0
+    for coefficient, unit in zip(coefficients, units):
+        if coefficient == 1:
+            result ^= int.from_bytes(unit, "little")
+        elif coefficient:
+            result ^= int.from_bytes(unit.translate(_MUL_TABLES[coefficient]), "little")
+    return result.to_bytes(len(units[0]), "little")
+
+def invert_matrix(matrix: List[List[int]]) -> List[List[int]]:
+    """Invert a square matrix over GF(2^8) by Gauss-Jordan elimination."""
+    size = len(matrix)
+    rows = [row[:] + [1 if i == j else 0 for j in range(size)] for i, row in enumerate(matrix)]
+    for column in range(size):
+        pivot = next(r for r in range(column, size) if rows[r][column])
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        scale = gf_inv(rows[column][column])
+        rows[column] = [gf_mul(scale, value) for value in rows[column]]
+        for r in range(size):
+            factor = rows[r][column]
+            if r != column and factor:
+                rows[r] = [value ^ gf_mul(factor, pivot_value) for value, pivot_value in zip(rows[r], rows[column])]
+    return [row[size:] for row in rows]
+
+def encode_parity(units: List[bytes], m: int) -> List[bytes]:
+    """Parity units of one stripe of k data units."""
+    k = len(units)
+    return [combine(generator_row(k + j, k), units) for j in range(m)]
+
+def decode_data(available: Dict[int, bytes], k: int) -> List[bytes]:
+    """
+    Data units of one stripe from any k of its units.
+
+    Raises:
+        ValueError: If fewer than k units are available
+    """
+    if all(i in available for i in range(k)):
+        return [available[i] for i in range(k)]
+    if len(available) < k:
+        raise ValueError(f"{len(available)} shards left, {k} needed")
+    shards = sorted(available)[:k]
+    inverse = invert_matrix([generator_row(shard, k) for shard in shards])
+    units = [available[shard] for shard in shards]
+    return [available[i] if i in available else combine(inverse[i], units) for i in range(k)]
+
+def manifest_path(path: str) -> str:
+    """Path of the manifest describing the shard stored next to it."""
+    return f"{path}.ec"
+
+def shard_path(path: str) -> str:
+    """Path of the shard stored for an object."""
+    return f"{path}.shard"
+
+def read_stripe(f, k: int) -> List[bytes]:
+    """Read the next stripe of a file as k zero padded units, or an empty list at the end."""
+    data = f.read(k * UNIT_SIZE)
+    if not data:
+        return []
+    padded = data.ljust(k * UNIT_SIZE, b"\0")
+    return [padded[i * UNIT_SIZE:(i + 1) * UNIT_SIZE] for i in range(k)]
+
+def write_shards(source: str, writers: List[Optional[ObjectWriter]], k: int, m: int, pool: Executor) -> List[Optional[str]]:
+    """
+    Erasure code a file into k + m shards, one per writer.
+
+    Every stripe's units are written to their shards in parallel. A shard
+    whose write fails (or whose writer is None) is dropped and the others
+    carry on; the shards left are committed at the end.
+
+    Returns:
+        List[Optional[str]]: SHA-256 hash of every shard, None for the ones
+        that failed
+    """
+    writers = list(writers)
+    hashers = [hashlib.sha256() for _ in writers]
+
+    def write_unit(shard: int, unit: bytes):
+        if writers[shard] is None:
+            return
+        try:
+            writers[shard].write(unit)
+            hashers[shard].update(unit)
+        except OSError:
+            writers[shard].abort()
+            writers[shard] = None
+
+    try:
+        with open(source, "rb") as f:
+            while True:
+                units = read_stripe(f, k)
+                if not units:
+                    break
+                units += encode_parity(units, m)
+                list(pool.map(write_unit, range(k + m), units))
+    except BaseException:
+        for writer in writers:
+            if writer is not None:
+                writer.abort()
+        raise
+
+    hashes = []
+    for writer, hasher in zip(writers, hashers):
+        if writer is None:
+            hashes.append(None)
+            continue
+        try:
+            writer.commit()
+        except OSError:
+            writer.abort()
+            hashes.append(None)
+            continue
+        hashes.append(hasher.hexdigest())
+    return hashes
+
+class ErasureReader(io.RawIOBase):
+    """
+    Seekable reader of an erasure coded file.
+
+    Each stripe is read with one request per data shard in parallel and kept
+    for the following reads. Stripes with missing or unreadable data shards
+    are rebuilt from the parity shards.
+    """
+
+    def __init__(self, shards: Dict[int, Callable[[], BinaryIO]], manifest: dict, pool: Executor):
+        self.k = manifest["k"]
+        self.m = manifest["m"]
+        self.unit = manifest["unit"]
+        self.size = manifest["size"]
+        self.shards = shards
+        self.pool = pool
+        self.position = 0
+        self._files = {}
+        self._failed = set(shard for shard in range(self.k + self.m) if shard not in shards)
+        self._stripe_number = None
+        self._stripe = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, position: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            position += self.position
+        elif whence == io.SEEK_END:
+            position += self.size
+        self.position = max(0, position)
+        return self.position
+
+    def _read_unit(self, shard: int, number: int) -> Optional[bytes]:
+        if shard in self._failed:
+            return None
+        try:
+            if shard not in self._files:
+                self._files[shard] = self.shards[shard]()
+            # Every shard is read by one thread at a time
+            f = self._files[shard]
+            f.seek(number * self.unit)
+            unit = f.read(self.unit)
+        except OSError:
+            unit = b""
+        if len(unit) != self.unit:
+            self._failed.add(shard)
+            return None
+        return unit
+
+    def read_stripe(self, number: int) -> List[bytes]:
+        """
+        Data units of one stripe, rebuilt from parity where needed.
+
+        Raises:
+            OSError: If fewer than k shards could be read
+        """
+        available = {}
+        shards = list(range(self.k))
+        while True:
+            units = self.pool.map(lambda shard: self._read_unit(shard, number), shards)
+            available.update({shard: unit for shard, unit in zip(shards, units) if unit is not None})
+            if len(available) >= self.k:
+                break
+            # Fall back to as many parity shards as data shards are missing
+            spare = [shard for shard in range(self.k, self.k + self.m) if shard not in available and shard not in self._failed]
+            shards = spare[:self.k - len(available)]
+            if not shards:
+                raise OSError(f"Only {len(available)} of {self.k + self.m} shards are readable, {self.k} needed")
+        return decode_data(available, self.k)
+
+    def _load_stripe(self, number: int) -> bytes:
+        """
+        Data of one stripe, padding included.
+
+        Raises:
+            ValueError: If the stripe isn't k units long
+        """
+        if number != self._stripe_number:
+            stripe = b"".join(self.read_stripe(number))
+            # A short stripe would make read() loop forever
+            if len(stripe) != self.k * self.unit:
+                raise ValueError(f"Stripe {number} is {len(stripe)} bytes, expected {self.k * self.unit}")
+            self._stripe = stripe
+            self._stripe_number = number
+        return self._stripe
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self.position
+        size = min(size, self.size - self.position)
+        if size <= 0:
+            return b""
+
+        parts = []
+        while size > 0:
+            number, offset = divmod(self.position, self.k * self.unit)
+            part = self._load_stripe(number)[offset:offset + size]
+            parts.append(part)
+            self.position += len(part)
+            size -= len(part)
+        return b"".join(parts)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        super().close()
+
+def rebuild_shards(reader: ErasureReader, writers: Dict[int, ObjectWriter], throttle=None) -> Dict[int, str]:
+    """
+    Recompute lost shards of an erasure coded file from the remaining ones.
+
+    `writers` gives the destination of every shard to rebuild; they are
+    committed once complete and aborted on errors. Returns the SHA-256 hash
+    of every rebuilt shard.
+    """
+    hashers = {shard: hashlib.sha256() for shard in writers}
+    try:
+        stripes = -(-reader.size // (reader.k * reader.unit))
+        for number in range(stripes):
+            units = reader.read_stripe(number)
+            if throttle is not None:
+                throttle.consume(reader.k * reader.unit)
+            if any(shard >= reader.k for shard in writers):
+                units = units + encode_parity(units, reader.m)
+            for shard, writer in writers.items():
+                writer.write(units[shard])
+                hashers[shard].update(units[shard])
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+        raise
+
+    for writer in writers.values():
+        writer.commit()
+    return {shard: hasher.hexdigest() for shard, hasher in hashers.items()}
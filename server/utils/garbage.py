@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select, update
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..models.models import Blob, BlobBlock, DeltaSession, Tombstone, UploadSession
+from .blob_store import BlobStore, blob_store
+from .database_class import Database
+
+logger = logging.getLogger(__name__)
+
+class Collector:
+    """
+    Background garbage collector for stored content.
+
+    Deleting a file only records a tombstone for its blob (see
+    BlobStore.release). Every run applies the tombstones to the blobs'
+    reference counts in batches and deletes the rows and bytes of blobs that
+    are no longer referenced. It then reclaims what failed or abandoned
+    uploads leave behind: objects in the storage roots without a blob row,
+    staged upload files, and upload and delta sessions that were never
+    finished. Anything without a row is only removed once it is older than
+    `grace_seconds`, so uploads in progress are not affected.
+
+    Progress of the current run is updated after every batch and exposed by
+    `snapshot`.
+    """
+
+    def __init__(
+        self,
+        store: BlobStore = blob_store,
+        interval: float = settings.STORAGE_GC_INTERVAL,
+        grace_seconds: float = settings.STORAGE_GC_GRACE_SECONDS,
+        session_max_age: float = settings.UPLOAD_SESSION_MAX_AGE,
+        session_folders: Optional[Dict[str, type]] = None,
+        batch_size: int = 1000
+    ):
+        self.store = store
+        self.interval = interval
+        self.grace_seconds = grace_seconds
+        self.session_max_age = session_max_age
+        # Directory of every session model, holding one subdirectory per session
+        self.session_folders = session_folders or {
+            os.path.join(settings.UPLOAD_FOLDER, "sessions"): UploadSession,
+            os.path.join(settings.UPLOAD_FOLDER, "deltas"): DeltaSession,
+        }
+        self.batch_size = batch_size
+        self._lock = Lock()
+        self.running = False
+        self.runs = 0
+        self.last_finished = None
+        self.phase = None
+        self.progress = self._empty_progress()
+
+    @staticmethod
+    def _empty_progress() -> dict:
+        return {
+            "tombstones_pending": 0,
+            "tombstones_applied": 0,
+            "blobs_removed": 0,
+            "bytes_reclaimed": 0,
+            "orphans_removed": 0,
+            "sessions_expired": 0,
+            "staged_files_removed": 0,
+        }
+
+    def _advance(self, **counts: int):
+        with self._lock:
+            for name, count in counts.items():
+                self.progress[name] += count
+
+    async def _remove_unreferenced(self, db, blob_hashes: Optional[List[str]] = None) -> List[Tuple[str, int]]:
+        """
+        Delete unreferenced blobs, optionally only among `blob_hashes`.
+
+        The rows are deleted first, which locks them (the whole database on
+        SQLite) until the caller commits, and the bytes are removed before
+        that. An upload of the same content meanwhile waits to claim the row
+        (see BlobStore.add) and writes the bytes again afterwards, instead of
+        having them removed under it.
+        """
+        dead = select(Blob.hash).where(Blob.ref_count <= 0)
+        if blob_hashes is not None:
+            dead = dead.where(Blob.hash.in_(blob_hashes))
+        result = await db.execute(
+            delete(Blob)
+            .where(Blob.hash.in_(dead.limit(self.batch_size)), Blob.ref_count <= 0)
+            .returning(Blob.hash, func.coalesce(Blob.stored_size, Blob.size))
+        )
+        removed = [tuple(row) for row in result.all()]
+        if removed:
+            hashes = [blob_hash for blob_hash, _ in removed]
+            await db.execute(delete(BlobBlock).where(BlobBlock.blob_hash.in_(hashes)))
+            await run_in_threadpool(self.store.remove_many, hashes)
+        return removed
+
+    def _count_removed(self, removed: List[Tuple[str, int]]):
+        self._advance(blobs_removed=len(removed), bytes_reclaimed=sum(size or 0 for _, size in removed))
+
+    async def collect_tombstones(self, database: Database):
+        """Apply tombstones to reference counts and remove the blobs they leave unreferenced."""
+        async with database.async_session_factory() as db:
+            pending = await db.scalar(select(func.count()).select_from(Tombstone))
+        self._advance(tombstones_pending=pending)
+
+        while True:
+            async with database.async_session_factory() as db:
+                rows = (await db.execute(
+                    select(Tombstone.id, Tombstone.blob_hash).order_by(Tombstone.id).limit(self.batch_size)
+                )).all()
+                if not rows:
+                    break
+                counts = Counter(blob_hash for _, blob_hash in rows)
+                for blob_hash, count in counts.items():
+                    await db.execute(
+                        update(Blob).where(Blob.hash == blob_hash).values(ref_count=Blob.ref_count - count)
+                    )
+                await db.execute(delete(Tombstone).where(Tombstone.id.in_([row[0] for row in rows])))
+                removed = await self._remove_unreferenced(db, list(counts))
+                await db.commit()
+
+            self._count_removed(removed)
+            self._advance(tombstones_applied=len(rows))
+
+        # Blobs left unreferenced by an interrupted delete
+        while True:
+            async with database.async_session_factory() as db:
+                removed = await self._remove_unreferenced(db)
+                await db.commit()
+            if not removed:
+                break
+            self._count_removed(removed)
+
+    async def expire_sessions(self, database: Database):
+        """Discard upload and delta sessions older than `session_max_age`, and their chunks."""
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=self.session_max_age)
+        for folder, model in self.session_folders.items():
+            async with database.async_session_factory() as db:
+                result = await db.execute(select(model.id).where(model.timestamp < cutoff))
+                expired = result.scalars().all()
+                if expired:
+                    await db.execute(delete(model).where(model.id.in_(expired)))
+                    await db.commit()
+            for session_id in expired:
+                await run_in_threadpool(shutil.rmtree, os.path.join(folder, session_id), True)
+            self._advance(sessions_expired=len(expired))
+
+    async def sweep_staging(self, database: Database):
+        """Remove staged upload files and session chunk directories that no request is using anymore."""
+        cutoff = time.time() - self.grace_seconds
+
+        def old_entries(folder: str) -> List[str]:
+            try:
+                return [
+                    entry.name for entry in os.scandir(folder)
+                    if entry.stat(follow_symlinks=False).st_mtime < cutoff
+                ]
+            except FileNotFoundError:
+                return []
+
+        def remove(path: str):
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+
+        staged = await run_in_threadpool(old_entries, self.store.temp_root)
+        for name in staged:
+            await run_in_threadpool(remove, os.path.join(self.store.temp_root, name))
+        self._advance(staged_files_removed=len(staged))
+
+        for folder, model in self.session_folders.items():
+            names = await run_in_threadpool(old_entries, folder)
+            for start in range(0, len(names), self.batch_size):
+                batch = names[start:start + self.batch_size]
+                async with database.async_session_factory() as db:
+                    result = await db.execute(select(model.id).where(model.id.in_(batch)))
+                    live = set(result.scalars().all())
+                orphaned = [name for name in batch if name not in live]
+                for name in orphaned:
+                    await run_in_threadpool(remove, os.path.join(folder, name))
+                self._advance(staged_files_removed=len(orphaned))
+
+    async def sweep_orphans(self, database: Database):
+        """
+        Remove objects in the storage roots that belong to no blob, such as
+        the bytes of uploads that failed before their row was written and
+        partial writes left by crashes.
+
+        Every orphan gets a placeholder row while its bytes are removed, which
+        an upload of the same content has to wait for before it can write
+        them (see BlobStore.add). Objects whose row an upload has claimed in
+        the meantime are left alone.
+        """
+        cutoff = time.time() - self.grace_seconds
+        for location, backend in self.store.backends.items():
+            listing = await run_in_threadpool(lambda: [item for item in backend.list_objects() if item[2] < cutoff])
+            for start in range(0, len(listing), self.batch_size):
+                batch = listing[start:start + self.batch_size]
+                hashes = {key.rsplit("/", 1)[-1].split(".", 1)[0] for key, _, _ in batch}
+                async with database.async_session_factory() as db:
+                    result = await db.execute(select(Blob.hash).where(Blob.hash.in_(hashes)))
+                    unknown = hashes - set(result.scalars().all())
+                    claimed = set()
+                    if unknown:
+                        result = await db.execute(
+                            self.store._insert(db)(Blob)
+                            .values([{"hash": blob_hash, "size": 0, "ref_count": 0} for blob_hash in unknown])
+                            .on_conflict_do_nothing()
+                            .returning(Blob.hash)
+                        )
+                        claimed = set(result.scalars().all())
+
+                    orphans = [
+                        (key, size) for key, size, _ in batch
+                        if key.endswith(".tmp") or key.rsplit("/", 1)[-1].split(".", 1)[0] in claimed
+                    ]
+                    for key, _ in orphans:
+                        try:
+                            await run_in_threadpool(backend.delete, key)
+                        except OSError:
+                            self.store.health[location].observe_error()
+                    if claimed:
+                        await db.execute(delete(Blob).where(Blob.hash.in_(claimed)))
+                    await db.commit()
+                self._advance(orphans_removed=len(orphans), bytes_reclaimed=sum(size for _, size in orphans))
+
+    async def run_once(self) -> dict:
+        """Collect garbage once."""
+        with self._lock:
+            already_running = self.running
+            if not already_running:
+                self.running = True
+                self.progress = self._empty_progress()
+        if already_running:
+            return self.snapshot()
+
+        try:
+            database = Database()
+            for phase, step in (
+                ("tombstones", self.collect_tombstones),
+                ("sessions", self.expire_sessions),
+                ("staging", self.sweep_staging),
+                ("orphans", self.sweep_orphans),
+            ):
+                with self._lock:
+                    self.phase = phase
+                await step(database)
+        finally:
+            with self._lock:
+                self.running = False
+                self.phase = None
+                self.runs += 1
+                self.last_finished = datetime.now(timezone.utc)
+        return self.snapshot()
+
+    async def run_forever(self):
+        """Collect garbage every `interval` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Garbage collection run failed")
+
+    def snapshot(self) -> dict:
+        """State of the collector and progress of the current or last run as a dictionary."""
+        with self._lock:
+            return {
+                "running": self.running,
+                "phase": self.phase,
+                "runs": self.runs,
+                "last_finished": self.last_finished,
+                **self.progress,
+            }
+
+collector = Collector()
@@ -0,0 +1,47 @@
+import bisect
+import hashlib
+from typing import Iterable, List
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to nodes.
+
+    Every node is placed on the ring at many pseudo-random points (virtual
+    nodes) and a key belongs to the first node found clockwise from its own
+    position. Adding or removing a node only moves the keys between it and
+    its neighbours, about 1/N of them, instead of reshuffling everything.
+    """
+
+    def __init__(self, nodes: Iterable[str], virtual_nodes: int = 128):
+        self.nodes = sorted(set(nodes))
+        if not self.nodes:
+            raise ValueError("A hash ring needs at least one node")
+
+        points = sorted(
+            (self._position(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(virtual_nodes)
+        )
+        self._positions = [position for position, _ in points]
+        self._owners = [node for _, node in points]
+
+    @staticmethod
+    def _position(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def node(self, key: str) -> str:
+        """Node owning a key."""
+        return self.preference_list(key, 1)[0]
+
+    def preference_list(self, key: str, count: int) -> List[str]:
+        """The first `count` distinct nodes clockwise from a key, owner first."""
+        count = min(count, len(self.nodes))
+        index = bisect.bisect(self._positions, self._position(key))
+        nodes = []
+        for i in range(len(self._owners)):
+            node = self._owners[(index + i) % len(self._owners)]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == count:
+                    break
+        return nodes
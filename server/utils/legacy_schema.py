@@ -0,0 +1,185 @@
+import hashlib
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+import sqlalchemy as sa
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# Revision whose schema the legacy schema is upgraded to
+LEGACY_TARGET_REVISION = "0001"
+
+def is_legacy_schema(connection: Connection) -> bool:
+    """
+    Whether a database without a schema version was created by `create_all`
+    before migrations were added: users, and files stored as paths under the
+    upload folder.
+    """
+    inspector = sa.inspect(connection)
+    return "file" in inspector.get_table_names() and "path" in {
+        column["name"] for column in inspector.get_columns("file")
+    }
+
+def resolve_path(path: str) -> str:
+    """Locate a file stored by the legacy schema, whose paths are relative to where the server ran."""
+    from .migrations import SERVER_DIR
+
+    if os.path.isabs(path):
+        return path
+    for base in (os.getcwd(), SERVER_DIR):
+        candidate = os.path.join(base, path)
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+def import_files(connection: Connection, rows) -> Tuple[List[dict], List[dict]]:
+    """
+    Copy the content of files stored by the legacy schema into the blob store.
+
+    The legacy schema stored every upload as its own file under the upload
+    folder. Their content becomes blobs, written as plain replicas to the
+    roots the hash ring assigns them, which is how later revisions expect
+    blobs from before compression, locations and erasure coding to be
+    stored. Rows whose owner no longer exists or whose file is missing are
+    dropped, and of files with the same name only the newest is kept, since
+    names are now unique per user. The old files are left in place.
+
+    Returns:
+        Tuple[List[dict], List[dict]]: Rows of the new file and blob tables
+    """
+    from .blob_store import blob_store
+
+    user = sa.table('user', sa.column('id'))
+    users = set(connection.execute(sa.select(user.c.id)).scalars())
+    now = datetime.now(timezone.utc)
+
+    # The newest row of every owner and name, in id order
+    newest: Dict[Tuple[int, str], object] = {}
+    for row in sorted(rows, key=lambda row: (row.timestamp or datetime.min, row.id)):
+        owner_id = int(row.owner_id) if str(row.owner_id or "").isdigit() else None
+        if owner_id not in users:
+            logger.warning("Not importing file %s (%s): its owner %s no longer exists", row.id, row.path, row.owner_id)
+            continue
+        newest[(owner_id, row.file_name or os.path.basename(row.path or ""))] = row
+
+    files, blobs = [], {}
+    for (owner_id, file_name), row in sorted(newest.items(), key=lambda item: item[1].id):
+        path = resolve_path(row.path or "")
+        if not os.path.isfile(path):
+            logger.warning("Not importing file %s: %s is missing", row.id, row.path)
+            continue
+
+        hasher = hashlib.sha256()
+        size = 0
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+                size += len(chunk)
+        blob_hash = hasher.hexdigest()
+
+        if blob_hash not in blobs:
+            for location in blob_store.placement(blob_hash):
+                with open(path, "rb") as f:
+                    blob_store.backends[location].put(blob_store.key(blob_hash), f)
+            blobs[blob_hash] = {"hash": blob_hash, "size": size, "ref_count": 0, "timestamp": now}
+        blobs[blob_hash]["ref_count"] += 1
+        files.append({
+            "id": row.id, "owner_id": owner_id, "file_name": file_name,
+            "blob_hash": blob_hash, "size": size, "timestamp": row.timestamp or now
+        })
+
+    if rows:
+        logger.info(
+            "Imported %d of %d stored files into %d blobs; the old files under the upload folder can be removed",
+            len(files), len(rows), len(blobs)
+        )
+    return files, list(blobs.values())
+
+def upgrade_legacy_schema(connection: Connection):
+    """
+    Upgrade the legacy schema to the one of revision 0001, in the caller's transaction.
+
+    This is not a revision of its own: 0001 was released creating every table
+    from scratch, and databases that already applied it must not see it
+    change. Once upgraded, the database is stamped 0001 and the revisions
+    after it apply as usual.
+
+    Blobs and upload sessions are added, user names become unique, and the
+    file table is recreated with an integer owner_id foreign key, blob_hash
+    and the constraints and indexes of 0001. Its rows keep their ids and
+    point at blobs imported from the old files (see import_files).
+    """
+    # Imported before anything changes: SQLite doesn't roll back schema changes
+    old_file = sa.table('file',
+        sa.column('id', sa.Integer()), sa.column('owner_id', sa.String()), sa.column('file_name', sa.String()),
+        sa.column('path', sa.String()), sa.column('size', sa.BigInteger()), sa.column('timestamp', sa.DateTime())
+    )
+    files, blobs = import_files(connection, connection.execute(sa.select(old_file)).all())
+
+    context = MigrationContext.configure(connection, opts={"render_as_batch": True})
+    with Operations.context(context) as op:
+        blob = op.create_table('blob',
+        sa.Column('hash', sa.String(), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=True),
+        sa.Column('ref_count', sa.Integer(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('hash')
+        )
+        with op.batch_alter_table('user', schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f('ix_user_id'))
+            batch_op.drop_index(batch_op.f('ix_user_username'))
+            batch_op.create_index(batch_op.f('ix_user_username'), ['username'], unique=True)
+
+        # The file table is recreated rather than altered: its rows are carried over
+        # with their content imported into the blob store
+        with op.batch_alter_table('file', schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f('ix_file_path'))
+            batch_op.drop_index(batch_op.f('ix_file_id'))
+            batch_op.drop_index(batch_op.f('ix_file_file_name'))
+
+        op.drop_table('file')
+        file = op.create_table('file',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('file_name', sa.String(), nullable=False),
+        sa.Column('blob_hash', sa.String(), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['blob_hash'], ['blob.hash'], ),
+        sa.ForeignKeyConstraint(['owner_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('owner_id', 'file_name', name='uq_file_owner_name')
+        )
+        with op.batch_alter_table('file', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_file_blob_hash'), ['blob_hash'], unique=False)
+            batch_op.create_index('ix_file_owner_id_id', ['owner_id', 'id'], unique=False)
+            batch_op.create_index('ix_file_owner_size', ['owner_id', 'size', 'id'], unique=False)
+            batch_op.create_index('ix_file_owner_timestamp', ['owner_id', 'timestamp', 'id'], unique=False)
+            batch_op.create_index('ix_file_timestamp', ['timestamp', 'id'], unique=False)
+
+        if files:
+            op.bulk_insert(blob, blobs)
+            op.bulk_insert(file, files)
+            if connection.dialect.name == "postgresql":
+                # The ids were kept, so new files must be numbered after them
+                op.execute("SELECT setval(pg_get_serial_sequence('file', 'id'), (SELECT max(id) FROM file))")
+
+        op.create_table('upload_session',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('file_name', sa.String(), nullable=True),
+        sa.Column('size', sa.BigInteger(), nullable=True),
+        sa.Column('chunk_size', sa.Integer(), nullable=True),
+        sa.Column('total_chunks', sa.Integer(), nullable=True),
+        sa.Column('checksum', sa.String(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['owner_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+        )
+        with op.batch_alter_table('upload_session', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_upload_session_owner_id'), ['owner_id'], unique=False)
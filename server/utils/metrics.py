@@ -0,0 +1,318 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histogram buckets for durations in seconds, from 1 ms to a minute
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = Lock()
+
+    def register(self, metric: "Metric"):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+class Metric:
+    """
+    Metric with a value per combination of label values.
+
+    `labels(*values)` returns the child holding the value for one
+    combination; a metric without label names has a single child, which its
+    own methods use.
+    """
+
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = registry
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Child holding the value for the given label values."""
+        # Reading the dictionary needs no lock; only creating a child does
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _items(self) -> List[tuple]:
+        with self._lock:
+            return list(self._children.items())
+
+    def samples(self) -> Iterator[str]:
+        for values, child in self._items():
+            yield f"{self.name}{_labels(self.labelnames, values)} {_format(child.get())}"
+
+class _Value:
+    """Single number updated under a lock."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._value = 0.0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def get(self) -> float:
+        with self._lock:
+            return self._value
+
+class Counter(Metric):
+    """Total that only goes up, such as requests served or bytes sent."""
+
+    type = "counter"
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, such as requests in progress.
+
+    With `function`, the value is read when the metrics are rendered instead:
+    it returns the value, or a dictionary of values by label values for a
+    gauge with labels.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = registry,
+        function: Optional[Callable[[], Union[float, Dict[Tuple[str, ...], float]]]] = None
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self.function = function
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def samples(self) -> Iterator[str]:
+        if self.function is None:
+            yield from super().samples()
+            return
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, label_values)} {_format(value)}"
+
+class _HistogramValue:
+    """Observation counts per bucket, their sum and count."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = Lock()
+        self.buckets = buckets
+        # One count per bucket plus the +Inf bucket, not cumulative
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe the time spent in a `with` block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def get(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self._counts), self._sum
+
+class Histogram(Metric):
+    """Distribution of observed values, such as request durations, over fixed buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = registry,
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self) -> Iterator[str]:
+        for values, child in self._items():
+            counts, total = child.get()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _labels(self.labelnames + ("le",), values + (_format(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests served.", ("method", "route", "status")
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving an HTTP request until its response is sent completely.",
+    ("method", "route")
+)
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress", "HTTP requests being served.", ("method",)
+)
+http_request_bytes = Counter(
+    "http_request_body_bytes_total", "Bytes received in HTTP request bodies, such as uploads.", ("route",)
+)
+http_response_bytes = Counter(
+    "http_response_body_bytes_total", "Bytes sent in HTTP response bodies, such as downloads.", ("route",)
+)
+
+def route_label(scope) -> str:
+    """Path template of the route that served a request, stored in the scope by the router."""
+    return getattr(scope.get("route"), "path", "unmatched")
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the HTTP request metrics above.
+
+    Requests are labelled with the path template of the route that served
+    them (e.g. "/files/{file_id}"), so the number of series stays bounded;
+    requests no route matched are labelled "unmatched". Body bytes are
+    counted as they pass through, without buffering anything.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        received = 0
+        sent = 0
+        status = 500
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal sent, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = http_requests_in_progress.labels(method)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            duration = time.perf_counter() - started
+            in_progress.dec()
+            route = route_label(scope)
+            http_requests.labels(method, route, str(status)).inc()
+            http_request_duration.labels(method, route).observe(duration)
+            if received:
+                http_request_bytes.labels(route).inc(received)
+            if sent:
+                http_response_bytes.labels(route).inc(sent)
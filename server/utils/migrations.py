@@ -0,0 +1,70 @@
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
+from .database_class import Database
+from .legacy_schema import LEGACY_TARGET_REVISION, is_legacy_schema, upgrade_legacy_schema
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def migration_config() -> Config:
+    """Alembic configuration for the server database, independent of the working directory."""
+    config = Config(os.path.join(SERVER_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(SERVER_DIR, "migrations"))
+    # Leave the server's logging configuration alone
+    config.attributes["configure_logger"] = False
+    return config
+
+def unversioned_schema() -> bool:
+    """
+    Whether the database has tables but no version Alembic knows of.
+
+    Returns:
+        bool: True for a database created before migrations were added,
+        False for an empty or versioned database
+
+    Raises:
+        RuntimeError: If the database has tables of an unknown schema
+    """
+    with Database().engine.connect() as connection:
+        tables = inspect(connection).get_table_names()
+        if not tables or "alembic_version" in tables:
+            return False
+        if is_legacy_schema(connection):
+            return True
+    raise RuntimeError(
+        f"The database has tables ({', '.join(sorted(tables))}) but no schema version; "
+        "stamp it with `alembic stamp <revision>` matching its schema"
+    )
+
+def upgrade_unversioned():
+    """Bring a database created before migrations were added to LEGACY_TARGET_REVISION."""
+    with Database().engine.connect() as connection:
+        sqlite = connection.dialect.name == "sqlite"
+        if sqlite:
+            # As in migrations/env.py: recreating tables must not cascade
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            connection.commit()
+        try:
+            with connection.begin():
+                upgrade_legacy_schema(connection)
+        finally:
+            if sqlite:
+                connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+                connection.commit()
+
+def run_migrations():
+    """
+    Upgrade the database schema to the latest migration.
+
+    Databases created before migrations were added are first upgraded to
+    the schema of revision 0001 and stamped with it, so their tables are
+    upgraded instead of created again.
+    """
+    config = migration_config()
+    if unversioned_schema():
+        upgrade_unversioned()
+        command.stamp(config, LEGACY_TARGET_REVISION)
+    command.upgrade(config, "head")
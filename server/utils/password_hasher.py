@@ -0,0 +1,151 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from passlib.context import CryptContext
+
+from ..config import settings
+from .metrics import Counter, Gauge, Histogram
+
+hash_duration = Histogram(
+    "password_hash_duration_seconds", "Time spent hashing or verifying a password with bcrypt.", ("operation",)
+)
+hash_wait = Histogram(
+    "password_hash_wait_seconds", "Time password hashing operations waited for a free worker.", ("operation",)
+)
+hash_rejected = Counter(
+    "password_hash_rejected_total", "Password hashing operations rejected because the queue was full."
+)
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hashing operations are already queued."""
+
+class HashStats:
+    """Latency statistics for one kind of hashing operation."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_wait_seconds = 0.0
+
+    def observe(self, run_seconds: float, wait_seconds: float):
+        """Record one operation's run time and time spent queued."""
+        with self._lock:
+            self.count += 1
+            self.total_seconds += run_seconds
+            self.max_seconds = max(self.max_seconds, run_seconds)
+            self.total_wait_seconds += wait_seconds
+
+    def snapshot(self) -> dict:
+        """Current statistics as a dictionary."""
+        with self._lock:
+            return {
+                "count": self.count,
+                "avg_ms": self.total_seconds / self.count * 1000 if self.count else 0.0,
+                "max_ms": self.max_seconds * 1000,
+                "avg_wait_ms": self.total_wait_seconds / self.count * 1000 if self.count else 0.0,
+            }
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a dedicated, size-limited thread pool.
+
+    bcrypt takes hundreds of milliseconds of CPU per call, so running it in a
+    request handler freezes every other request on the worker. bcrypt releases
+    the GIL, so a small thread pool hashes in parallel without touching the
+    event loop. At most `workers + max_queue` operations may be in flight; any
+    more are rejected with PasswordHasherBusy instead of piling up.
+    """
+
+    def __init__(
+        self,
+        rounds: int = settings.BCRYPT_ROUNDS,
+        workers: int = settings.PASSWORD_HASH_WORKERS,
+        max_queue: int = settings.PASSWORD_HASH_MAX_QUEUE
+    ):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self.workers = workers
+        self.max_pending = workers + max_queue
+        self.pending = 0
+        self.rejected = 0
+        self.stats = {"hash": HashStats(), "verify": HashStats()}
+        self._executor = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """The thread pool, created on first use."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _timed(self, operation: str, queued_at: float, func, *args):
+        """Run `func` in the pool, recording how long it waited and ran."""
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            run_seconds = time.perf_counter() - started
+            self.stats[operation].observe(run_seconds, started - queued_at)
+            hash_duration.labels(operation).observe(run_seconds)
+            hash_wait.labels(operation).observe(started - queued_at)
+
+    async def _submit(self, operation: str, func, *args):
+        """Submit an operation to the pool, enforcing the queue limit."""
+        # Only touched from the event loop thread, so no lock is needed
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            hash_rejected.inc()
+            raise PasswordHasherBusy("Too many password hashing requests in progress")
+
+        loop = asyncio.get_running_loop()
+        future = self.executor.submit(self._timed, operation, time.perf_counter(), func, *args)
+        self.pending += 1
+        # Counted until a worker is done with it: a caller that stops waiting
+        # (e.g. a cancelled request) doesn't free its worker
+        future.add_done_callback(lambda _: self._call_in_loop(loop, self._finished))
+        return await asyncio.wrap_future(future)
+
+    def _finished(self):
+        self.pending -= 1
+
+    @staticmethod
+    def _call_in_loop(loop: asyncio.AbstractEventLoop, callback):
+        try:
+            loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            # The loop is closed, nobody is counting anymore
+            pass
+
+    async def hash(self, password: str) -> str:
+        """Hash a password."""
+        return await self._submit("hash", self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """Verify a password against a hash."""
+        return await self._submit("verify", self.context.verify, password, hashed_password)
+
+    def snapshot(self) -> dict:
+        """Pool state and latency statistics."""
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            **{operation: stats.snapshot() for operation, stats in self.stats.items()},
+        }
+
+    def shutdown(self):
+        """Stop the thread pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+password_hasher = PasswordHasher()
+
+Gauge(
+    "password_hash_pending", "Password hashing operations running or queued.",
+    function=lambda: password_hasher.pending
+)
@@ -0,0 +1,188 @@
+import logging
+import random
+import time
+from contextvars import ContextVar
+from threading import Lock
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ..config import settings
+from .metrics import Counter, Histogram, route_label
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets for the number of queries run by one request
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+query_duration = Histogram(
+    "db_query_duration_seconds", "Time taken by database queries, recorded while SQL profiling is enabled."
+)
+slow_queries = Counter("db_slow_queries_total", "Database queries slower than the slow query threshold.")
+request_queries = Histogram(
+    "db_queries_per_request", "Database queries run by one profiled HTTP request.",
+    ("method", "route"), buckets=QUERY_COUNT_BUCKETS
+)
+request_db_time = Histogram(
+    "db_time_per_request_seconds", "Time one profiled HTTP request spent in database queries.", ("method", "route")
+)
+
+class RequestProfile:
+    """Number of queries run for one request and the time they took."""
+
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+# Profile of the request being served, None when it isn't profiled
+_request_profile: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+class QueryProfiler:
+    """
+    SQL instrumentation that can be switched on and off at runtime.
+
+    Two independent features, both off by default:
+
+    - Slow query log: every query taking at least `slow_query_seconds` is
+      logged as a warning with its statement. Parameters are left out since
+      they may hold password hashes and other secrets.
+    - Request profiling: a `sample_rate` fraction of HTTP requests count the
+      queries they run and the time spent in them (see
+      QueryProfilerMiddleware), which exposes N+1 query patterns.
+
+    The engine event listeners are only attached while one of the features
+    is enabled, so a disabled profiler adds nothing to any query.
+    """
+
+    def __init__(
+        self,
+        slow_query_seconds: float = settings.DB_SLOW_QUERY_SECONDS,
+        sample_rate: float = settings.DB_PROFILE_SAMPLE_RATE,
+        max_request_queries: int = settings.DB_PROFILE_MAX_QUERIES
+    ):
+        self.slow_query_seconds = slow_query_seconds
+        self.sample_rate = sample_rate
+        self.max_request_queries = max_request_queries
+        self.engines: List[Engine] = []
+        self.listening = False
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.slow_query_seconds > 0 or self.sample_rate > 0
+
+    def instrument(self, engine: Engine):
+        """Profile the queries of an engine (for async engines, their `sync_engine`)."""
+        with self._lock:
+            self.engines.append(engine)
+            if self.listening:
+                self._listen(engine)
+
+    def configure(
+        self,
+        slow_query_seconds: Optional[float] = None,
+        sample_rate: Optional[float] = None,
+        max_request_queries: Optional[int] = None,
+        echo: Optional[bool] = None
+    ):
+        """Change the settings of the running profiler; None leaves a setting unchanged."""
+        with self._lock:
+            if slow_query_seconds is not None:
+                self.slow_query_seconds = slow_query_seconds
+            if sample_rate is not None:
+                self.sample_rate = sample_rate
+            if max_request_queries is not None:
+                self.max_request_queries = max_request_queries
+            for engine in self.engines:
+                if echo is not None:
+                    engine.echo = echo
+                if self.enabled and not self.listening:
+                    self._listen(engine)
+                elif not self.enabled and self.listening:
+                    self._unlisten(engine)
+            self.listening = self.enabled
+
+    def _listen(self, engine: Engine):
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    def _unlisten(self, engine: Engine):
+        event.remove(engine, "before_cursor_execute", self._before_execute)
+        event.remove(engine, "after_cursor_execute", self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._profiler_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Queries already running when the listeners were attached have no start time
+        started = getattr(context, "_profiler_started", None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        query_duration.observe(seconds)
+
+        profile = _request_profile.get()
+        if profile is not None:
+            profile.queries += 1
+            profile.seconds += seconds
+
+        if 0 < self.slow_query_seconds <= seconds:
+            slow_queries.inc()
+            logger.warning("Slow query took %.1f ms: %s", seconds * 1000, " ".join(statement.split()))
+
+    def snapshot(self) -> dict:
+        """Current settings as a dictionary."""
+        return {
+            "slow_query_seconds": self.slow_query_seconds,
+            "sample_rate": self.sample_rate,
+            "max_request_queries": self.max_request_queries,
+            "echo": any(engine.echo for engine in self.engines),
+            "listening": self.listening,
+        }
+
+query_profiler = QueryProfiler()
+
+class QueryProfilerMiddleware:
+    """
+    ASGI middleware profiling the database queries of sampled requests.
+
+    For a `query_profiler.sample_rate` fraction of requests, the number of
+    queries and the time spent in them are recorded in the
+    `db_queries_per_request` and `db_time_per_request_seconds` metrics and
+    sent to the client in a `Server-Timing: db` header. Requests running
+    `max_request_queries` queries or more are logged as warnings.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        sample_rate = query_profiler.sample_rate
+        if scope["type"] != "http" or sample_rate <= 0 or random.random() >= sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                # Queries made while the body is streamed afterwards are only in the metrics
+                timing = f'db;dur={profile.seconds * 1000:.1f};desc="queries: {profile.queries}"'
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        token = _request_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_profile.reset(token)
+            method, route = scope["method"], route_label(scope)
+            request_queries.labels(method, route).observe(profile.queries)
+            request_db_time.labels(method, route).observe(profile.seconds)
+            if 0 < query_profiler.max_request_queries <= profile.queries:
+                logger.warning(
+                    "%s %s ran %d queries taking %.1f ms", method, route, profile.queries, profile.seconds * 1000
+                )
@@ -0,0 +1,304 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import AsyncIterator, BinaryIO, Callable, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+import uuid
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+
+# Upper bound on ranges served in one multipart response, to keep a single
+# request from fanning out into thousands of tiny reads
+MAX_RANGES = 64
+
+class RangeNotSatisfiable(ValueError):
+    """Raised when none of the requested byte ranges overlap the file."""
+
+def parse_range_header(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse a `Range: bytes=...` header into inclusive (start, end) pairs.
+
+    Overlapping and adjacent ranges are merged. Returns None when the header
+    is malformed or uses a unit other than bytes, in which case the Range
+    header must be ignored and the whole file served.
+
+    Raises:
+        RangeNotSatisfiable: If no range overlaps the file
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        start_str, sep, end_str = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start_str == "":
+                # Suffix range: the last N bytes
+                suffix = int(end_str)
+                if suffix <= 0:
+                    continue
+                start, end = max(0, size - suffix), size - 1
+            else:
+                start = int(start_str)
+                end = int(end_str) if end_str else size - 1
+                if end_str and start > end:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+
+        if start < size and start <= end:
+            ranges.append((start, end))
+
+    if not ranges:
+        raise RangeNotSatisfiable(f"No satisfiable range for a file of {size} bytes")
+
+    # Merge overlapping and adjacent ranges
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+def http_date(value: datetime) -> str:
+    """Format a datetime as an HTTP date, treating naive values as UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+def parse_http_date(value: str) -> Optional[datetime]:
+    """Parse an HTTP date header, returning None if it is invalid."""
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+def encoded_etag(etag: str, coding: str) -> str:
+    """ETag of a content-coded representation, e.g. "<sha256>-gzip" for "<sha256>"."""
+    return f'{etag[:-1]}-{coding}"' if etag.endswith('"') else f"{etag}-{coding}"
+
+def etag_matches(header: str, etags: Sequence[str]) -> bool:
+    """Check an If-None-Match style header against the ETags of a file's representations."""
+    if not etags:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    # Weak comparison: W/"x" matches "x"
+    candidates = [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+    return "*" in candidates or any(etag in candidates for etag in etags)
+
+def not_modified(request: Request, etags: Sequence[str], last_modified: Optional[datetime]) -> bool:
+    """
+    Evaluate If-None-Match / If-Modified-Since.
+
+    `etags` are the ETags of all representations of the same content; a
+    client holding any of them has a current copy. If-Modified-Since is only
+    considered when If-None-Match is absent.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etags)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date(if_modified_since)
+        if since is not None:
+            modified = parse_http_date(http_date(last_modified))
+            return modified <= since
+    return False
+
+def range_applies(request: Request, etags: Sequence[str], last_modified: Optional[datetime]) -> bool:
+    """
+    Evaluate If-Range: the Range header only applies if the representation
+    is unchanged, i.e. If-Range holds one of `etags`. ETags are compared strongly.
+    """
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if if_range.startswith('"'):
+        return if_range in etags
+    since = parse_http_date(if_range)
+    if since is None or last_modified is None:
+        return False
+    return parse_http_date(http_date(last_modified)) <= since
+
+def accepts_encoding(request: Request, coding: str) -> bool:
+    """Check whether the client's Accept-Encoding allows a content coding."""
+    header = request.headers.get("accept-encoding")
+    if not header:
+        return False
+
+    qualities = {}
+    for item in header.split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    quality = qualities.get(coding, qualities.get("*", 0.0))
+    return quality > 0
+
+def content_disposition(filename: str) -> str:
+    """Build an attachment Content-Disposition header value."""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+async def iter_file_range(
+    opener: Callable[[], BinaryIO],
+    start: int,
+    end: int,
+    chunk_size: int = settings.UPLOAD_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """Read the inclusive byte range [start, end] of a file in chunks."""
+    f = await run_in_threadpool(opener)
+    try:
+        await run_in_threadpool(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await run_in_threadpool(f.read, min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+def ranged_file_response(
+    request: Request,
+    opener: Callable[[], BinaryIO],
+    size: int,
+    filename: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[datetime] = None,
+    media_type: str = "application/octet-stream",
+    encoded: Optional[Tuple[str, Callable[[], BinaryIO], int]] = None
+) -> Response:
+    """
+    Serve a file honouring conditional and Range requests.
+
+    `opener` opens the file for reading and `size` is its length. Returns 304
+    when the client's copy is current, 206 with a single range or a
+    multipart/byteranges body for Range requests, 416 for unsatisfiable
+    ranges and a plain 200 otherwise. HEAD requests get the headers only.
+
+    `encoded` is an already compressed copy of the file as (content coding,
+    opener, size). Whole-file responses send it unchanged to clients whose
+    Accept-Encoding allows it; ranges always refer to the original bytes.
+    Being different bytes, it has its own ETag, `etag` with the coding
+    appended, so that a client can't combine ranges of the original with a
+    partial copy of the compressed bytes.
+    """
+    send_encoded = encoded is not None and accepts_encoding(request, encoded[0])
+    coded_etag = encoded_etag(etag, encoded[0]) if etag is not None and encoded is not None else None
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": content_disposition(filename),
+    }
+    if encoded is not None:
+        headers["Vary"] = "Accept-Encoding"
+    if etag is not None:
+        headers["ETag"] = coded_etag if send_encoded else etag
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+
+    if not_modified(request, [tag for tag in (etag, coded_etag) if tag is not None], last_modified):
+        headers.pop("Content-Disposition")
+        return Response(status_code=304, headers=headers)
+
+    ranges = None
+    range_header = request.headers.get("range")
+    # Ranges are served from the original bytes, so only its ETag validates them
+    if range_header and range_applies(request, [etag] if etag is not None else [], last_modified):
+        try:
+            ranges = parse_range_header(range_header, size)
+        except RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+    head_only = request.method == "HEAD"
+
+    # Whole file, compressed if the client accepts the stored encoding
+    if not ranges and send_encoded:
+        coding, encoded_opener, encoded_size = encoded
+        headers["Content-Encoding"] = coding
+        headers["Content-Length"] = str(encoded_size)
+        if head_only:
+            return Response(status_code=200, headers=headers, media_type=media_type)
+        return StreamingResponse(
+            iter_file_range(encoded_opener, 0, encoded_size - 1), headers=headers, media_type=media_type
+        )
+
+    # Whole file
+    if etag is not None:
+        headers["ETag"] = etag
+    if not ranges:
+        headers["Content-Length"] = str(size)
+        if head_only:
+            return Response(status_code=200, headers=headers, media_type=media_type)
+        return StreamingResponse(
+            iter_file_range(opener, 0, size - 1), headers=headers, media_type=media_type
+        )
+
+    # Single range
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        if head_only:
+            return Response(status_code=206, headers=headers, media_type=media_type)
+        return StreamingResponse(
+            iter_file_range(opener, start, end), status_code=206, headers=headers, media_type=media_type
+        )
+
+    # Multiple ranges as multipart/byteranges
+    boundary = uuid.uuid4().hex
+    part_headers = [
+        (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode()
+        for start, end in ranges
+    ]
+    closing = f"--{boundary}--\r\n".encode()
+    headers["Content-Length"] = str(
+        sum(len(part) + (end - start + 1) + 2 for part, (start, end) in zip(part_headers, ranges))
+        + len(closing)
+    )
+    multipart_type = f"multipart/byteranges; boundary={boundary}"
+    if head_only:
+        return Response(status_code=206, headers=headers, media_type=multipart_type)
+
+    async def iter_multipart():
+        for part, (start, end) in zip(part_headers, ranges):
+            yield part
+            async for chunk in iter_file_range(opener, start, end):
+                yield chunk
+            yield b"\r\n"
+        yield closing
+
+    return StreamingResponse(iter_multipart(), status_code=206, headers=headers, media_type=multipart_type)
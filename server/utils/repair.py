@@ -0,0 +1,335 @@
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import datetime, timezone
+from threading import Lock
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, update
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..models.models import Blob
+from .blob_store import BlobStore, blob_store
+from .database_class import Database
+from .erasure import shard_path
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 1024 * 1024
+
+# Results of verifying a replica or shard: read and matching its hash, read and
+# not matching it, or not read at all because it is missing or its root failed
+OK = "ok"
+CORRUPT = "corrupt"
+UNREADABLE = "unreadable"
+
+class Throttle:
+    """Paces work to a number of bytes per second, shared by every thread using it."""
+
+    def __init__(self, bytes_per_second: int):
+        self.bytes_per_second = bytes_per_second
+        self._lock = Lock()
+        self._next = time.monotonic()
+
+    def consume(self, size: int):
+        """Wait until `size` more bytes fit in the budget."""
+        if not self.bytes_per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + size / self.bytes_per_second
+        if start > now:
+            time.sleep(start - now)
+
+class Repairer:
+    """
+    Background job checking every replica of every blob.
+
+    A replica is verified by hashing its content, which also measures the
+    read speed of its storage root for choosing replicas on download.
+    Missing and corrupt replicas are replaced with copies of a good one until
+    the blob has `replicas` copies again, and the blob row is updated with the
+    roots now holding it. Erasure coded blobs have every shard checked
+    against the hash in its manifest and lost shards recomputed from the
+    others. Reads and copies share one throttle, so a repair run never takes
+    more than its share of disk bandwidth.
+    """
+
+    def __init__(
+        self,
+        store: BlobStore = blob_store,
+        interval: float = settings.STORAGE_REPAIR_INTERVAL,
+        max_bytes_per_second: int = settings.STORAGE_REPAIR_MAX_BYTES_PER_SECOND,
+        batch_size: int = 100
+    ):
+        self.store = store
+        self.interval = interval
+        self.throttle = Throttle(max_bytes_per_second)
+        self.batch_size = batch_size
+        self._lock = Lock()
+        self.running = False
+        self.runs = 0
+        self.last_finished = None
+        self.checked = 0
+        self.repaired = 0
+        self.lost = 0
+
+    def verify_replica(self, blob_hash: str, location: str) -> str:
+        """
+        Check that a replica exists and its content matches the hash.
+
+        Returns:
+            str: OK, CORRUPT if its content was read and does not match, or
+            UNREADABLE if it is missing or could not be read
+        """
+        try:
+            if not self.store.backends[location].exists(self.store.key(blob_hash)):
+                return UNREADABLE
+        except OSError:
+            self.store.health[location].observe_error()
+            return UNREADABLE
+
+        hasher = hashlib.sha256()
+        size = 0
+        read_seconds = 0.0
+        try:
+            with self.store.open_replica(blob_hash, location) as f:
+                while True:
+                    start = time.monotonic()
+                    chunk = f.read(READ_SIZE)
+                    read_seconds += time.monotonic() - start
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    self.throttle.consume(len(chunk))
+        except FileNotFoundError:
+            return UNREADABLE
+        except OSError:
+            self.store.health[location].observe_error()
+            return UNREADABLE
+        except Exception:
+            # A corrupt frame or frame index fails to decompress
+            return CORRUPT
+
+        self.store.health[location].observe_read(size, read_seconds)
+        return OK if hasher.hexdigest() == blob_hash else CORRUPT
+
+    def repair_blob(self, blob_hash: str, locations: Optional[str]) -> Tuple[List[str], int]:
+        """
+        Verify the replicas of one blob and restore the missing ones.
+
+        Only replicas whose content was read and found corrupt are removed.
+        Those that could not be read are kept, since their root may only be
+        failing for a while, but new copies are written as if they were lost.
+
+        Returns:
+            Tuple[List[str], int]: Storage roots holding a good replica
+            afterwards, followed by those that could not be read (empty if the
+            content is lost), and the number of replicas written
+        """
+        recorded = [location for location in (locations or "").split(",") if location in self.store.roots]
+        states = {location: self.verify_replica(blob_hash, location) for location in recorded}
+        good = [location for location in recorded if states[location] == OK]
+        unreadable = [location for location in recorded if states[location] == UNREADABLE]
+        if not good:
+            # A copy may still be on a root the row does not list
+            good = [
+                location for location in self.store.find(blob_hash)
+                if location not in recorded and self.verify_replica(blob_hash, location) == OK
+            ]
+            if not good:
+                return unreadable, 0
+
+        written = 0
+        for location in self.store.placement(blob_hash) + list(self.store.roots):
+            if len(good) >= self.store.replicas:
+                break
+            if location in good:
+                continue
+            try:
+                self.store.copy_replica(blob_hash, good[0], location, self.throttle)
+            except OSError:
+                self.store.health[location].observe_error()
+                continue
+            good.append(location)
+            written += 1
+
+        # Corrupt replicas that were not overwritten would only waste space
+        for location in recorded:
+            if states[location] == CORRUPT and location not in good:
+                self.store.remove_replica(blob_hash, location)
+        return good + [location for location in unreadable if location not in good], written
+
+    def verify_shard(self, blob_hash: str, location: str) -> str:
+        """
+        Check that a shard exists and its content matches the hash in its manifest.
+
+        Returns:
+            str: OK, CORRUPT or UNREADABLE, as for verify_replica
+        """
+        try:
+            manifest = self.store.read_manifest(blob_hash, location)
+        except OSError:
+            self.store.health[location].observe_error()
+            return UNREADABLE
+        if manifest is None:
+            return UNREADABLE
+
+        hasher = hashlib.sha256()
+        size = 0
+        read_seconds = 0.0
+        try:
+            with self.store.backends[location].open(shard_path(self.store.key(blob_hash))) as f:
+                while True:
+                    start = time.monotonic()
+                    chunk = f.read(READ_SIZE)
+                    read_seconds += time.monotonic() - start
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    self.throttle.consume(len(chunk))
+        except FileNotFoundError:
+            return UNREADABLE
+        except OSError:
+            self.store.health[location].observe_error()
+            return UNREADABLE
+
+        self.store.health[location].observe_read(size, read_seconds)
+        return OK if hasher.hexdigest() == manifest["hashes"][manifest["shard"]] else CORRUPT
+
+    def repair_shards(self, blob_hash: str) -> Tuple[List[str], int]:
+        """
+        Verify the shards of an erasure coded blob and rebuild the missing ones.
+
+        Lost shards are recomputed from k good ones onto roots that hold no
+        other shard of the blob, preferring the roots the hash ring assigns it.
+        Shards that could not be read are rebuilt elsewhere too, but only
+        corrupt ones are removed.
+
+        Returns:
+            Tuple[List[str], int]: Storage roots holding a good shard
+            afterwards in shard order (empty if fewer than k are left) and the
+            number of shards written
+        """
+        shards = self.store.shard_locations(blob_hash)
+        states = {shard: self.verify_shard(blob_hash, location) for shard, location in shards.items()}
+        good = {shard: location for shard, location in shards.items() if states[shard] == OK}
+        if not good:
+            return [], 0
+        manifest = self.store.read_manifest(blob_hash, next(iter(good.values())))
+        k, m = manifest["k"], manifest["m"]
+        if len(good) < k:
+            return [], 0
+
+        # Corrupt shards would be read again by the next repair run
+        for shard, location in shards.items():
+            if states[shard] == CORRUPT:
+                self.store.remove_replica(blob_hash, location)
+
+        unreadable = [location for shard, location in shards.items() if states[shard] == UNREADABLE]
+        free = [
+            location for location in self.store.ring.preference_list(blob_hash, len(self.store.roots))
+            if location not in good.values() and location not in unreadable
+        ]
+        targets = dict(zip([shard for shard in range(k + m) if shard not in good], free))
+        written = 0
+        if targets:
+            try:
+                self.store.rebuild_shards(blob_hash, good, targets, self.throttle)
+                good.update(targets)
+                written = len(targets)
+            except OSError:
+                logger.exception("Rebuilding shards of blob %s failed", blob_hash)
+
+        return [good[shard] for shard in sorted(good)], written
+
+    async def run_once(self) -> dict:
+        """Check every blob once, in batches ordered by hash."""
+        with self._lock:
+            already_running = self.running
+            self.running = True
+        if already_running:
+            return self.snapshot()
+
+        checked = repaired = lost = 0
+        try:
+            database = Database()
+            after = ""
+            while True:
+                async with database.async_session_factory() as db:
+                    result = await db.execute(
+                        select(Blob.hash, Blob.locations, Blob.erasure)
+                        .where(Blob.hash > after)
+                        .order_by(Blob.hash)
+                        .limit(self.batch_size)
+                    )
+                    rows = result.all()
+                if not rows:
+                    break
+
+                changed = []
+                missing = []
+                for blob_hash, locations, erasure in rows:
+                    if erasure:
+                        good, written = await run_in_threadpool(self.repair_shards, blob_hash)
+                    else:
+                        good, written = await run_in_threadpool(self.repair_blob, blob_hash, locations)
+                    checked += 1
+                    repaired += written
+                    if not good:
+                        missing.append(blob_hash)
+                    elif ",".join(good) != locations:
+                        changed.append((blob_hash, locations, ",".join(good)))
+
+                async with database.async_session_factory() as db:
+                    for blob_hash, old, new in changed:
+                        # Only if nothing else (an upload adding replicas, another repair)
+                        # changed the locations while the replicas were checked
+                        result = await db.execute(
+                            update(Blob).where(Blob.hash == blob_hash, Blob.locations == old).values(locations=new)
+                        )
+                        if result.rowcount == 0:
+                            logger.info("Locations of blob %s changed during its check; left for the next run", blob_hash)
+                    await db.commit()
+                    if missing:
+                        # Blobs deleted while they were being checked are not lost
+                        result = await db.execute(select(Blob.hash).where(Blob.hash.in_(missing)))
+                        for blob_hash in result.scalars().all():
+                            lost += 1
+                            logger.error("Not enough good replicas or shards of blob %s are left", blob_hash)
+                after = rows[-1][0]
+        finally:
+            with self._lock:
+                self.running = False
+                self.runs += 1
+                self.last_finished = datetime.now(timezone.utc)
+                self.checked, self.repaired, self.lost = checked, repaired, lost
+        return self.snapshot()
+
+    async def run_forever(self):
+        """Run a repair pass every `interval` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Storage repair run failed")
+
+    def snapshot(self) -> dict:
+        """State of the repairer and results of the last run as a dictionary."""
+        with self._lock:
+            return {
+                "running": self.running,
+                "runs": self.runs,
+                "last_finished": self.last_finished,
+                "checked": self.checked,
+                "repaired": self.repaired,
+                "lost": self.lost,
+            }
+
+repairer = Repairer()
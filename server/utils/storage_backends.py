@@ -0,0 +1,539 @@
+import errno
+import hashlib
+import hmac
+import io
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+from threading import Lock
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+import httpx
+
+from ..config import settings
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+class ObjectWriter:
+    """
+    Object being written to a storage backend.
+
+    Nothing is visible under the key until `commit`; `abort` discards what
+    was written. Used as a context manager, it commits on success and aborts
+    on errors.
+    """
+
+    def write(self, data: bytes) -> int:
+        raise NotImplementedError
+
+    def commit(self):
+        raise NotImplementedError
+
+    def abort(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+class StorageBackend:
+    """
+    Flat key-value store holding the objects of one storage root.
+
+    Keys are relative paths such as "ab/cd/abcd...". Missing objects raise
+    FileNotFoundError on reads and other failures raise OSError, so callers
+    handle every backend the same way as local files.
+    """
+
+    def writer(self, key: str) -> ObjectWriter:
+        """Start writing an object, replacing any object with the same key once committed."""
+        raise NotImplementedError
+
+    def put(self, key: str, source: BinaryIO, throttle=None):
+        """Store the rest of a stream, pacing the copy with `throttle.consume(bytes)` if given."""
+        with self.writer(key) as writer:
+            for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b""):
+                if throttle is not None:
+                    throttle.consume(len(chunk))
+                writer.write(chunk)
+
+    def put_bytes(self, key: str, data: bytes):
+        """Store a small object."""
+        self.put(key, io.BytesIO(data))
+
+    def put_file(self, key: str, path: str):
+        """Store a local file, which is removed afterwards."""
+        with open(path, "rb") as f:
+            self.put(key, f)
+        os.remove(path)
+
+    def open(self, key: str) -> BinaryIO:
+        """Open an object as a seekable stream."""
+        raise NotImplementedError
+
+    def read_range(self, key: str, start: int, size: int) -> bytes:
+        """Read up to `size` bytes of an object from `start`."""
+        with self.open(key) as f:
+            f.seek(start)
+            return f.read(size)
+
+    def read_bytes(self, key: str) -> Optional[bytes]:
+        """Content of a small object, or None if it does not exist."""
+        try:
+            with self.open(key) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def stat(self, key: str) -> Optional[int]:
+        """Size of an object, or None if it does not exist."""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        """Check whether an object exists."""
+        return self.stat(key) is not None
+
+    def delete(self, key: str):
+        """Delete an object if it exists."""
+        raise NotImplementedError
+
+    def list_objects(self) -> Iterator[Tuple[str, int, float]]:
+        """Key, size and modification time (a Unix timestamp) of every object."""
+        raise NotImplementedError
+
+class _LocalWriter(ObjectWriter):
+    """Temporary file renamed into place on commit."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.partial = f"{path}.{uuid.uuid4().hex}.tmp"
+        self._file = open(self.partial, "wb")
+
+    def write(self, data: bytes) -> int:
+        return self._file.write(data)
+
+    def commit(self):
+        self._file.close()
+        os.replace(self.partial, self.path)
+
+    def abort(self):
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        if os.path.exists(self.partial):
+            os.remove(self.partial)
+
+class LocalBackend(StorageBackend):
+    """Objects stored as files under a directory."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def __repr__(self) -> str:
+        return self.root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def writer(self, key: str) -> ObjectWriter:
+        return _LocalWriter(self._path(key))
+
+    def put_file(self, key: str, path: str):
+        # A rename when the file is on the same volume, otherwise a copy
+        destination = self._path(key)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.replace(path, destination)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            partial = f"{destination}.{uuid.uuid4().hex}.tmp"
+            shutil.copyfile(path, partial)
+            os.replace(partial, destination)
+            os.remove(path)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def stat(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list_objects(self) -> Iterator[Tuple[str, int, float]]:
+        for directory, _, names in os.walk(self.root):
+            prefix = os.path.relpath(directory, self.root).replace(os.sep, "/")
+            for name in names:
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except FileNotFoundError:
+                    continue
+                yield (name if prefix == "." else f"{prefix}/{name}"), stat.st_size, stat.st_mtime
+
+class _MemoryWriter(ObjectWriter):
+    def __init__(self, backend: "MemoryBackend", key: str):
+        self.backend = backend
+        self.key = key
+        self._buffer = io.BytesIO()
+
+    def write(self, data: bytes) -> int:
+        return self._buffer.write(data)
+
+    def commit(self):
+        with self.backend._lock:
+            self.backend._objects[self.key] = self._buffer.getvalue()
+            self.backend._modified[self.key] = time.time()
+
+    def abort(self):
+        self._buffer = io.BytesIO()
+
+class MemoryBackend(StorageBackend):
+    """Objects kept in memory, for tests and benchmarks without disk I/O."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._objects: Dict[str, bytes] = {}
+        self._modified: Dict[str, float] = {}
+
+    def __repr__(self) -> str:
+        return "memory://"
+
+    def writer(self, key: str) -> ObjectWriter:
+        return _MemoryWriter(self, key)
+
+    def open(self, key: str) -> BinaryIO:
+        with self._lock:
+            data = self._objects.get(key)
+        if data is None:
+            raise FileNotFoundError(key)
+        return io.BytesIO(data)
+
+    def stat(self, key: str) -> Optional[int]:
+        with self._lock:
+            data = self._objects.get(key)
+        return None if data is None else len(data)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._objects.pop(key, None)
+            self._modified.pop(key, None)
+
+    def list_objects(self) -> Iterator[Tuple[str, int, float]]:
+        with self._lock:
+            objects = [(key, len(data), self._modified[key]) for key, data in self._objects.items()]
+        return iter(objects)
+
+class _S3Writer(ObjectWriter):
+    """
+    Buffered in memory and uploaded with one PUT on commit, or as a multipart
+    upload once it outgrows the part size, one part at a time as it is written.
+    """
+
+    def __init__(self, backend: "S3Backend", key: str):
+        self.backend = backend
+        self.key = key
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[str] = []
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.backend.part_size:
+            self._upload_part(self.backend.part_size)
+        return len(data)
+
+    def _upload_part(self, size: int):
+        if self._upload_id is None:
+            self._upload_id = self.backend._create_multipart_upload(self.key)
+        number = len(self._parts) + 1
+        etag = self.backend._upload_part(self.key, self._upload_id, number, bytes(self._buffer[:size]))
+        self._parts.append(etag)
+        del self._buffer[:size]
+
+    def commit(self):
+        try:
+            if self._upload_id is None:
+                self.backend._request(
+                    "PUT", self.key, headers={"content-length": str(len(self._buffer))}, content=bytes(self._buffer)
+                )
+            else:
+                if self._buffer:
+                    # The last part may be smaller than the others
+                    self._upload_part(len(self._buffer))
+                self.backend._complete_multipart_upload(self.key, self._upload_id, self._parts)
+                self._upload_id = None
+        except BaseException:
+            self.abort()
+            raise
+        self._buffer = bytearray()
+
+    def abort(self):
+        self._buffer = bytearray()
+        if self._upload_id is not None:
+            upload_id, self._upload_id = self._upload_id, None
+            try:
+                self.backend._request("DELETE", self.key, params={"uploadId": upload_id})
+            except OSError:
+                # Parts left behind are removed by the bucket's lifecycle rules, if any
+                pass
+
+class _S3Reader(io.RawIOBase):
+    """Seekable reader of an S3 object, with one ranged GET per read."""
+
+    def __init__(self, backend: "S3Backend", key: str, size: int):
+        self.backend = backend
+        self.key = key
+        self.size = size
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, position: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            position += self.position
+        elif whence == io.SEEK_END:
+            position += self.size
+        self.position = max(0, position)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self.size - self.position)
+        if size <= 0:
+            return 0
+        data = self.backend.read_range(self.key, self.position, size)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def readall(self) -> bytes:
+        # The default reads DEFAULT_BUFFER_SIZE bytes, one request, at a time
+        data = self.backend.read_range(self.key, self.position, self.size - self.position)
+        self.position += len(data)
+        return data
+
+class S3Backend(StorageBackend):
+    """
+    Objects stored in a bucket of an S3-compatible service (AWS S3, MinIO,
+    Ceph RGW, ...), addressed path-style under an optional key prefix.
+
+    Requests are signed with AWS Signature Version 4 when an access key is
+    configured; payloads are sent unsigned so uploads can be streamed.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint: str = settings.STORAGE_S3_ENDPOINT,
+        access_key: str = settings.STORAGE_S3_ACCESS_KEY,
+        secret_key: str = settings.STORAGE_S3_SECRET_KEY,
+        region: str = settings.STORAGE_S3_REGION,
+        part_size: int = settings.STORAGE_S3_PART_SIZE_MB * 1024 * 1024
+    ):
+        if not endpoint:
+            raise ValueError("S3 storage roots need STORAGE_S3_ENDPOINT")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.endpoint = endpoint.rstrip("/")
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.part_size = part_size
+        self._client = httpx.Client(timeout=httpx.Timeout(60.0, connect=10.0))
+
+    def __repr__(self) -> str:
+        return f"s3://{self.bucket}/{self.prefix}"
+
+    def _sign(self, method: str, url: httpx.URL, headers: Dict[str, str]) -> Dict[str, str]:
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        scope = f"{now:%Y%m%d}/{self.region}/s3/aws4_request"
+        headers = {
+            **headers,
+            "host": url.netloc.decode(),
+            "x-amz-date": amz_date,
+            "x-amz-content-sha256": "UNSIGNED-PAYLOAD",
+        }
+        signed_headers = ";".join(sorted(headers))
+        canonical_request = "\n".join([
+            method,
+            url.raw_path.decode().partition("?")[0],
+            "&".join(
+                f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}"
+                for name, value in sorted(url.params.multi_items())
+            ),
+            "".join(f"{name}:{headers[name].strip()}\n" for name in sorted(headers)),
+            signed_headers,
+            "UNSIGNED-PAYLOAD",
+        ])
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+
+        key = f"AWS4{self.secret_key}".encode()
+        for part in scope.split("/"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={signed_headers}, Signature={signature}"
+        )
+        return headers
+
+    def _request(
+        self,
+        method: str,
+        key: Optional[str],
+        headers: Optional[Dict[str, str]] = None,
+        content=None,
+        params: Optional[Dict[str, str]] = None
+    ) -> httpx.Response:
+        """
+        Send a request for one object, or for the bucket if `key` is None.
+
+        Raises:
+            FileNotFoundError: If the object does not exist
+            OSError: If the request fails
+        """
+        url = httpx.URL(f"{self.endpoint}/{quote(self.bucket)}")
+        if key is not None:
+            url = httpx.URL(f"{url}/{quote(self.prefix + key, safe='/-_.~')}")
+        if params:
+            url = url.copy_merge_params(params)
+        headers = headers or {}
+        if self.access_key:
+            headers = self._sign(method, url, headers)
+        try:
+            response = self._client.request(method, url, headers=headers, content=content)
+        except httpx.HTTPError as e:
+            raise OSError(f"S3 {method} of {key} failed: {e}") from e
+        if response.status_code == 404:
+            raise FileNotFoundError(key)
+        if response.status_code >= 300:
+            raise OSError(f"S3 {method} of {key} failed with status {response.status_code}")
+        return response
+
+    def _xml(self, response: httpx.Response) -> Tuple[ElementTree.Element, str]:
+        """Parsed XML body of a response and its namespace prefix for element names."""
+        root = ElementTree.fromstring(response.content)
+        return root, root.tag[:root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+
+    def _create_multipart_upload(self, key: str) -> str:
+        root, namespace = self._xml(self._request("POST", key, params={"uploads": ""}))
+        return root.findtext(f"{namespace}UploadId")
+
+    def _upload_part(self, key: str, upload_id: str, number: int, data: bytes) -> str:
+        response = self._request(
+            "PUT", key,
+            headers={"content-length": str(len(data))},
+            content=data,
+            params={"partNumber": str(number), "uploadId": upload_id}
+        )
+        return response.headers["etag"]
+
+    def _complete_multipart_upload(self, key: str, upload_id: str, etags: List[str]):
+        body = "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{escape(etag)}</ETag></Part>"
+            for number, etag in enumerate(etags, 1)
+        )
+        response = self._request(
+            "POST", key,
+            content=f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode(),
+            params={"uploadId": upload_id}
+        )
+        # Failures can also come as an error document with status 200
+        root, namespace = self._xml(response)
+        if root.tag == f"{namespace}Error":
+            raise OSError(f"S3 multipart upload of {key} failed: {root.findtext(f'{namespace}Code')}")
+
+    def writer(self, key: str) -> ObjectWriter:
+        return _S3Writer(self, key)
+
+    def open(self, key: str) -> BinaryIO:
+        size = self.stat(key)
+        if size is None:
+            raise FileNotFoundError(key)
+        return io.BufferedReader(_S3Reader(self, key, size), buffer_size=COPY_CHUNK_SIZE)
+
+    def read_range(self, key: str, start: int, size: int) -> bytes:
+        if size <= 0:
+            return b""
+        return self._request("GET", key, headers={"range": f"bytes={start}-{start + size - 1}"}).content
+
+    def read_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            return self._request("GET", key).content
+        except FileNotFoundError:
+            return None
+
+    def stat(self, key: str) -> Optional[int]:
+        try:
+            return int(self._request("HEAD", key).headers["content-length"])
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str):
+        try:
+            self._request("DELETE", key)
+        except FileNotFoundError:
+            pass
+
+    def list_objects(self) -> Iterator[Tuple[str, int, float]]:
+        # ListObjectsV2, a page of up to 1000 keys at a time
+        params = {"list-type": "2", "prefix": self.prefix}
+        while True:
+            root, namespace = self._xml(self._request("GET", None, params=params))
+            for item in root.iter(f"{namespace}Contents"):
+                key = item.findtext(f"{namespace}Key")[len(self.prefix):]
+                modified = datetime.fromisoformat(item.findtext(f"{namespace}LastModified").replace("Z", "+00:00"))
+                yield key, int(item.findtext(f"{namespace}Size")), modified.timestamp()
+            token = root.findtext(f"{namespace}NextContinuationToken")
+            if root.findtext(f"{namespace}IsTruncated") != "true" or not token:
+                return
+            params = {**params, "continuation-token": token}
+
+def get_backend(url: str) -> StorageBackend:
+    """
+    Storage backend for a storage root: a directory path, "memory://" or
+    "s3://bucket/prefix" (see the STORAGE_S3_* settings). Every
+    "memory://" root is a separate store.
+
+    Raises:
+        ValueError: If the URL scheme is not supported
+    """
+    if url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith("s3://"):
+        parts = urlsplit(url)
+        return S3Backend(parts.netloc, parts.path)
+    if url.startswith("file://"):
+        return LocalBackend(url[len("file://"):])
+    if "://" in url:
+        raise ValueError(f"Unsupported storage root '{url}'")
+    return LocalBackend(url)